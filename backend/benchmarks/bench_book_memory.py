@@ -0,0 +1,110 @@
+"""
+In-memory book footprint benchmark
+Compares the memory held per book by the previous representation (the parsed
+dicts, with full_text and a nested-list search index) against CompactBook
+(compressed chapter blobs, derived full_text, array-backed index), and times
+the reads that pay for the compression
+
+Usage: python backend/benchmarks/bench_book_memory.py [--sizes small,medium,large] [--repeat N]
+"""
+
+import argparse
+import gc
+import heapq
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("ECHO_DATA_DIR", tempfile.mkdtemp(prefix="echo-bench-"))
+os.environ.setdefault("BOOK_STORE_BACKEND", "memory")
+os.environ.setdefault("AI_CACHE_BACKEND", "none")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from epub_fixtures import FIXTURE_SIZES, build_epub
+from epub_parser import CompactBook, parse_epub_file, search_terms
+from unified_backend import BM25_B, BM25_K1, search_book, serialize_book
+
+QUERY = "captain storm promise island"
+
+def allocated_bytes(build):
+    """Bytes still allocated by the object build() returns"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    gc.collect()  # The EPUB reader leaves reference cycles behind
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, after - before
+
+def per_call_ms(repeat, fn, *args):
+    """Wall milliseconds per call, best of three runs"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / repeat * 1000
+
+def legacy_search_book(book_data, query, top_k):
+    """search_book as it was over the nested-list index"""
+    index = book_data['search_index']
+    lengths = index['lengths']
+    scores = {}
+    for term in set(search_terms(query)):
+        postings = index['postings'].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (len(lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+        for passage_id, count in postings:
+            length_norm = 1 - BM25_B + BM25_B * lengths[passage_id] / index['avg_length']
+            score = idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+            scores[passage_id] = scores.get(passage_id, 0.0) + score
+    results = []
+    for passage_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+        chapter_index, start, end = index['passages'][passage_id]
+        results.append(book_data['chapters'][chapter_index]['text'][start:end].strip())
+    return results
+
+def read_chapter(book_data, index):
+    return book_data['chapters'][index]['content']
+
+def read_full_text(book_data):
+    return book_data['full_text']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(FIXTURE_SIZES), help="Comma-separated fixture sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls per timing run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes.split(","):
+            chapters, paragraphs = FIXTURE_SIZES[size]
+            path = build_epub(os.path.join(tmp, f"{size}.epub"), chapters, paragraphs)
+            serialized = serialize_book(parse_epub_file(path))
+
+            # Measure each form on its own, rebuilt from the same parse
+            plain, plain_bytes = allocated_bytes(lambda: parse_epub_file(path))
+            compact, compact_bytes = allocated_bytes(lambda: CompactBook(parse_epub_file(path)))
+            middle = len(plain['chapters']) // 2
+
+            print(f"{size} ({chapters} chapters x {paragraphs} paragraphs, {len(serialized) / 1e6:.1f} MB JSON)")
+            print(f"  held in memory     dict {plain_bytes / 1e6:7.2f} MB   compact {compact_bytes / 1e6:7.2f} MB"
+                  f"   ({plain_bytes / compact_bytes:.1f}x smaller, charged {compact.nbytes() / 1e6:.2f} MB)")
+            reads = (
+                ("chapter content", read_chapter, read_chapter, (middle,)),
+                ("full_text", read_full_text, read_full_text, ()),
+                ("search", legacy_search_book, search_book, (QUERY, 5)),
+            )
+            for label, legacy_fn, fn, extra in reads:
+                before = per_call_ms(args.repeat, legacy_fn, plain, *extra)
+                after = per_call_ms(args.repeat, fn, compact, *extra)
+                print(f"  {label:<18} dict {before:7.3f} ms   compact {after:7.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Load benchmark for the upload, chapter summary and chat endpoints
+Starts the fake DeepSeek server and the backend as local processes, drives
+each endpoint with concurrent requests and reports throughput and p50/p90/p99
+latency. Results can be saved and compared against a baseline to catch
+regressions.
+
+Usage: python backend/benchmarks/bench_load.py [--scenarios upload,chapters,chat] [--requests N] [--concurrency N]
+                                               [--upload-size small|medium|large] [--latency S] [--tokens-per-second N]
+                                               [--error-rate R] [--save FILE] [--compare FILE] [--tolerance R]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from epub_fixtures import FIXTURE_SIZES, build_epub
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+SCENARIOS = ("upload", "chapters", "chat")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_process(args, url, env, log_path, cwd, timeout=60.0):
+    """Start a server process and wait until url answers"""
+    log = open(log_path, "w")
+    process = subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{args[1]} exited with status {process.returncode}, see {log_path}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s, see {log_path}")
+
+def start_servers(args, work_dir):
+    """Start the fake DeepSeek server and a backend pointed at it; return (backend url, processes)"""
+    fake_port, backend_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake = start_process(
+        [sys.executable, os.path.join(BENCHMARK_DIR, "fake_deepseek.py"), "--port", str(fake_port),
+         "--latency", str(args.latency), "--tokens-per-second", str(args.tokens_per_second),
+         "--error-rate", str(args.error_rate), "--reply-tokens", str(args.reply_tokens)],
+        f"{fake_url}/stats", dict(os.environ), os.path.join(work_dir, "fake_deepseek.log"), BENCHMARK_DIR
+    )
+
+    env = dict(os.environ)
+    env.update({
+        "DEEPSEEK_API_KEY": "benchmark",
+        "DEEPSEEK_BASE_URL": fake_url,
+        "ECHO_DATA_DIR": os.path.join(work_dir, "data"),
+        "AI_CACHE_BACKEND": "none",  # Every request should reach the (fake) model
+        "DEEPSEEK_REQUESTS_PER_MINUTE": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    try:
+        backend = start_process(
+            [sys.executable, "-m", "uvicorn", "unified_backend:app", "--port", str(backend_port), "--log-level", "warning"],
+            f"{backend_url}/", env, os.path.join(work_dir, "backend.log"), BACKEND_DIR
+        )
+    except Exception:
+        fake.terminate()
+        raise
+    return backend_url, [backend, fake]
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def run_load(name, make_request, requests, concurrency):
+    """Issue requests through make_request(client, i) with bounded concurrency and summarize the latencies"""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker(client):
+        nonlocal errors, next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                ok = await make_request(client, i)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    async with httpx.AsyncClient(timeout=600.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+def succeeded(response) -> bool:
+    """AI endpoints report failures as 200 with success=false"""
+    return response.status_code == 200 and response.json().get("success", True)
+
+async def prepare_book(base_url, work_dir):
+    """Upload the medium fixture once and return its id, title and chapter texts for the AI scenarios"""
+    chapters, paragraphs = FIXTURE_SIZES["medium"]
+    path = build_epub(os.path.join(work_dir, "ai-book.epub"), chapters, paragraphs, title="Load Test Book", seed=10_000)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        with open(path, "rb") as f:
+            response = await client.post("/upload-epub?lazy=true", files={"file": ("book.epub", f.read())})
+        response.raise_for_status()
+        book_id = response.json()["id"]
+        text = (await client.get(f"/book/{book_id}/text")).json()
+    return book_id, text["chapters"]
+
+async def run_scenarios(args, base_url, work_dir):
+    results = []
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    if "upload" in scenarios:
+        # Distinct books, since identical uploads are served from the store without parsing
+        chapters, paragraphs = FIXTURE_SIZES[args.upload_size]
+        print(f"Building {args.requests} {args.upload_size} EPUB fixtures...")
+        uploads = []
+        for i in range(args.requests):
+            path = build_epub(os.path.join(work_dir, f"upload-{i}.epub"), chapters, paragraphs,
+                              title=f"Upload {i}", seed=i)
+            with open(path, "rb") as f:
+                uploads.append(f.read())
+
+        async def upload(client, i):
+            response = await client.post(f"{base_url}/upload-epub?lazy=true", files={"file": (f"book-{i}.epub", uploads[i])})
+            return response.status_code == 200
+
+        results.append(await run_load(f"upload ({args.upload_size})", upload, args.requests, args.concurrency))
+
+    if "chapters" in scenarios or "chat" in scenarios:
+        book_id, chapters = await prepare_book(base_url, work_dir)
+
+    if "chapters" in scenarios:
+        selected = chapters[:args.chapters_per_request]
+
+        async def chapter_summaries(client, i):
+            # A distinct title per request keeps identical prompts from being coalesced
+            body = {"book_title": f"Load Test Book {i}", "chapters": selected, "language": "en"}
+            return succeeded(await client.post(f"{base_url}/api/chapter-summaries", json=body))
+
+        results.append(await run_load(
+            f"chapter-summaries (x{len(selected)})", chapter_summaries, args.requests, args.concurrency
+        ))
+
+    if "chat" in scenarios:
+        async def chat(client, i):
+            body = {
+                "messages": [{"role": "user", "content": f"What does the captain promise before the storm? ({i})"}],
+                "book_context": {"title": "Load Test Book", "book_id": book_id},
+                "language": "en",
+            }
+            return succeeded(await client.post(f"{base_url}/api/chat", json=body))
+
+        results.append(await run_load("chat", chat, args.requests, args.concurrency))
+
+    return results
+
+def print_results(results):
+    print(f"{'scenario':<26} {'reqs':>5} {'conc':>5} {'errors':>6} {'req/s':>8} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'max s':>8}")
+    for r in results:
+        print(f"{r['scenario']:<26} {r['requests']:>5} {r['concurrency']:>5} {r['errors']:>6} {r['throughput']:>8.2f} "
+              f"{r['p50']:>8.3f} {r['p90']:>8.3f} {r['p99']:>8.3f} {r['max']:>8.3f}")
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of metrics that regressed beyond tolerance"""
+    previous = {r["scenario"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        base = previous.get(r["scenario"])
+        if base is None:
+            continue
+        if r["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: throughput {base['throughput']:.2f} -> {r['throughput']:.2f} req/s")
+        for key in ("p50", "p99"):
+            if r[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{r['scenario']}: {key} {base[key]:.3f} -> {r[key]:.3f} s")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{r['scenario']}: errors {base['errors']} -> {r['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of upload,chapters,chat")
+    parser.add_argument("--requests", type=int, default=48, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight per scenario")
+    parser.add_argument("--upload-size", choices=sorted(FIXTURE_SIZES), default="medium")
+    parser.add_argument("--chapters-per-request", type=int, default=5, help="Chapters sent per chapter-summaries request")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="Fake model output rate")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="Fake model reply length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake model calls that fail with 429")
+    parser.add_argument("--backend-url", help="Benchmark an already running backend instead of starting one")
+    parser.add_argument("--save", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from --save; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before --compare fails")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="echo-load-")
+    processes = []
+    if args.backend_url:
+        base_url = args.backend_url.rstrip("/")
+    else:
+        base_url, processes = start_servers(args, work_dir)
+        print(f"Backend at {base_url}, logs in {work_dir}")
+
+    try:
+        results = asyncio.run(run_scenarios(args, base_url, work_dir))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print_results(results)
+    settings = {key: getattr(args, key) for key in ("latency", "tokens_per_second", "reply_tokens", "error_rate")}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
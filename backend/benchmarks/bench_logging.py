@@ -0,0 +1,110 @@
+"""
+Per-request logging overhead benchmark
+Compares the previous DeepSeek call logging (json.dumps of every prompt, full
+response repr at INFO) against the current level-gated, lazily formatted and
+sampled logging
+
+Usage: python backend/benchmarks/bench_logging.py [--prompt-chars N] [--reply-chars N] [--calls N] [--rate N]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("ECHO_DATA_DIR", tempfile.mkdtemp(prefix="echo-bench-"))
+os.environ.setdefault("BOOK_STORE_BACKEND", "memory")
+os.environ.setdefault("AI_CACHE_BACKEND", "none")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai.types.chat import ChatCompletion
+
+from unified_backend import Preview, completion_content, config, logger
+
+def make_messages(prompt_chars):
+    """A chapter-summary sized prompt: system message plus a long user message"""
+    paragraph = "The whale surfaced beside the ship and the crew fell silent. 鲸鱼浮出水面，船员们沉默了。\n"
+    text = (paragraph * (prompt_chars // len(paragraph) + 1))[:prompt_chars]
+    return [
+        {"role": "system", "content": "You are a literary analyst. Summarize the chapter faithfully."},
+        {"role": "user", "content": f"Book: Moby Dick\nChapter: Loomings\n\n{text}"},
+    ]
+
+def make_response(reply_chars):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-benchmark",
+        "object": "chat.completion",
+        "created": 1,
+        "model": "deepseek-chat",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ("A summary sentence. " * reply_chars)[:reply_chars]},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 4000, "completion_tokens": 600, "total_tokens": 4600},
+    })
+
+def legacy_logging(api_model, messages, response):
+    """The logging previously done around every non-streaming call"""
+    logger.info(f"Calling DeepSeek API with model={api_model}, max_tokens=1000, temperature=0.3")
+    logger.info(f"Messages being sent: {json.dumps(messages, ensure_ascii=False)[:500]}...")
+    logger.info(f"Response object: {response}")
+    content = response.choices[0].message.content
+    logger.info(f"DeepSeek API returned content of length: {len(content) if content else 0}")
+    logger.info(f"First 200 chars of content: {content[:200]}")
+    return content
+
+def current_logging(api_model, messages, response):
+    """The logging request_completion does now"""
+    logger.debug(
+        "DeepSeek request model=%s max_tokens=%d temperature=%s messages=%s",
+        api_model, 1000, 0.3, Preview(messages)
+    )
+    return completion_content(api_model, response, 1.0)
+
+def per_call_us(calls, fn, *args):
+    """CPU microseconds per call, best of three runs"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.process_time()
+        for _ in range(calls):
+            fn(*args)
+        best = min(best, time.process_time() - start)
+    return best / calls * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompt-chars", type=int, default=24000, help="Characters in the user prompt")
+    parser.add_argument("--reply-chars", type=int, default=2000, help="Characters in the model reply")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls per measurement")
+    parser.add_argument("--rate", type=int, default=200, help="Requests per second used to express the saving")
+    args = parser.parse_args()
+
+    # Records are formatted and written like in production, just not to the terminal
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logging.getLogger().handlers = [handler]
+
+    messages = make_messages(args.prompt_chars)
+    response = make_response(args.reply_chars)
+    print(f"Prompt: {args.prompt_chars} chars, reply: {args.reply_chars} chars, {args.calls} calls per run")
+
+    logger.setLevel(logging.INFO)
+    legacy = per_call_us(args.calls, legacy_logging, "deepseek-chat", messages, response)
+    print(f"  previous logging, INFO             {legacy:8.1f} us/call")
+
+    for level, sample_rate in ((logging.INFO, 1.0), (logging.INFO, 0.1), (logging.WARNING, 1.0), (logging.DEBUG, 1.0)):
+        logger.setLevel(level)
+        config.LOG_SAMPLE_RATE = sample_rate
+        current = per_call_us(args.calls, current_logging, "deepseek-chat", messages, response)
+        label = f"{logging.getLevelName(level)}, sample {sample_rate:g}"
+        saved_ms = (legacy - current) * args.rate / 1000
+        print(f"  current logging, {label:<18} {current:8.1f} us/call  "
+              f"({legacy / current:5.1f}x, {saved_ms:.1f} ms CPU/s saved at {args.rate} req/s)")
+
+if __name__ == "__main__":
+    main()
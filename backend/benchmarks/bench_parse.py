@@ -0,0 +1,95 @@
+"""
+EPUB parse throughput benchmark
+Compares the lxml extraction stage against the previous BeautifulSoup path
+
+Usage: python backend/benchmarks/bench_parse.py [--chapters N] [--paragraphs N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("ECHO_DATA_DIR", tempfile.mkdtemp(prefix="echo-bench-"))
+os.environ.setdefault("BOOK_STORE_BACKEND", "memory")
+os.environ.setdefault("AI_CACHE_BACKEND", "none")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ebooklib
+from ebooklib import epub
+from bs4 import BeautifulSoup
+
+import epub_parser
+from epub_fixtures import build_epub
+
+def legacy_extract(documents):
+    """The pre-lxml extraction stage: html.parser, separate passes, string +="""
+    full_text = ""
+    chapters = []
+    for content in documents:
+        soup = BeautifulSoup(content.decode('utf-8', errors='ignore'), 'html.parser')
+        text = soup.get_text(separator='\n', strip=True)
+        title = None
+        for heading in soup.find_all(['h1', 'h2', 'h3']):
+            heading_text = heading.get_text(strip=True)
+            if heading_text:
+                title = heading_text
+                break
+        for script in soup(["script", "style"]):
+            script.decompose()
+        chapters.append((title, str(soup), text[:10000]))
+        full_text += text + "\n\n"
+    return chapters, full_text
+
+def lxml_extract(documents):
+    """The current extraction stage as used by parse_epub_file"""
+    texts = []
+    chapters = []
+    for content in documents:
+        text, title, clean_html = epub_parser.extract_chapter(content)
+        chapters.append((title, clean_html, text[:10000]))
+        texts.append(text)
+    return chapters, "".join(f"{text}\n\n" for text in texts)
+
+def best_of(repeat, fn, *args):
+    """Return the fastest wall time of repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chapters", type=int, default=40)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_epub(os.path.join(tmp, "bench.epub"), args.chapters, args.paragraphs)
+        epub_mb = os.path.getsize(path) / (1024 * 1024)
+        book = epub.read_epub(path)
+        documents = [
+            book.get_item_with_id(item_id).get_content()
+            for item_id, _ in book.spine
+            if book.get_item_with_id(item_id).get_type() == ebooklib.ITEM_DOCUMENT
+        ]
+        end_to_end = best_of(args.repeat, epub_parser.parse_epub_file, path)
+
+    html_mb = sum(len(d) for d in documents) / (1024 * 1024)
+
+    legacy = best_of(args.repeat, legacy_extract, documents)
+    current = best_of(args.repeat, lxml_extract, documents)
+
+    print(f"documents: {len(documents)}, XHTML {html_mb:.2f} MB, EPUB {epub_mb:.2f} MB")
+    print(f"extraction, BeautifulSoup html.parser: {legacy * 1000:8.1f} ms  {html_mb / legacy:7.2f} MB/s")
+    print(f"extraction, lxml single pass:          {current * 1000:8.1f} ms  {html_mb / current:7.2f} MB/s")
+    print(f"speedup: {legacy / current:.1f}x")
+    print(f"parse_epub_file end to end:            {end_to_end * 1000:8.1f} ms  {epub_mb / end_to_end:7.2f} MB/s of EPUB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Response encoding benchmark
+Renders real EPUB outputs (the /upload-epub and /book/{book_id} payload and
+the lazy manifest) with FastAPI's default JSONResponse and with
+FastJSONResponse, then compresses them at several gzip levels and brotli
+qualities to show the size/CPU trade-off behind GZIP_LEVEL and BROTLI_QUALITY
+
+Usage: python backend/benchmarks/bench_response.py [--sizes small,medium,large] [--repeat N]
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("ECHO_DATA_DIR", tempfile.mkdtemp(prefix="echo-bench-"))
+os.environ.setdefault("BOOK_STORE_BACKEND", "memory")
+os.environ.setdefault("AI_CACHE_BACKEND", "none")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from epub_fixtures import FIXTURE_SIZES, build_epub
+from epub_parser import CompactBook, parse_epub_file
+from unified_backend import FastJSONResponse, build_book_manifest, public_book
+
+GZIP_LEVELS = (1, 4, 6, 9)
+BROTLI_QUALITIES = (1, 4, 6)
+
+def per_call_ms(repeat, fn, *args):
+    """Wall milliseconds per call, best of three runs"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / repeat * 1000
+
+def render(response_class, payload):
+    """What FastAPI does with a returned dict: jsonable_encoder, then the response class"""
+    return response_class(jsonable_encoder(payload)).body
+
+def report_payload(label, payload, repeat):
+    body = render(FastJSONResponse, payload)
+    before = per_call_ms(repeat, render, JSONResponse, payload)
+    after = per_call_ms(repeat, render, FastJSONResponse, payload)
+    print(f"  {label}: {len(body) / 1e6:.2f} MB JSON")
+    print(f"    render       JSONResponse {before:8.2f} ms   FastJSONResponse {after:8.2f} ms  ({before / after:.1f}x)")
+
+    compress_repeat = max(1, repeat // 4)
+    for level in GZIP_LEVELS:
+        size = len(gzip.compress(body, compresslevel=level))
+        ms = per_call_ms(compress_repeat, gzip.compress, body, level)
+        print(f"    gzip {level}       {size / 1e6:8.2f} MB ({len(body) / size:4.1f}x)  {ms:8.2f} ms")
+    for quality in BROTLI_QUALITIES:
+        size = len(brotli.compress(body, quality=quality))
+        ms = per_call_ms(compress_repeat, lambda: brotli.compress(body, quality=quality))
+        print(f"    brotli {quality}     {size / 1e6:8.2f} MB ({len(body) / size:4.1f}x)  {ms:8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(FIXTURE_SIZES), help="Comma-separated fixture sizes")
+    parser.add_argument("--repeat", type=int, default=8, help="Calls per timing run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes.split(","):
+            chapters, paragraphs = FIXTURE_SIZES[size]
+            path = build_epub(os.path.join(tmp, f"{size}.epub"), chapters, paragraphs)
+            book_data = CompactBook(parse_epub_file(path))
+            book_data['id'] = size
+
+            print(f"{size} ({chapters} chapters x {paragraphs} paragraphs)")
+            report_payload("book", public_book(book_data), args.repeat)
+            report_payload("manifest", build_book_manifest(book_data), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Synthetic EPUB fixtures for benchmarks
+Builds books of a chosen size with chapter markup similar to real EPUBs
+"""
+
+import argparse
+import random
+from ebooklib import epub
+
+WORDS = (
+    "the sea whale ship captain harbour voyage storm sailor island compass "
+    "morning lantern rope deck anchor silence letter river mountain city "
+    "memory window garden winter summer stranger promise shadow journey"
+).split()
+
+# Named fixture sizes as (chapters, paragraphs per chapter)
+FIXTURE_SIZES = {
+    "small": (8, 15),     # ~25 KB EPUB
+    "medium": (30, 40),   # ~170 KB EPUB
+    "large": (100, 60),   # ~800 KB EPUB
+}
+
+def make_paragraph(rng: random.Random, words: int) -> str:
+    """Build one paragraph with some inline markup"""
+    tokens = [rng.choice(WORDS) for _ in range(words)]
+    for i in range(0, len(tokens), 17):
+        tokens[i] = f"<em>{tokens[i]}</em>"
+    for i in range(7, len(tokens), 29):
+        tokens[i] = f'<a href="#note{i}">{tokens[i]}</a>'
+    return "<p>" + " ".join(tokens).capitalize() + ".</p>"
+
+def make_chapter_html(rng: random.Random, index: int, paragraphs: int) -> str:
+    """Build one chapter document with the head/script/style noise EPUBs carry"""
+    body = "\n".join(make_paragraph(rng, rng.randint(40, 120)) for _ in range(paragraphs))
+    return (
+        "<html><head><title>Chapter</title>"
+        "<style>p { text-indent: 1em; } em { font-style: italic; }</style></head>"
+        f"<body><section><h1>Chapter {index + 1}</h1>"
+        "<script>window.reader = window.reader || {};</script>"
+        f"<!-- chapter {index + 1} -->\n{body}</section></body></html>"
+    )
+
+def build_epub(path: str, chapters: int = 20, paragraphs: int = 40,
+               title: str = "Benchmark Book", seed: int = 0) -> str:
+    """Write a synthetic EPUB to path and return the path"""
+    rng = random.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier(f"benchmark-{seed}-{chapters}-{paragraphs}")
+    book.set_title(title)
+    book.set_language("en")
+    book.add_author("Benchmark Author")
+
+    items = []
+    for i in range(chapters):
+        item = epub.EpubHtml(title=f"Chapter {i + 1}", file_name=f"chapter_{i + 1}.xhtml", lang="en")
+        item.content = make_chapter_html(rng, i, paragraphs)
+        book.add_item(item)
+        items.append(item)
+
+    book.toc = items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ["nav"] + items
+    epub.write_epub(path, book)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic EPUB fixture")
+    parser.add_argument("path")
+    parser.add_argument("--size", choices=sorted(FIXTURE_SIZES), help="Named size, overrides --chapters/--paragraphs")
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=40)
+    parser.add_argument("--title", default="Benchmark Book")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.size:
+        args.chapters, args.paragraphs = FIXTURE_SIZES[args.size]
+    build_epub(args.path, args.chapters, args.paragraphs, args.title, args.seed)
+    print(args.path)
@@ -0,0 +1,132 @@
+"""
+Local stand-in for the DeepSeek chat completions API
+Speaks the OpenAI-compatible /chat/completions protocol (plain and streamed)
+with configurable latency, token rate and error rate, so the backend can be
+load tested without the live API
+
+Usage: python backend/benchmarks/fake_deepseek.py [--port 8199] [--latency 0.5] [--tokens-per-second 60] [--error-rate 0]
+Point the backend at it with DEEPSEEK_BASE_URL=http://127.0.0.1:8199
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_WORDS = (
+    "the chapter follows the captain as the voyage turns toward the island while "
+    "memory and promise shape every choice the crew makes before the storm"
+).split()
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def create_app(latency: float = 0.5, tokens_per_second: float = 60, error_rate: float = 0.0,
+               error_status: int = 429, reply_tokens: int = 200, seed: int = 0) -> FastAPI:
+    """Build the fake API
+
+    Args:
+        latency: Seconds before the first token (time to first byte)
+        tokens_per_second: Output rate; 0 returns the whole reply at once
+        error_rate: Share of requests answered with error_status instead
+        error_status: 429 (with Retry-After) or a 5xx status
+        reply_tokens: Reply length, capped by the request's max_tokens
+        seed: Seed for the error draw, so runs are repeatable
+    """
+    app = FastAPI(title="Fake DeepSeek")
+    rng = random.Random(seed)
+    stats = {"requests": 0, "errors": 0, "streams": 0, "completion_tokens": 0}
+
+    def reply_for(body: dict) -> list:
+        count = min(reply_tokens, body.get("max_tokens") or reply_tokens)
+        return [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(count)]
+
+    def usage_for(body: dict, words: list) -> dict:
+        prompt_tokens = sum(estimate_tokens(message.get("content") or "") for message in body.get("messages", []))
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words)}
+
+    def error_response():
+        stats["errors"] += 1
+        headers = {"Retry-After": "1"} if error_status == 429 else {}
+        return JSONResponse(
+            status_code=error_status,
+            content={"error": {"message": "Injected failure", "type": "fake_error", "code": error_status}},
+            headers=headers
+        )
+
+    async def stream_reply(body: dict, words: list, completion_id: str):
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"]}
+        await asyncio.sleep(latency)
+        # Sleep in slices of at least 20ms, so high token rates don't turn into a sleep per token
+        per_slice = max(1, int(tokens_per_second * 0.02)) if tokens_per_second > 0 else len(words)
+        for start in range(0, len(words), per_slice):
+            text = "".join(f" {word}" for word in words[start:start + per_slice])
+            chunk = {**base, "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if tokens_per_second > 0:
+                await asyncio.sleep(per_slice / tokens_per_second)
+        done = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        yield f"data: {json.dumps(done)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage_for(body, words)})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if error_rate > 0 and rng.random() < error_rate:
+            return error_response()
+
+        words = reply_for(body)
+        stats["completion_tokens"] += len(words)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if body.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(stream_reply(body, words, completion_id), media_type="text/event-stream")
+
+        await asyncio.sleep(latency + (len(words) / tokens_per_second if tokens_per_second > 0 else 0))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words).capitalize() + "."},
+                "finish_reason": "stop"
+            }],
+            "usage": usage_for(body, words)
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Output token rate, 0 for instant replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="Status code of injected failures")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="Tokens per reply, capped by max_tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.latency, args.tokens_per_second, args.error_rate, args.error_status, args.reply_tokens, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Test setup for the backend
+Points the server at throwaway storage before unified_backend is imported,
+so tests never touch the real data directory or need a DeepSeek key
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ.setdefault("ECHO_DATA_DIR", tempfile.mkdtemp(prefix="echo-test-"))
+os.environ.setdefault("BOOK_STORE_BACKEND", "memory")
+os.environ.setdefault("AI_CACHE_BACKEND", "none")
+os.environ.setdefault("PARSE_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
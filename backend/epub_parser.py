@@ -0,0 +1,515 @@
+"""
+EPUB parsing for the Echo Reader backend
+Turns an EPUB into the stored book: chapter text and HTML, table of contents,
+search index and artifacts, held as a CompactBook. EPUB parse workers import
+only this module, so it must not depend on unified_backend or open any of the
+server's stores and clients
+"""
+
+import json
+import logging
+import re
+import time
+import zlib
+from array import array
+from collections import Counter
+from collections.abc import Mapping, MutableMapping
+from itertools import chain
+from typing import Dict, List, Optional
+
+import ebooklib
+from ebooklib import epub
+import lxml.html
+from lxml import etree
+
+from settings import config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(config.LOG_LEVEL)
+
+# ===================================
+# Book Storage
+# ===================================
+
+def book_full_text(chapters) -> str:
+    """A book's full_text: its chapter texts joined, capped at BOOK_TEXT_MAX_CHARS"""
+    full_text = "".join(f"{chapter['text']}\n\n" for chapter in chapters)
+    if config.BOOK_TEXT_MAX_CHARS > 0:
+        full_text = full_text[:config.BOOK_TEXT_MAX_CHARS]
+    return full_text
+
+class StoredChapter(Mapping):
+    """One chapter held as zlib-compressed UTF-8 blobs
+
+    Reads like the chapter dict it was built from ('id', 'title', 'content',
+    'text'); content and text are decompressed on each access, so only the
+    chapters a request touches are ever expanded.
+    """
+
+    __slots__ = ('id', 'title', 'content_length', '_content', '_text')
+    KEYS = ('id', 'title', 'content', 'text')
+
+    def __init__(self, chapter: Mapping):
+        self.id = chapter['id']
+        self.title = chapter['title']
+        self.content_length = len(chapter['content'])
+        self._content = zlib.compress(chapter['content'].encode('utf-8'), config.BOOK_COMPRESSION_LEVEL)
+        self._text = zlib.compress(chapter.get('text', '').encode('utf-8'), config.BOOK_COMPRESSION_LEVEL)
+
+    def __getitem__(self, key: str):
+        if key == 'content':
+            return zlib.decompress(self._content).decode('utf-8')
+        if key == 'text':
+            return zlib.decompress(self._text).decode('utf-8')
+        if key == 'id':
+            return self.id
+        if key == 'title':
+            return self.title
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __contains__(self, key) -> bool:
+        return key in self.KEYS
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._content) + len(self._text) + len(self.id) + len(self.title)
+
+class CompactBook(MutableMapping):
+    """A parsed book in its in-memory form
+
+    Chapters are StoredChapter records, the search index is a SearchIndex of
+    flat arrays and full_text is derived from the chapter texts when read
+    instead of being kept as a second copy. Everything else (metadata, toc,
+    id, artifacts, ...) stays in a plain dict. Handlers keep using it like
+    the parsed book dict; to_dict() gives back the plain form.
+    """
+
+    __slots__ = ('fields', 'chapters', 'search_index')
+
+    def __init__(self, book_data: Mapping):
+        self.fields = {}
+        self.chapters = []
+        self.search_index = None
+        for key, value in book_data.items():
+            if key != 'full_text':
+                self[key] = value
+
+    def __getitem__(self, key: str):
+        if key == 'chapters':
+            return self.chapters
+        if key == 'full_text':
+            return book_full_text(self.chapters)
+        if key == 'search_index':
+            if self.search_index is None:
+                raise KeyError(key)
+            return self.search_index
+        return self.fields[key]
+
+    def __setitem__(self, key: str, value):
+        if key == 'chapters':
+            self.chapters = [chapter if isinstance(chapter, StoredChapter) else StoredChapter(chapter)
+                             for chapter in value]
+        elif key == 'search_index':
+            self.search_index = value if isinstance(value, SearchIndex) else SearchIndex(value)
+        elif key == 'full_text':
+            raise KeyError("full_text is derived from the chapters")
+        else:
+            self.fields[key] = value
+
+    def __delitem__(self, key: str):
+        if key == 'search_index' and self.search_index is not None:
+            self.search_index = None
+        else:
+            del self.fields[key]
+
+    def __iter__(self):
+        yield from self.fields
+        yield 'chapters'
+        yield 'full_text'
+        if self.search_index is not None:
+            yield 'search_index'
+
+    def __len__(self) -> int:
+        return len(self.fields) + 2 + (self.search_index is not None)
+
+    def __contains__(self, key) -> bool:
+        if key == 'search_index':
+            return self.search_index is not None
+        return key in ('chapters', 'full_text') or key in self.fields
+
+    def nbytes(self) -> int:
+        """Approximate bytes held: compressed chapters, index arrays and the JSON size of the other fields"""
+        size = sum(chapter.nbytes for chapter in self.chapters)
+        if self.search_index is not None:
+            size += self.search_index.nbytes
+        return size + len(json.dumps(self.fields, ensure_ascii=False).encode('utf-8'))
+
+    def to_dict(self, full_text: bool = True, search_index: bool = True) -> dict:
+        """The book as plain dicts and lists, as parse_epub_file returns it"""
+        book_data = dict(self.fields)
+        book_data['chapters'] = [dict(chapter) for chapter in self.chapters]
+        if full_text:
+            book_data['full_text'] = book_full_text(book_data['chapters'])
+        if search_index and self.search_index is not None:
+            book_data['search_index'] = self.search_index.to_dict()
+        return book_data
+
+# ===================================
+# Book Search Index
+# ===================================
+
+# Latin-script words and runs of CJK characters
+SEARCH_TOKEN = re.compile(r'[0-9a-z\u00c0-\u024f]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]+')
+SEARCH_STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have he her him his how i if in into is it its "
+    "me my of on or our she so than that the their them then there these they this to was we were what when "
+    "where which who whom why will with would you your".split()
+)
+
+def search_terms(text: str) -> List[str]:
+    """Index terms of text: lowercased words without stopwords or stray letters, CJK runs as character bigrams"""
+    terms = []
+    for token in SEARCH_TOKEN.findall(text.lower()):
+        if token[0] >= '\u3040':
+            # CJK has no word breaks; overlapping bigrams match well without a segmenter
+            terms.extend(token[i:i + 2] for i in range(max(1, len(token) - 1)))
+        elif token not in SEARCH_STOPWORDS and (len(token) > 1 or token.isdigit()):
+            terms.append(token)
+    return terms
+
+def split_passages(text: str, max_chars: int):
+    """Yield (start, end) offsets of passages of about max_chars, ending at a line break where possible"""
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + max_chars)
+        if end < len(text):
+            newline = text.rfind("\n", start + max_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        yield start, end
+        start = end
+
+def build_search_index(chapters: List[Dict]) -> dict:
+    """Build a BM25 inverted index over the chapters' text
+
+    Passages are stored as (chapter index, start, end) offsets into the
+    chapter text, so the index is plain JSON and is persisted with the book
+    without duplicating its text.
+    """
+    passages = []
+    lengths = []
+    postings = {}
+    for chapter_index, chapter in enumerate(chapters):
+        text = chapter.get('text', '')
+        for start, end in split_passages(text, config.SEARCH_PASSAGE_CHARS):
+            terms = search_terms(text[start:end])
+            if not terms:
+                continue
+            passage_id = len(passages)
+            passages.append([chapter_index, start, end])
+            lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                postings.setdefault(term, []).append([passage_id, count])
+    return {
+        'passages': passages,
+        'lengths': lengths,
+        'avg_length': sum(lengths) / len(lengths) if lengths else 0,
+        'postings': postings
+    }
+
+class SearchIndex:
+    """A search index held in flat unsigned int arrays
+
+    The JSON form built by build_search_index spends a list (and an int
+    object per number) on every passage and posting; here passages are
+    (chapter index, start, end) triples and each term's postings
+    (passage id, count) pairs in one array('I').
+    """
+
+    __slots__ = ('passages', 'lengths', 'avg_length', 'postings')
+
+    def __init__(self, index: dict):
+        self.passages = array('I', chain.from_iterable(index['passages']))
+        self.lengths = array('I', index['lengths'])
+        self.avg_length = index['avg_length']
+        self.postings = {term: array('I', chain.from_iterable(pairs)) for term, pairs in index['postings'].items()}
+
+    def passage(self, passage_id: int) -> tuple:
+        """(chapter index, start, end) of a passage"""
+        return tuple(self.passages[3 * passage_id:3 * passage_id + 3])
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.passages.itemsize * (len(self.passages) + len(self.lengths))
+            + sum(len(term) + postings.itemsize * len(postings) for term, postings in self.postings.items())
+        )
+
+    def to_dict(self) -> dict:
+        """The JSON form, as build_search_index returns it"""
+        passages = self.passages.tolist()
+        return {
+            'passages': [passages[i:i + 3] for i in range(0, len(passages), 3)],
+            'lengths': self.lengths.tolist(),
+            'avg_length': self.avg_length,
+            'postings': {
+                term: [[postings[i], postings[i + 1]] for i in range(0, len(postings), 2)]
+                for term, postings in self.postings.items()
+            }
+        }
+
+# ===================================
+# Book Artifacts
+# ===================================
+
+# CJK ideographs, kana, hangul and full-width forms: roughly one token per 1.7 characters
+CJK_CHARS = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many DeepSeek tokens text uses without running a tokenizer
+
+    DeepSeek documents roughly 0.3 tokens per English character and 0.6 per
+    Chinese character.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_CHARS.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+def is_actual_chapter(chapter_title: str) -> bool:
+    """Check if this is an actual chapter vs metadata pages"""
+    title_lower = chapter_title.lower()
+    # Common non-chapter patterns in both English and Chinese
+    non_chapter_patterns = [
+        # Chinese patterns
+        '书名页', '标题页', '扉页', '赠献页', '献词', '序言', '序', '前言',
+        '目录', '致谢', '后记', '跋', '附录', '版权', '封底',
+        # English patterns
+        'title page', 'dedication', 'preface', 'foreword', 'introduction',
+        'contents', 'table of contents', 'acknowledgments', 'epilogue',
+        'appendix', 'copyright', 'about the author', 'cover'
+    ]
+
+    # Check if title matches non-chapter patterns
+    for pattern in non_chapter_patterns:
+        if pattern in title_lower:
+            logger.debug("Skipping non-chapter: %s", chapter_title)
+            return False
+
+    # Check if it's a numbered chapter (1, 2, 3... or Chapter 1, etc.)
+    if re.match(r'^(chapter\s+)?\d+$|^第?\d+章?$', title_lower):
+        return True
+
+    # If title is very short and not a number, it might be metadata
+    if len(chapter_title.strip()) < 2:
+        return False
+
+    return True
+
+# Bumped when compute_book_artifacts changes, so stored books are recomputed
+BOOK_ARTIFACTS_VERSION = 1
+
+def compute_book_artifacts(book_data: dict) -> dict:
+    """Per-chapter classification and token counts of a parsed book"""
+    chapters = [
+        {'is_chapter': is_actual_chapter(chapter['title']), 'tokens': estimate_tokens(chapter['text'])}
+        for chapter in book_data['chapters']
+    ]
+    return {
+        'version': BOOK_ARTIFACTS_VERSION,
+        'chapters': chapters,
+        'total_tokens': sum(chapter['tokens'] for chapter in chapters),
+        'chapter_summaries': {}  # language -> run_chapter_summaries result
+    }
+
+# ===================================
+# EPUB Processing Functions
+# ===================================
+
+# Bumped whenever parse_epub_file's output changes, so books stored by an older
+# parser are parsed again on their next upload and browser-cached views are revalidated
+PARSE_VERSION = 1
+
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+HEADING_TAGS = frozenset(('h1', 'h2', 'h3'))
+STRIPPED_TAGS = frozenset(('script', 'style'))
+
+def extract_chapter(content: bytes):
+    """Extract (text, title, clean_html) from one XHTML document in one pass
+
+    Walks the lxml tree once, collecting stripped text nodes outside
+    script/style, the first non-empty h1-h3 as the title, and the script and
+    style elements to drop before serializing the cleaned HTML.
+    """
+    markup = XML_DECLARATION.sub('', content.decode('utf-8', errors='ignore'), count=1)
+    try:
+        root = lxml.html.document_fromstring(markup)
+    except (etree.ParserError, ValueError):
+        return "", None, ""
+
+    strings = []
+    title = None
+    stripped = []
+    skip_depth = 0
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        tag = element.tag
+        if event in ('comment', 'pi'):
+            # Only the tail of a comment or processing instruction is text
+            if not skip_depth and element.tail:
+                piece = element.tail.strip()
+                if piece:
+                    strings.append(piece)
+        elif event == 'start':
+            if tag in STRIPPED_TAGS:
+                if not skip_depth:
+                    stripped.append(element)
+                skip_depth += 1
+            elif skip_depth:
+                continue
+            else:
+                if title is None and tag in HEADING_TAGS:
+                    heading_text = "".join(piece.strip() for piece in element.itertext())
+                    if heading_text:
+                        title = heading_text
+                if element.text:
+                    piece = element.text.strip()
+                    if piece:
+                        strings.append(piece)
+        else:
+            if tag in STRIPPED_TAGS:
+                skip_depth -= 1
+            if not skip_depth and element.tail:
+                piece = element.tail.strip()
+                if piece:
+                    strings.append(piece)
+
+    for element in stripped:
+        element.drop_tree()
+
+    clean_html = lxml.html.tostring(root, encoding='unicode')
+    return "\n".join(strings), title, clean_html
+
+def parse_epub_file(epub_path: str, timings: Optional[Dict[str, float]] = None) -> dict:
+    """Parse the EPUB file at epub_path and extract content
+
+    If timings is given, it is filled with the seconds spent in each stage
+    (zip_read, html_parse, toc_build, index_build).
+    """
+    if timings is None:
+        timings = {}
+    try:
+        stage_started = time.perf_counter()
+        book = epub.read_epub(epub_path)
+        timings['zip_read'] = time.perf_counter() - stage_started
+
+        # Extract metadata
+        metadata = {
+            'title': 'Unknown Title',
+            'author': 'Unknown Author',
+            'language': 'en',
+            'publisher': '',
+            'description': '',
+            'publication_date': ''
+        }
+
+        # Extract title
+        if book.get_metadata('DC', 'title'):
+            metadata['title'] = book.get_metadata('DC', 'title')[0][0]
+
+        # Extract author
+        if book.get_metadata('DC', 'creator'):
+            metadata['author'] = book.get_metadata('DC', 'creator')[0][0]
+
+        # Extract language
+        if book.get_metadata('DC', 'language'):
+            metadata['language'] = book.get_metadata('DC', 'language')[0][0]
+
+        # Extract chapters and content
+        chapters = []
+        toc = []
+
+        # Process navigation
+        stage_started = time.perf_counter()
+        if book.spine:
+            chapter_count = 0
+            for item_id, linear in book.spine:
+                item = book.get_item_with_id(item_id)
+                if item and item.get_type() == ebooklib.ITEM_DOCUMENT:
+                    text, title, clean_html = extract_chapter(item.get_content())
+
+                    if not title:
+                        title = f"Chapter {chapter_count + 1}"
+
+                    chapters.append({
+                        'id': item_id,
+                        'title': title,
+                        'content': clean_html,
+                        'text': text
+                    })
+                    chapter_count += 1
+
+        timings['html_parse'] = time.perf_counter() - stage_started
+
+        # Build table of contents
+        stage_started = time.perf_counter()
+        if hasattr(book, 'toc'):
+            def parse_toc_item(item, level=0):
+                toc_entry = {
+                    'title': str(item.title) if hasattr(item, 'title') else 'Unknown',
+                    'href': str(item.href) if hasattr(item, 'href') else '',
+                    'level': level
+                }
+                toc.append(toc_entry)
+
+                if hasattr(item, 'subitems') and item.subitems:
+                    for subitem in item.subitems:
+                        parse_toc_item(subitem, level + 1)
+
+            for item in book.toc:
+                parse_toc_item(item)
+        timings['toc_build'] = time.perf_counter() - stage_started
+
+        chapters = chapters[:config.MAX_BOOK_CHAPTERS]
+        full_text = book_full_text(chapters)
+
+        stage_started = time.perf_counter()
+        search_index = build_search_index(chapters)
+        timings['index_build'] = time.perf_counter() - stage_started
+
+        return {
+            'metadata': metadata,
+            'chapters': chapters,
+            'toc': toc,
+            'full_text': full_text,
+            'search_index': search_index,
+            'parse_version': PARSE_VERSION
+        }
+
+    except Exception as e:
+        logger.error(f"Error parsing EPUB: {str(e)}")
+        raise ValueError(f"Failed to parse EPUB file: {str(e)}")
+
+def parse_epub_file_timed(epub_path: str) -> tuple:
+    """Run parse_epub_file in a pool worker; return the book as a CompactBook and the stage timings
+
+    The book's artifacts are computed here as well. Compacting in the worker
+    keeps the compression off the event loop's process and shrinks the
+    result pickled back to it.
+    """
+    timings = {}
+    book_data = parse_epub_file(epub_path, timings)
+    if config.BOOK_ARTIFACTS:
+        # Cheap enough to do here, so most uploads need no artifacts job at all
+        stage_started = time.perf_counter()
+        book_data['artifacts'] = compute_book_artifacts(book_data)
+        timings['artifacts'] = time.perf_counter() - stage_started
+    stage_started = time.perf_counter()
+    book_data = CompactBook(book_data)
+    timings['compact'] = time.perf_counter() - stage_started
+    return book_data, timings
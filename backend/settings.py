@@ -0,0 +1,124 @@
+"""
+Echo Reader backend configuration
+Read from the environment (and a .env file) at import. Kept apart from the
+server so EPUB parse workers can load it without importing unified_backend
+"""
+
+import os
+from dotenv import load_dotenv, find_dotenv
+
+# Configuration class for easy API management
+load_dotenv(find_dotenv())
+
+class Config:
+    """Configuration for AI services"""
+    DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
+    DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")  # Any OpenAI-compatible endpoint
+    DEEPSEEK_MODEL = "deepseek-reasoner"
+
+    # Max tokens for different operations
+    MAX_TOKENS_SUMMARY = 1500  # Increased for complete book summaries
+    MAX_TOKENS_CHAPTER = 1200  # Dedicated setting for chapter summaries
+    MAX_TOKENS_ANALYSIS = 2000  # Increased for comprehensive analysis
+    MAX_TOKENS_CHAT = 1000  # Increased for better chat responses
+
+    # Temperature settings for different features
+    TEMP_SUMMARY = 0.3  # Lower for factual summaries
+    TEMP_ANALYSIS = 0.5  # Moderate for analytical content
+    TEMP_CHAT = 0.7  # Higher for conversational responses
+
+    # Prompt token budgets; every prompt is also kept within its model's context window
+    MODEL_CONTEXT_TOKENS = {
+        "deepseek-chat": int(os.environ.get("DEEPSEEK_CHAT_CONTEXT_TOKENS", "65536")),
+        "deepseek-reasoner": int(os.environ.get("DEEPSEEK_REASONER_CONTEXT_TOKENS", "65536")),
+    }
+    PROMPT_SAFETY_TOKENS = 1024  # Headroom for token estimation error
+    CHAPTER_PROMPT_TOKENS = int(os.environ.get("CHAPTER_PROMPT_TOKENS", "6000"))  # Per chapter summary prompt
+    ANALYSIS_PROMPT_TOKENS = int(os.environ.get("ANALYSIS_PROMPT_TOKENS", "16000"))  # Content analysis prompt
+    CHAT_PROMPT_TOKENS = int(os.environ.get("CHAT_PROMPT_TOKENS", "12000"))  # System prompt plus chat history
+
+    # Chapter summary fan-out settings
+    CHAPTER_SUMMARY_CONCURRENCY = int(os.environ.get("CHAPTER_SUMMARY_CONCURRENCY", "5"))  # Max in-flight chapter requests
+    CHAPTER_SUMMARY_TIMEOUT = float(os.environ.get("CHAPTER_SUMMARY_TIMEOUT", "120"))  # Per DeepSeek request, queueing excluded
+    CHAPTER_JOB_RETENTION = float(os.environ.get("CHAPTER_JOB_RETENTION", "3600"))  # Seconds finished jobs stay resumable
+
+    # Whole-book summaries: short books go to the model in one call, longer ones are map-reduced
+    SUMMARY_DIRECT_TOKENS = int(os.environ.get("SUMMARY_DIRECT_TOKENS", "12000"))  # Largest input summarized in a single call
+    SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "6000"))  # Target input size of each map call
+    SUMMARY_MAX_CHUNKS = int(os.environ.get("SUMMARY_MAX_CHUNKS", "40"))  # Chunks grow past the target to stay under this many calls
+    MAX_TOKENS_SUMMARY_PART = 500  # Output tokens for each partial summary
+
+    # Background job queue for long-running analyses
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))  # Jobs executed concurrently
+    JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "100"))  # Queued jobs before submissions get 503
+    JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", str(7 * 24 * 3600)))  # Seconds finished results are kept
+
+    # HTTP connection pool shared by all DeepSeek requests
+    DEEPSEEK_MAX_CONNECTIONS = int(os.environ.get("DEEPSEEK_MAX_CONNECTIONS", "100"))
+    DEEPSEEK_MAX_KEEPALIVE = int(os.environ.get("DEEPSEEK_MAX_KEEPALIVE", "20"))
+    DEEPSEEK_KEEPALIVE_EXPIRY = float(os.environ.get("DEEPSEEK_KEEPALIVE_EXPIRY", "30"))  # Seconds an idle connection is kept
+    DEEPSEEK_TIMEOUT = float(os.environ.get("DEEPSEEK_TIMEOUT", "600"))  # Reasoner completions can take minutes
+    SSE_HEARTBEAT_INTERVAL = 10  # Seconds between keep-alive comments while the model is reasoning
+
+    # Outbound rate governor shared by every DeepSeek call; 0 disables a limit
+    DEEPSEEK_REQUESTS_PER_MINUTE = int(os.environ.get("DEEPSEEK_REQUESTS_PER_MINUTE", "300"))
+    DEEPSEEK_TOKENS_PER_MINUTE = int(os.environ.get("DEEPSEEK_TOKENS_PER_MINUTE", "0"))  # Prompt estimate plus max_tokens
+    DEEPSEEK_MAX_IN_FLIGHT = {
+        "deepseek-chat": int(os.environ.get("DEEPSEEK_MAX_IN_FLIGHT_CHAT", "16")),
+        "deepseek-reasoner": int(os.environ.get("DEEPSEEK_MAX_IN_FLIGHT_REASONER", "8")),
+    }
+    DEEPSEEK_MAX_RETRIES = int(os.environ.get("DEEPSEEK_MAX_RETRIES", "4"))  # Retries on 429, 5xx and connection errors
+    DEEPSEEK_BACKOFF_BASE = 1.0  # Seconds; the backoff ceiling doubles per attempt
+    DEEPSEEK_BACKOFF_MAX = 30.0  # Seconds; longest single backoff
+
+    # EPUB parsing runs in a process pool; 0 workers parses in the server's threadpool instead
+    PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PARSE_QUEUE_LIMIT = int(os.environ.get("PARSE_QUEUE_LIMIT", "16"))  # Parses running or queued before returning 503
+    PARSE_RETRY_AFTER = 5  # Seconds suggested to clients when the parse queue is full
+
+    # Parsed books are stored by the SHA-256 of the uploaded EPUB
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read (and hashed) per upload chunk
+    MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "100"))  # Larger uploads are rejected with 413
+    UPLOAD_TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None  # Where uploads are spooled, system temp dir by default
+    BOOK_CACHE_MAX_AGE = int(os.environ.get("BOOK_CACHE_MAX_AGE", "86400"))  # Browser cache lifetime for chapter fetches
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))  # Smallest response body compressed, 0 disables
+    GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "4"))  # Higher levels cost much more CPU on multi-MB books
+    BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))  # 11 is far too slow for on-the-fly compression
+    COMPRESS_THREAD_MIN_SIZE = 64 * 1024  # Larger bodies are compressed in the threadpool, off the event loop
+    MAX_BOOK_CHAPTERS = int(os.environ.get("MAX_BOOK_CHAPTERS", "500"))  # Spine documents kept per book
+    BOOK_TEXT_MAX_CHARS = int(os.environ.get("BOOK_TEXT_MAX_CHARS", "0"))  # Cap on a book's full_text, 0 for unlimited
+    BOOK_COMPRESSION_LEVEL = int(os.environ.get("BOOK_COMPRESSION_LEVEL", "1"))  # zlib level for chapters held in memory
+    DATA_DIR = os.environ.get("ECHO_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    BOOK_STORE_BACKEND = os.environ.get("BOOK_STORE_BACKEND", "sqlite")  # "sqlite" (persistent, shared) or "memory"
+    BOOK_MEMORY_BUDGET_MB = float(os.environ.get("BOOK_MEMORY_BUDGET_MB", "256"))  # In-memory tier size
+    BOOK_DISK_BUDGET_MB = float(os.environ.get("BOOK_DISK_BUDGET_MB", "0"))  # On-disk store size, 0 for unlimited
+
+    # Batch ingest of EPUB directories; AI calls share the DeepSeek rate governor with live requests
+    BATCH_INPUT_DIR = os.environ.get("BATCH_INPUT_DIR", os.path.join(DATA_DIR, "incoming"))  # Root for /api/batch-ingest paths
+    BATCH_OUTPUT_DIR = os.environ.get("BATCH_OUTPUT_DIR", os.path.join(DATA_DIR, "batch"))  # Per-book results, also the checkpoint
+    BATCH_BOOK_CONCURRENCY = int(os.environ.get("BATCH_BOOK_CONCURRENCY", "4"))  # Books parsed and processed at once
+
+    # Artifacts precomputed for each uploaded book by a low-priority background job
+    BOOK_ARTIFACTS = os.environ.get("BOOK_ARTIFACTS", "true").lower() in ("1", "true", "yes")  # Chapter classification, token counts
+    PRECOMPUTE_SUMMARY_LANGUAGES = [  # Chapter summaries cost API calls, so none are precomputed unless set, e.g. "en,zh"
+        language.strip() for language in os.environ.get("PRECOMPUTE_SUMMARY_LANGUAGES", "").split(",") if language.strip()
+    ]
+    BOOK_ARTIFACTS_PRIORITY = 8  # Job priority; interactive jobs default to 5
+
+    # Per-book search index used to ground chat answers in the book's text
+    SEARCH_PASSAGE_CHARS = 1200  # Target passage size when indexing chapter text
+    SEARCH_TOP_K = int(os.environ.get("SEARCH_TOP_K", "8"))  # Passages retrieved per question
+    SEARCH_CONTEXT_TOKENS = int(os.environ.get("SEARCH_CONTEXT_TOKENS", "2500"))  # Prompt budget for retrieved passages
+
+    # Cache of AI responses keyed on the prompt fingerprint
+    AI_CACHE_BACKEND = os.environ.get("AI_CACHE_BACKEND", "sqlite")  # "sqlite", "memory" or "none"
+    AI_CACHE_TTL = float(os.environ.get("AI_CACHE_TTL", str(7 * 24 * 3600)))  # Seconds a cached response stays valid
+    AI_CACHE_MEMORY_ENTRIES = int(os.environ.get("AI_CACHE_MEMORY_ENTRIES", "1000"))
+    AI_CACHE_DISK_ENTRIES = int(os.environ.get("AI_CACHE_DISK_ENTRIES", "50000"))
+
+    # Logging; prompt and response payloads are only rendered when DEBUG is enabled
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+    LOG_PAYLOAD_CHARS = int(os.environ.get("LOG_PAYLOAD_CHARS", "200"))  # Payload characters shown per log line, 0 to omit
+    LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))  # Share of per-call INFO lines emitted
+
+config = Config()
@@ -0,0 +1,208 @@
+"""
+Tests for the DeepSeek rate governor and request coalescing
+Covers single-flight sharing of identical calls (including takeover when the
+owning call is cancelled), token bucket refill, per-model in-flight limits and
+the retry backoff bounds. The upstream call is replaced with a fake, so no
+network access is needed
+
+Usage: python -m pytest -q backend
+"""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+import unified_backend
+from unified_backend import DeepSeekGovernor, TokenBucket, call_deepseek_api
+
+MESSAGES = [{"role": "user", "content": "Summarize chapter one"}]
+
+class FakeUpstream:
+    """Stands in for request_completion, counting the calls that reach it"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.started = asyncio.Event()
+
+    async def __call__(self, api_model, messages, max_tokens, temperature):
+        self.calls += 1
+        self.started.set()
+        await asyncio.sleep(self.delay)
+        return f"reply {self.calls}"
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeUpstream()
+    monkeypatch.setattr(unified_backend, "request_completion", fake)
+    monkeypatch.setattr(unified_backend, "response_cache", None)
+    return fake
+
+def rate_limit_error(retry_after=None) -> openai.RateLimitError:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://deepseek.test"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+def governor(**overrides) -> DeepSeekGovernor:
+    settings = dict(
+        requests_per_minute=0, tokens_per_minute=0, max_in_flight={"deepseek-chat": 2},
+        max_retries=3, backoff_base=1.0, backoff_max=4.0
+    )
+    settings.update(overrides)
+    return DeepSeekGovernor(**settings)
+
+# ===================================
+# Coalescing
+# ===================================
+
+def test_identical_concurrent_calls_share_one_upstream_call(upstream):
+    async def run():
+        return await asyncio.gather(*(call_deepseek_api(MESSAGES) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert upstream.calls == 1
+    assert results == ["reply 1"] * 10
+    assert not unified_backend.completions_in_flight
+
+def test_different_prompts_are_not_coalesced(upstream):
+    async def run():
+        return await asyncio.gather(call_deepseek_api(MESSAGES), call_deepseek_api(MESSAGES, max_tokens=50))
+
+    asyncio.run(run())
+    assert upstream.calls == 2
+
+def test_waiter_takes_over_when_owner_is_cancelled(upstream):
+    async def run():
+        owner = asyncio.create_task(call_deepseek_api(MESSAGES))
+        await upstream.started.wait()
+        waiter = asyncio.create_task(call_deepseek_api(MESSAGES))
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert asyncio.run(run()) == "reply 2"
+    assert upstream.calls == 2
+    assert not unified_backend.completions_in_flight
+
+def test_cancelled_waiter_leaves_owner_running(upstream):
+    async def run():
+        owner = asyncio.create_task(call_deepseek_api(MESSAGES))
+        await upstream.started.wait()
+        waiter = asyncio.create_task(call_deepseek_api(MESSAGES))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await owner
+
+    assert asyncio.run(run()) == "reply 1"
+    assert upstream.calls == 1
+
+# ===================================
+# Token Bucket
+# ===================================
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0.0
+    bucket.updated = time.monotonic() - 10
+    bucket._refill()
+    assert bucket.tokens == pytest.approx(10, abs=0.5)
+
+def test_bucket_refill_is_capped_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0.0
+    bucket.updated = time.monotonic() - 3600
+    bucket._refill()
+    assert bucket.tokens == bucket.capacity
+
+def test_acquire_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(6000)  # 100 per second
+        bucket.tokens = 0.0
+        bucket.updated = time.monotonic()
+        started = time.monotonic()
+        await bucket.acquire(10)
+        return time.monotonic() - started, bucket.tokens
+
+    waited, tokens = asyncio.run(run())
+    assert 0.08 <= waited < 0.5
+    assert tokens < 1
+
+def test_oversized_request_waits_for_full_bucket_and_goes_into_debt():
+    async def run():
+        bucket = TokenBucket(6000)
+        await bucket.acquire(bucket.capacity * 2)
+        return bucket.tokens
+
+    assert asyncio.run(run()) == pytest.approx(-6000, abs=1)
+
+# ===================================
+# In-flight Limits
+# ===================================
+
+def test_slots_limit_calls_in_flight_per_model():
+    async def run():
+        limiter = governor(max_in_flight={"deepseek-chat": 2, "deepseek-reasoner": 1})
+        peak = {"deepseek-chat": 0, "deepseek-reasoner": 0}
+        current = dict(peak)
+
+        async def call(model):
+            async with limiter.slot(model, 10):
+                current[model] += 1
+                peak[model] = max(peak[model], current[model])
+                await asyncio.sleep(0.01)
+                current[model] -= 1
+
+        await asyncio.gather(*(call(model) for model in peak for _ in range(5)))
+        return peak, limiter.get_stats()
+
+    peak, stats = asyncio.run(run())
+    assert peak == {"deepseek-chat": 2, "deepseek-reasoner": 1}
+    assert stats["requests"] == 10
+    assert stats["waiting"] == 0 and stats["in_flight"] == 0
+
+# ===================================
+# Backoff
+# ===================================
+
+def test_backoff_ceiling_doubles_up_to_backoff_max(monkeypatch):
+    monkeypatch.setattr(unified_backend.random, "uniform", lambda low, high: high)
+    limiter = governor(max_retries=6)
+    error = openai.APIConnectionError(request=httpx.Request("POST", "http://deepseek.test"))
+    assert [limiter.retry_delay(error, attempt) for attempt in range(5)] == [1.0, 2.0, 4.0, 4.0, 4.0]
+
+def test_backoff_is_jittered_below_the_ceiling():
+    limiter = governor()
+    error = openai.APIConnectionError(request=httpx.Request("POST", "http://deepseek.test"))
+    delays = [limiter.retry_delay(error, 1) for _ in range(200)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+def test_gives_up_after_max_retries():
+    limiter = governor(max_retries=3)
+    assert limiter.retry_delay(rate_limit_error(), 3) is None
+    assert limiter.get_stats()["failures"] == 1
+
+def test_retry_after_is_honoured_but_capped(monkeypatch):
+    monkeypatch.setattr(unified_backend.random, "uniform", lambda low, high: low)
+    limiter = governor()
+    assert limiter.retry_delay(rate_limit_error("3"), 0) == 3.0
+    assert limiter.retry_delay(rate_limit_error("120"), 0) == 4.0
+
+def test_rate_limit_pauses_every_caller():
+    limiter = governor()
+    before = time.monotonic()
+    delay = limiter.retry_delay(rate_limit_error("2"), 0)
+    assert limiter.paused_until >= before + delay
+    assert limiter.get_stats()["rate_limited"] == 1
+
+def test_client_errors_are_not_retried():
+    limiter = governor()
+    response = httpx.Response(400, request=httpx.Request("POST", "http://deepseek.test"))
+    error = openai.BadRequestError("bad request", response=response, body=None)
+    assert limiter.retry_delay(error, 0) is None
+    assert limiter.get_stats()["retries"] == 0
@@ -0,0 +1,134 @@
+"""
+Tests for the background job queue
+Covers stopping the queue while a job runs, cancelling queued and running
+jobs, and the artifacts_pending bookkeeping of book artifacts jobs, which
+must be released however the job ends
+
+Usage: python -m pytest -q backend
+"""
+
+import asyncio
+import os
+
+import pytest
+from pydantic import BaseModel
+
+import unified_backend
+from unified_backend import JobQueue, JobResultStore, schedule_book_artifacts
+
+class SlowRequest(BaseModel):
+    seconds: float = 30
+
+async def run_slow(request: SlowRequest) -> dict:
+    await asyncio.sleep(request.seconds)
+    return {"slept": request.seconds}
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path) -> JobQueue:
+    """A one-worker queue, installed as the module's job_queue, with a 'slow' job kind"""
+    monkeypatch.setitem(unified_backend.JOB_KINDS, "slow", (SlowRequest, run_slow))
+    job_queue = JobQueue(1, 10, JobResultStore(os.path.join(tmp_path, "jobs.db"), 3600))
+    monkeypatch.setattr(unified_backend, "job_queue", job_queue)
+    return job_queue
+
+async def wait_for_status(job_queue: JobQueue, job_id: str, status: str):
+    for _ in range(100):
+        job = job_queue.get(job_id)
+        if job is not None and job["status"] == status:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never became {status}")
+
+async def stop(job_queue: JobQueue):
+    """Stop the queue, failing instead of hanging if it does not stop"""
+    await asyncio.wait_for(job_queue.stop(), 2)
+
+# ===================================
+# Stop and Cancel
+# ===================================
+
+def test_stop_returns_while_a_job_is_running(queue):
+    async def run():
+        queue.start()
+        job = queue.submit("slow", SlowRequest(), 5)
+        await wait_for_status(queue, job.id, "running")
+        workers = list(queue._worker_tasks)
+        await stop(queue)
+        return workers
+
+    workers = asyncio.run(run())
+    assert all(worker.done() for worker in workers)
+    assert not queue.jobs
+
+def test_cancelled_running_job_is_recorded_and_worker_keeps_going(queue):
+    async def run():
+        queue.start()
+        job = queue.submit("slow", SlowRequest(), 5)
+        await wait_for_status(queue, job.id, "running")
+        await queue.cancel(job.id)
+        await wait_for_status(queue, job.id, "cancelled")
+        follow_up = queue.submit("slow", SlowRequest(seconds=0), 5)
+        await wait_for_status(queue, follow_up.id, "completed")
+        await stop(queue)
+        return queue.get(job.id), queue.get(follow_up.id)
+
+    cancelled, completed = asyncio.run(run())
+    assert cancelled["status"] == "cancelled"
+    assert completed["result"] == {"slept": 0}
+
+# ===================================
+# Book Artifacts Bookkeeping
+# ===================================
+
+@pytest.fixture
+def artifacts(monkeypatch, queue):
+    monkeypatch.setattr(unified_backend.config, "BOOK_ARTIFACTS", True)
+    monkeypatch.setattr(unified_backend, "artifacts_pending", set())
+    return queue
+
+def block_worker(job_queue: JobQueue):
+    """Keep the only worker busy so later jobs stay queued; short, so a queue
+    that cannot be stopped still drains instead of hanging the test run"""
+    job_queue.submit("slow", SlowRequest(seconds=1), 0)
+
+def artifacts_job(job_queue: JobQueue):
+    return next((job for job in job_queue.jobs.values() if job.kind == "book_artifacts"), None)
+
+def test_cancelling_a_queued_artifacts_job_releases_the_book(artifacts):
+    async def run():
+        artifacts.start()
+        block_worker(artifacts)
+        schedule_book_artifacts({'id': 'book-1', 'chapters': []})
+        queued = 'book-1' in unified_backend.artifacts_pending
+        await artifacts.cancel(artifacts_job(artifacts).id)
+        await stop(artifacts)
+        return queued
+
+    assert asyncio.run(run())
+    assert 'book-1' not in unified_backend.artifacts_pending
+
+def test_stopping_the_queue_releases_dropped_artifacts_jobs(artifacts):
+    async def run():
+        artifacts.start()
+        block_worker(artifacts)
+        schedule_book_artifacts({'id': 'book-2', 'chapters': []})
+        queued = 'book-2' in unified_backend.artifacts_pending
+        await stop(artifacts)
+        return queued
+
+    assert asyncio.run(run())
+    assert 'book-2' not in unified_backend.artifacts_pending
+
+def test_released_book_can_be_scheduled_again(artifacts):
+    async def run():
+        artifacts.start()
+        block_worker(artifacts)
+        schedule_book_artifacts({'id': 'book-3', 'chapters': []})
+        await artifacts.cancel(artifacts_job(artifacts).id)
+        schedule_book_artifacts({'id': 'book-3', 'chapters': []})
+        requeued = artifacts_job(artifacts)
+        status = requeued.status if requeued is not None else None
+        await stop(artifacts)
+        return status
+
+    assert asyncio.run(run()) == "queued"
@@ -0,0 +1,78 @@
+"""
+Tests for coalescing identical EPUB uploads
+Concurrent uploads of the same file share one parse; when the upload that
+owns the parse is cancelled, a waiting upload takes it over instead of
+failing. The parser is replaced with a fake
+
+Usage: python -m pytest -q backend
+"""
+
+import asyncio
+
+import pytest
+
+import unified_backend
+from unified_backend import PARSE_VERSION, MemoryBookStore, parse_spooled_upload
+
+BOOK_ID = "0" * 64
+
+class FakeParser:
+    """Stands in for epub_parse_pool.parse, counting the parses it starts"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.paths = []
+        self.started = asyncio.Event()
+
+    async def __call__(self, epub_path: str) -> dict:
+        self.paths.append(epub_path)
+        self.started.set()
+        await asyncio.sleep(self.delay)
+        return {'metadata': {'title': epub_path}, 'chapters': [], 'toc': [], 'parse_version': PARSE_VERSION}
+
+@pytest.fixture
+def parser(monkeypatch):
+    fake = FakeParser()
+    monkeypatch.setattr(unified_backend.epub_parse_pool, "parse", fake)
+    monkeypatch.setattr(unified_backend, "book_store", MemoryBookStore(64 * 1024 * 1024))
+    return fake
+
+def test_identical_uploads_share_one_parse(parser):
+    async def run():
+        return await asyncio.gather(*(parse_spooled_upload(f"upload-{n}.epub", BOOK_ID) for n in range(5)))
+
+    books = asyncio.run(run())
+    assert parser.paths == ["upload-0.epub"]
+    assert all(book is books[0] for book in books)
+    assert not unified_backend.parses_in_flight
+
+def test_waiter_takes_over_when_owning_upload_is_cancelled(parser, caplog):
+    parser.delay = 1
+
+    async def run():
+        owner = asyncio.create_task(parse_spooled_upload("owner.epub", BOOK_ID))
+        await parser.started.wait()
+        waiter = asyncio.create_task(parse_spooled_upload("waiter.epub", BOOK_ID))
+        while not any("waiting for it" in record.getMessage() for record in caplog.records):
+            await asyncio.sleep(0.01)
+        parser.delay = 0.05
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    book = asyncio.run(run())
+    assert parser.paths == ["owner.epub", "waiter.epub"]
+    assert book['id'] == BOOK_ID
+    assert book['metadata']['title'] == "waiter.epub"
+    assert not unified_backend.parses_in_flight
+
+def test_stored_book_is_served_without_parsing(parser):
+    async def run():
+        first = await parse_spooled_upload("first.epub", BOOK_ID)
+        second = await parse_spooled_upload("second.epub", BOOK_ID)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert parser.paths == ["first.epub"]
+    assert second['metadata'] == first['metadata']
@@ -3,22 +3,48 @@ Unified Backend for E-book Reader
 Combines EPUB processing and AI services in a single server
 """
 
-from fastapi import FastAPI, HTTPException, File, UploadFile
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from pydantic import BaseModel, PrivateAttr, ValidationError
 from typing import List, Dict, Optional
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import json
 import os
-from openai import OpenAI
-from dotenv import load_dotenv, find_dotenv
+import httpx
+import openai
+from openai import AsyncOpenAI
 import logging
+import math
+import multiprocessing
+import random
 from datetime import datetime
 import hashlib
-import uuid
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-import re
+import heapq
+import gzip
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import orjson
+import brotli
+
+from settings import config
+from epub_parser import (
+    BOOK_ARTIFACTS_VERSION, PARSE_VERSION, CompactBook, SearchIndex, book_full_text, build_search_index,
+    compute_book_artifacts, estimate_tokens, is_actual_chapter, parse_epub_file_timed, search_terms
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,490 +62,1581 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration class for easy API management
-load_dotenv(find_dotenv())
-
-class Config:
-    """Configuration for AI services"""
-    DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
-    DEEPSEEK_BASE_URL = "https://api.deepseek.com"
-    DEEPSEEK_MODEL = "deepseek-reasoner"
-
-    # Max tokens for different operations
-    MAX_TOKENS_SUMMARY = 1500  # Increased for complete book summaries
-    MAX_TOKENS_CHAPTER = 1200  # Dedicated setting for chapter summaries
-    MAX_TOKENS_ANALYSIS = 2000  # Increased for comprehensive analysis
-    MAX_TOKENS_CHAT = 1000  # Increased for better chat responses
-
-    # Temperature settings for different features
-    TEMP_SUMMARY = 0.3  # Lower for factual summaries
-    TEMP_ANALYSIS = 0.5  # Moderate for analytical content
-    TEMP_CHAT = 0.7  # Higher for conversational responses
-
-config = Config()
+logger.setLevel(config.LOG_LEVEL)
 
 # Ensure API key is configured at startup
 if not config.DEEPSEEK_API_KEY or config.DEEPSEEK_API_KEY == "your_api_key_here":
     raise RuntimeError("DEEPSEEK_API_KEY is not configured. Set it in .env or environment.")
 
 # Initialize DeepSeek client
-deepseek_client = OpenAI(
+# A single async client with a pooled HTTP transport is shared by every request,
+# so concurrent completions reuse keep-alive connections instead of blocking the event loop
+deepseek_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=config.DEEPSEEK_MAX_CONNECTIONS,
+        max_keepalive_connections=config.DEEPSEEK_MAX_KEEPALIVE,
+        keepalive_expiry=config.DEEPSEEK_KEEPALIVE_EXPIRY
+    ),
+    timeout=httpx.Timeout(config.DEEPSEEK_TIMEOUT, connect=10.0)
+)
+
+# Retries are handled by deepseek_governor, so the SDK's own retries are disabled
+deepseek_client = AsyncOpenAI(
     api_key=config.DEEPSEEK_API_KEY,
-    base_url=config.DEEPSEEK_BASE_URL
+    base_url=config.DEEPSEEK_BASE_URL,
+    http_client=deepseek_http_client,
+    max_retries=0
 )
 
-# In-memory storage for processed books (in production, use a database)
-processed_books = {}
+# ===================================
+# Log Helpers
+# ===================================
+
+class Preview:
+    """Truncated view of a prompt or response for log lines
+
+    Pass it as a %s argument so the text is only built when the record is
+    actually emitted. Chat message lists are rendered role by role until
+    LOG_PAYLOAD_CHARS is reached instead of serializing the whole list.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        limit = config.LOG_PAYLOAD_CHARS
+        if limit <= 0:
+            return "<omitted>"
+        if isinstance(self.value, list):
+            parts = []
+            size = 0
+            for message in self.value:
+                if size >= limit:
+                    break
+                part = f"{message.get('role')}: {(message.get('content') or '')[:limit - size]}"
+                parts.append(part)
+                size += len(part)
+            text = " | ".join(parts)
+            total = sum(len(message.get('content') or '') for message in self.value)
+        else:
+            text = str(self.value)
+            total = len(text)
+        if total > limit:
+            return f"{text[:limit]}... ({total} chars)"
+        return text
+
+def log_sampled(level: int = logging.INFO) -> bool:
+    """Whether a per-call log line at this level should be emitted, applying LOG_SAMPLE_RATE"""
+    if not logger.isEnabledFor(level):
+        return False
+    return config.LOG_SAMPLE_RATE >= 1 or random.random() < config.LOG_SAMPLE_RATE
 
 # ===================================
-# EPUB Processing Functions
+# Response Encoding
 # ===================================
 
-def parse_epub_file(file_content: bytes) -> dict:
-    """Parse EPUB file and extract content"""
-    try:
-        # Create a temporary file to process the EPUB
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.epub', delete=False) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
-
-        book = epub.read_epub(tmp_path)
-
-        # Extract metadata
-        metadata = {
-            'title': 'Unknown Title',
-            'author': 'Unknown Author',
-            'language': 'en',
-            'publisher': '',
-            'description': '',
-            'publication_date': ''
-        }
+def json_bytes(payload) -> bytes:
+    """Encode payload as compact UTF-8 JSON with orjson"""
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
 
-        # Extract title
-        if book.get_metadata('DC', 'title'):
-            metadata['title'] = book.get_metadata('DC', 'title')[0][0]
-
-        # Extract author
-        if book.get_metadata('DC', 'creator'):
-            metadata['author'] = book.get_metadata('DC', 'creator')[0][0]
-
-        # Extract language
-        if book.get_metadata('DC', 'language'):
-            metadata['language'] = book.get_metadata('DC', 'language')[0][0]
-
-        # Extract chapters and content
-        chapters = []
-        full_text = ""
-        toc = []
-
-        # Process navigation
-        if book.spine:
-            chapter_count = 0
-            for item_id, linear in book.spine:
-                item = book.get_item_with_id(item_id)
-                if item and item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    content = item.get_content().decode('utf-8', errors='ignore')
-                    soup = BeautifulSoup(content, 'html.parser')
-
-                    # Extract text
-                    text = soup.get_text(separator='\n', strip=True)
-
-                    # Try to find chapter title
-                    title = None
-                    for heading in soup.find_all(['h1', 'h2', 'h3']):
-                        heading_text = heading.get_text(strip=True)
-                        if heading_text:
-                            title = heading_text
-                            break
-
-                    if not title:
-                        title = f"Chapter {chapter_count + 1}"
-
-                    # Clean and format HTML content
-                    # Remove scripts and styles
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-
-                    # Convert to clean HTML
-                    clean_html = str(soup)
-
-                    chapters.append({
-                        'id': item_id,
-                        'title': title,
-                        'content': clean_html,
-                        'text': text[:10000]  # Limit for AI processing
-                    })
-
-                    full_text += text + "\n\n"
-                    chapter_count += 1
-
-        # Build table of contents
-        if hasattr(book, 'toc'):
-            def parse_toc_item(item, level=0):
-                toc_entry = {
-                    'title': str(item.title) if hasattr(item, 'title') else 'Unknown',
-                    'href': str(item.href) if hasattr(item, 'href') else '',
-                    'level': level
-                }
-                toc.append(toc_entry)
-
-                if hasattr(item, 'subitems') and item.subitems:
-                    for subitem in item.subitems:
-                        parse_toc_item(subitem, level + 1)
-
-            for item in book.toc:
-                parse_toc_item(item)
-
-        # Clean up temp file
-        os.unlink(tmp_path)
-
-        # Generate unique ID for this book
-        book_id = str(uuid.uuid4())
-
-        # Store processed book
-        book_data = {
-            'id': book_id,
-            'metadata': metadata,
-            'chapters': chapters[:50],  # Limit chapters for performance
-            'toc': toc,
-            'full_text': full_text[:30000]  # Limit for AI processing
-        }
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through json_bytes"""
 
-        processed_books[book_id] = book_data
+    def render(self, content) -> bytes:
+        return json_bytes(content)
 
-        return book_data
+# Routes are declared further down, so they all pick this up
+app.router.default_response_class = FastJSONResponse
 
-    except Exception as e:
-        logger.error(f"Error parsing EPUB: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Failed to parse EPUB file: {str(e)}")
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, or None for identity"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=config.BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.GZIP_LEVEL)
+
+def compressible(content_type: str) -> bool:
+    """JSON and text bodies, except event streams, which must flush per event"""
+    content_type = content_type.lower()
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(("application/json", "text/"))
+
+class CompressionMiddleware:
+    """ASGI middleware compressing response bodies with br or gzip, as the client accepts
+
+    Only bodies sent in one message are compressed, so streamed responses
+    pass through untouched. Bodies under COMPRESS_MIN_SIZE and responses that
+    already carry a Content-Encoding are left alone.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        encoding = None
+        if scope["type"] == "http" and config.COMPRESS_MIN_SIZE > 0:
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not compressible(headers.get("content-type", "")):
+                    await send(message)
+                else:
+                    start = message  # Held until the body shows whether it is worth compressing
+                return
+            if start is None:
+                await send(message)
+                return
+
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body") or len(body) < config.COMPRESS_MIN_SIZE:
+                await send(held)
+                await send(message)
+                return
+
+            if len(body) >= config.COMPRESS_THREAD_MIN_SIZE:
+                body = await run_in_threadpool(compress_body, body, encoding)
+            else:
+                body = compress_body(body, encoding)
+            headers = MutableHeaders(raw=list(held["headers"]))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            await send({**held, "headers": headers.raw})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+# Added before MetricsMiddleware, so request timings include compression
+app.add_middleware(CompressionMiddleware)
 
 # ===================================
-# AI Processing Functions
+# Metrics
 # ===================================
 
-def call_deepseek_api(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.5, model: str = None) -> str:
-    """Call DeepSeek API with error handling
-
-    Args:
-        messages: List of message dicts for the chat
-        max_tokens: Maximum tokens for response
-        temperature: Temperature for response generation
-        model: Optional model override (defaults to config.DEEPSEEK_MODEL)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """Render a label set as {name="value",...} with Prometheus escaping"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Metric:
+    """A named metric rendered in the Prometheus text exposition format
+
+    Values are either recorded on the metric or, for state that already
+    lives elsewhere, read from callback at scrape time. The callback returns
+    a number, or a dict of label values tuple -> number.
     """
-    try:
-        # Use provided model or default from config
-        api_model = model if model else config.DEEPSEEK_MODEL
 
-        logger.info(f"Calling DeepSeek API with model={api_model}, max_tokens={max_tokens}, temperature={temperature}")
-        logger.info(f"Messages being sent: {json.dumps(messages, ensure_ascii=False)[:500]}...")  # Log first 500 chars
+    type_name = "untyped"
 
-        response = deepseek_client.chat.completions.create(
-            model=api_model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=False
-        )
+    def __init__(self, name: str, help_text: str, labelnames=(), callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
 
-        # Log the full response structure
-        logger.info(f"Response object: {response}")
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
 
-        if response.choices and len(response.choices) > 0:
-            content = response.choices[0].message.content
-            logger.info(f"DeepSeek API returned content of length: {len(content) if content else 0}")
-            if content:
-                logger.info(f"First 200 chars of content: {content[:200]}")
-            else:
-                logger.warning("DeepSeek API returned None or empty content")
-                # Log more details about the response
-                logger.warning(f"Choice object: {response.choices[0]}")
-                logger.warning(f"Message object: {response.choices[0].message}")
+    def samples(self):
+        """Yield (sample name, labels, value) for every label combination"""
+        if self.callback is not None:
+            values = self.callback()
+            items = list(values.items()) if isinstance(values, dict) else [((), values)]
         else:
-            logger.error("No choices in response")
-            content = None
-
-        return content if content else ""
-    except Exception as e:
-        logger.error(f"DeepSeek API error: {e}")
-        logger.error(f"Error type: {type(e)}")
-        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+class CounterMetric(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class GaugeMetric(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class HistogramMetric(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts, then +Inf count and sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        for _, labels, counts in super().samples():
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", {**labels, "le": repr(float(bound))}, count
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-2]
+            yield f"{self.name}_count", labels, counts[-2]
+            yield f"{self.name}_sum", labels, counts[-1]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+metrics = MetricsRegistry()
+
+# Route template of the request (or "job:<kind>") that triggered the current work, for metric labels
+current_endpoint = ContextVar("current_endpoint", default="none")
+
+http_request_seconds = metrics.register(HistogramMetric(
+    "echo_http_request_duration_seconds", "Time to serve an HTTP request, including streamed bodies",
+    ("method", "endpoint", "status")
+))
+http_requests_in_flight = metrics.register(GaugeMetric(
+    "echo_http_requests_in_flight", "HTTP requests currently being served"
+))
+upstream_request_seconds = metrics.register(HistogramMetric(
+    "echo_upstream_request_duration_seconds", "DeepSeek completion latency, excluding queue wait",
+    ("model", "endpoint", "outcome")
+))
+upstream_queue_wait_seconds = metrics.register(HistogramMetric(
+    "echo_upstream_queue_wait_seconds", "Time DeepSeek calls waited for rate governor admission", ("model",)
+))
+upstream_tokens = metrics.register(CounterMetric(
+    "echo_upstream_tokens_total", "Tokens reported by DeepSeek", ("model", "direction")
+))
+upstream_coalesced = metrics.register(CounterMetric(
+    "echo_upstream_coalesced_total", "DeepSeek calls answered by an identical call already in flight"
+))
+epub_parse_stage_seconds = metrics.register(HistogramMetric(
+    "echo_epub_parse_stage_seconds", "EPUB parse time by stage", ("stage",), buckets=STAGE_BUCKETS
+))
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and labelling the work it triggers with its route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def route_template(self, scope) -> str:
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self.route_template(scope)
+        current_endpoint.set(endpoint)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], endpoint=endpoint, status=status["code"]
+            )
+
+app.add_middleware(MetricsMiddleware)
 
 # ===================================
-# Pydantic Models
+# Book Storage
 # ===================================
 
-class BookContent(BaseModel):
-    title: str
-    author: Optional[str] = None
-    full_text: str
-    chapters: Optional[List[Dict[str, str]]] = None
-    language: Optional[str] = "en"  # Add language parameter
+def compact_book(book_data: Mapping) -> CompactBook:
+    return book_data if isinstance(book_data, CompactBook) else CompactBook(book_data)
 
-class ChapterSummaryRequest(BaseModel):
-    book_title: str
-    chapters: List[Dict[str, str]]
-    language: Optional[str] = "en"  # Add language parameter
+def serialize_book(book_data: Mapping) -> bytes:
+    """Encode a parsed book as UTF-8 JSON
 
-class ContentAnalysisRequest(BaseModel):
-    book_title: str
-    content: str
-    analysis_type: Optional[str] = "comprehensive"
-    language: Optional[str] = "en"  # Add language parameter
+    full_text is left out, since it is derived from the chapters on load.
+    """
+    if isinstance(book_data, CompactBook):
+        book_data = book_data.to_dict(full_text=False)
+    else:
+        book_data = {key: value for key, value in book_data.items() if key != 'full_text'}
+    return json.dumps(book_data, ensure_ascii=False).encode('utf-8')
 
-class ChatMessage(BaseModel):
-    role: str
-    content: str
+def thread_local_connection(local: threading.local, path: str) -> sqlite3.Connection:
+    """Return this thread's SQLite connection for path, opening it on first use
 
-class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
-    book_context: Optional[Dict[str, str]] = None
-    language: Optional[str] = "en"  # Add language parameter
+    sqlite3 connections must not be shared across threads, so each store keeps
+    one connection per thread in a threading.local.
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA busy_timeout=30000")
+        local.conn = conn
+    return conn
+
+class BookStore(ABC):
+    """Interface for parsed book storage backends
+
+    Backends are synchronous and thread-safe; async handlers should call them
+    through run_in_threadpool when they may touch disk.
+    """
 
-class AIResponse(BaseModel):
-    success: bool
-    data: Optional[Dict] = None
-    error: Optional[str] = None
+    @abstractmethod
+    def get(self, book_id: str) -> Optional[dict]:
+        """Return the stored book, or None if there is none"""
 
-# ===================================
-# API Endpoints
-# ===================================
+    @abstractmethod
+    def put(self, book_id: str, book_data: dict):
+        """Store book_data under book_id, replacing any earlier version"""
 
-@app.get("/")
-async def root():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "Echo Reader Unified Backend",
-        "features": ["EPUB Processing", "AI Analysis"],
-        "ai_model": config.DEEPSEEK_MODEL,
-        "version": "2.0.0"
-    }
+    def __contains__(self, book_id: str) -> bool:
+        return self.get(book_id) is not None
 
-# ===================================
-# EPUB Processing Endpoints
-# ===================================
+class MemoryBookStore(BookStore):
+    """In-memory LRU tier bounded by a byte budget
 
-@app.post("/upload-epub")
-async def upload_epub(file: UploadFile = File(...)):
-    """Upload and process EPUB file"""
-    # Validate file type
-    if not file.filename.endswith('.epub'):
-        raise HTTPException(status_code=400, detail="Only EPUB files are supported")
+    Books are held as CompactBook and each is charged its compact size.
+    Reading a book marks it as recently used; least recently used books are
+    evicted once the budget is exceeded (the most recent book is always kept).
+    """
 
-    # Read file content
-    content = await file.read()
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._books = OrderedDict()  # book_id -> (book_data, size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._books)
+
+    def get(self, book_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._books.get(book_id)
+            if entry is None:
+                return None
+            self._books.move_to_end(book_id)
+            return entry[0]
+
+    def put(self, book_id: str, book_data: Mapping):
+        book_data = compact_book(book_data)
+        size = book_data.nbytes()
+        with self._lock:
+            previous = self._books.pop(book_id, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self._books[book_id] = (book_data, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self._books) > 1:
+                evicted_id, (_, evicted_size) = self._books.popitem(last=False)
+                self.total_bytes -= evicted_size
+                logger.info(f"Evicted book {evicted_id} from memory ({evicted_size} bytes)")
+
+class SQLiteBookStore(BookStore):
+    """Persistent book store: zlib-compressed JSON blobs in a SQLite database
+
+    The database runs in WAL mode so several uvicorn workers can share one
+    store. With a non-zero max_bytes, least recently accessed books are
+    deleted once the compressed total exceeds it.
+    """
 
-    # Parse EPUB
-    book_data = parse_epub_file(content)
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS books (
+                    id TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self._local, self.path)
+
+    def get_serialized(self, book_id: str) -> Optional[bytes]:
+        """Return the book's uncompressed JSON, or None if it is not stored"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM books WHERE id = ?", (book_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE books SET accessed_at = ? WHERE id = ?", (time.time(), book_id))
+        return zlib.decompress(row[0])
+
+    def get(self, book_id: str) -> Optional[dict]:
+        serialized = self.get_serialized(book_id)
+        return json.loads(serialized) if serialized is not None else None
+
+    def put(self, book_id: str, book_data: dict, serialized: Optional[bytes] = None):
+        blob = zlib.compress(serialized if serialized is not None else serialize_book(book_data))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO books (id, data, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (book_id, blob, len(blob), time.time())
+            )
+            if self.max_bytes > 0:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM books").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT id, size FROM books ORDER BY accessed_at ASC").fetchall()
+        for evicted_id, size in rows[:-1]:  # Never evict the most recently used book
+            conn.execute("DELETE FROM books WHERE id = ?", (evicted_id,))
+            logger.info(f"Evicted book {evicted_id} from disk store ({size} bytes)")
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def __contains__(self, book_id: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM books WHERE id = ?", (book_id,)).fetchone() is not None
+
+class TieredBookStore(BookStore):
+    """Memory LRU tier in front of a persistent store
+
+    Writes go to both tiers; reads that miss memory are loaded from disk and
+    promoted into the memory tier.
+    """
 
-    # Also prepare for AI processing
-    if book_data:
-        # Store for AI features
-        book_data['uploaded_at'] = datetime.now().isoformat()
+    def __init__(self, memory: MemoryBookStore, disk: SQLiteBookStore):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, book_id: str) -> Optional[dict]:
+        book_data = self.memory.get(book_id)
+        if book_data is not None:
+            return book_data
+        serialized = self.disk.get_serialized(book_id)
+        if serialized is None:
+            return None
+        book_data = CompactBook(json.loads(serialized))
+        self.memory.put(book_id, book_data)
+        return book_data
 
-    return book_data
+    def put(self, book_id: str, book_data: Mapping):
+        serialized = serialize_book(book_data)
+        self.disk.put(book_id, book_data, serialized)
+        self.memory.put(book_id, book_data)
+
+    def __contains__(self, book_id: str) -> bool:
+        return self.memory.get(book_id) is not None or book_id in self.disk
+
+def create_book_store() -> BookStore:
+    """Build the book store selected by BOOK_STORE_BACKEND"""
+    memory = MemoryBookStore(int(config.BOOK_MEMORY_BUDGET_MB * 1024 * 1024))
+    if config.BOOK_STORE_BACKEND == "memory":
+        return memory
+    if config.BOOK_STORE_BACKEND == "sqlite":
+        disk = SQLiteBookStore(
+            os.path.join(config.DATA_DIR, "books.db"),
+            int(config.BOOK_DISK_BUDGET_MB * 1024 * 1024)
+        )
+        return TieredBookStore(memory, disk)
+    raise RuntimeError(f"Unknown BOOK_STORE_BACKEND: {config.BOOK_STORE_BACKEND}")
 
-@app.get("/book/{book_id}")
-async def get_book(book_id: str):
-    """Get processed book by ID"""
-    if book_id not in processed_books:
-        raise HTTPException(status_code=404, detail="Book not found")
-    return processed_books[book_id]
+book_store = create_book_store()
 
 # ===================================
-# AI Feature Endpoints
+# Book Search Index
 # ===================================
 
-@app.post("/api/upload-book")
-async def upload_book_for_ai(file: UploadFile = File(...)):
-    """Upload book for AI processing (supports EPUB)"""
-    if file.filename.endswith('.epub'):
-        content = await file.read()
-        book_data = parse_epub_file(content)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def search_book(book_data: Mapping, query: str, top_k: int) -> List[Dict]:
+    """Return the top_k passages of a book for query, best first, ranked with BM25"""
+    index = book_data['search_index']
+    if not isinstance(index, SearchIndex):
+        index = SearchIndex(index)
+    lengths = index.lengths
+    if not lengths:
+        return []
+
+    scores = {}
+    for term in set(search_terms(query)):
+        postings = index.postings.get(term)
+        if not postings:
+            continue
+        matches = len(postings) // 2
+        idf = math.log(1 + (len(lengths) - matches + 0.5) / (matches + 0.5))
+        for passage_id, count in zip(postings[0::2], postings[1::2]):
+            length_norm = 1 - BM25_B + BM25_B * lengths[passage_id] / index.avg_length
+            score = idf * count * (BM25_K1 + 1) / (count + BM25_K1 * length_norm)
+            scores[passage_id] = scores.get(passage_id, 0.0) + score
+
+    results = []
+    texts = {}  # Stored chapter text is decompressed on access, so once per chapter
+    for passage_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+        chapter_index, start, end = index.passage(passage_id)
+        chapter = book_data['chapters'][chapter_index]
+        if chapter_index not in texts:
+            texts[chapter_index] = chapter['text']
+        results.append({
+            'chapter_index': chapter_index,
+            'chapter_title': chapter['title'],
+            'offset': start,
+            'text': texts[chapter_index][start:end].strip(),
+            'score': round(score, 3)
+        })
+    return results
 
-        # Prepare for AI
-        return AIResponse(
-            success=True,
-            data={
-                "title": book_data['metadata']['title'],
-                "author": book_data['metadata']['author'],
-                "full_text": book_data['full_text'],
-                "chapters": [{"title": ch['title'], "content": ch['text']} for ch in book_data['chapters']]
-            }
-        )
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported file format")
+# ===================================
+# EPUB Processing Functions
+# ===================================
 
-@app.post("/api/book-summary")
-async def generate_book_summary(request: BookContent):
-    """Generate a comprehensive summary of the entire book"""
+async def parse_result(parse) -> tuple:
+    """Await a parse_epub_file_timed call, answering 400 if the file is not a readable EPUB"""
     try:
-        # Debug logging
-        logger.info(f"Book summary request - Language: {request.language}")
+        return await parse
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Language-specific prompts - DIRECT, NO CONVERSATIONAL TONE
-        if request.language == "zh":
-            system_prompt = """你是一位专业的文学分析专家。直接提供书籍的全面摘要。
-不要使用对话语气，不要说"当然"、"好的"等词语。
-直接开始摘要内容。使用清晰的段落分隔。
-避免使用markdown符号如###、**等。"""
+class EpubParsePool:
+    """Runs parse_epub_file in worker processes with a bounded queue
 
-            user_prompt = f"""书名：{request.title}
-作者：{request.author or '未知'}
+    Parsing is CPU-bound, so it is kept off the event loop and spread across
+    cores. Once max_pending parses are running or queued, new uploads are
+    rejected with 503 instead of piling up behind them.
+    """
 
-基于以下内容提供这本书的全面摘要：
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+        self._running = set()
+        self._discard_when_done = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created lazily, on the first upload. Workers come from a forkserver (spawn where there
+        # is none, e.g. Windows): forking this process directly could copy a lock (logging,
+        # SQLite) held by one of its threads into a child that then never gets it. Either way a
+        # worker only needs epub_parser, not this module's stores and clients
+        if self._executor is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context(start_method)
+            )
+        return self._executor
+
+    def _submit(self, epub_path: str) -> asyncio.Future:
+        """Start a parse in a worker process
+
+        The queue slot is released when the worker finishes, not when the
+        caller stops waiting, so a cancelled upload keeps counting against
+        max_pending while its parse is still running.
+        """
+        try:
+            future = self._get_executor().submit(parse_epub_file_timed, epub_path)
+        except BaseException:
+            self.pending -= 1
+            raise
+        self._running.add(epub_path)
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._finished, epub_path))
+        return asyncio.wrap_future(future)
+
+    def _finished(self, epub_path: str):
+        self.pending -= 1
+        self._running.discard(epub_path)
+        if epub_path in self._discard_when_done:
+            self._discard_when_done.remove(epub_path)
+            os.unlink(epub_path)
+
+    def discard(self, epub_path: str):
+        """Delete a spooled upload now, or once the worker still reading it is done"""
+        if epub_path in self._running:
+            self._discard_when_done.add(epub_path)
+        else:
+            os.unlink(epub_path)
+
+    async def parse(self, epub_path: str) -> CompactBook:
+        """Parse an EPUB in the pool, raising HTTPException on overload or bad input"""
+        if self.pending >= self.max_pending:
+            logger.warning(f"EPUB parse queue full ({self.pending} pending) - rejecting upload")
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy processing other books. Please retry shortly.",
+                headers={"Retry-After": str(config.PARSE_RETRY_AFTER)}
+            )
+
+        self.pending += 1
+        try:
+            if self.max_workers <= 0:
+                # Cancellation waits for the thread to finish, so the slot can be released here
+                try:
+                    book_data, timings = await parse_result(run_in_threadpool(parse_epub_file_timed, epub_path))
+                finally:
+                    self.pending -= 1
+            else:
+                book_data, timings = await parse_result(self._submit(epub_path))
+            for stage, seconds in timings.items():
+                epub_parse_stage_seconds.observe(seconds, stage=stage)
+            epub_parse_stage_seconds.observe(sum(timings.values()), stage="total")
+            return book_data
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next upload
+            logger.error("EPUB parse worker crashed - restarting process pool")
+            self.shutdown()
+            raise HTTPException(status_code=500, detail="EPUB parser crashed while processing this file")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+epub_parse_pool = EpubParsePool(config.PARSE_WORKERS, config.PARSE_QUEUE_LIMIT)
+
+# Parses currently running, keyed by content hash, so identical concurrent uploads share one parse
+parses_in_flight: Dict[str, asyncio.Future] = {}
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"EPUB file is larger than the {config.MAX_UPLOAD_MB:g} MB upload limit"
+    )
+
+async def spool_upload(file: UploadFile) -> tuple:
+    """Copy an upload to a temporary file in chunks, hashing it as it streams
+
+    Only one chunk is held in memory at a time. The caller owns the returned
+    file and must remove it; on error it is removed here.
+
+    Returns:
+        Tuple of (temporary file path, hex SHA-256 digest)
+    """
+    max_bytes = int(config.MAX_UPLOAD_MB * 1024 * 1024)
+    if file.size is not None and file.size > max_bytes:
+        raise upload_too_large()
 
-{request.full_text[:10000]}
+    digest = hashlib.sha256()
+    size = 0
+    spool = tempfile.NamedTemporaryFile(suffix='.epub', dir=config.UPLOAD_TMP_DIR, delete=False)
+    try:
+        with spool:
+            while True:
+                chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise upload_too_large()
+                digest.update(chunk)
+                await run_in_threadpool(spool.write, chunk)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name, digest.hexdigest()
+
+def file_sha256(path: str) -> str:
+    """Hex SHA-256 of a file, read in UPLOAD_CHUNK_SIZE chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(config.UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def process_epub_upload(file: UploadFile) -> dict:
+    """Parse an uploaded EPUB off the event loop and store it for later requests
+
+    Books are content-addressed: the SHA-256 of the file is the book id, so
+    uploading the same EPUB again returns the already parsed book.
+    """
+    epub_path, book_id = await spool_upload(file)
+    try:
+        book_data = await parse_spooled_upload(epub_path, book_id)
+    finally:
+        epub_parse_pool.discard(epub_path)
+    schedule_book_artifacts(book_data)
+    return book_data
 
-摘要应包含以下部分（用段落分隔）：
+async def parse_spooled_upload(epub_path: str, book_id: str) -> dict:
+    """Return the stored book for book_id, parsing the spooled file if needed"""
+    book_data = await run_in_threadpool(book_store.get, book_id)
+    if book_data is not None:
+        if book_data.get('parse_version') == PARSE_VERSION:
+            logger.info(f"Book {book_id} already parsed - serving from store")
+            return book_data
+        logger.info(f"Book {book_id} was parsed by an older parser - parsing it again")
+
+    while book_id in parses_in_flight:
+        future = parses_in_flight[book_id]
+        logger.info(f"Book {book_id} is already being parsed - waiting for it")
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+            # The upload that owned the parse was cancelled; take over if nobody else has
+            continue
+
+    future = asyncio.get_running_loop().create_future()
+    parses_in_flight[book_id] = future
+    try:
+        book_data = await epub_parse_pool.parse(epub_path)
+        book_data['id'] = book_id
+        book_data['uploaded_at'] = datetime.now().isoformat()
+        await run_in_threadpool(book_store.put, book_id, book_data)
+        future.set_result(book_data)
+        return book_data
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Retrieve the exception so an unawaited future doesn't log a warning
+        future.exception()
+        raise
+    finally:
+        del parses_in_flight[book_id]
 
-概述和主要情节
+# ===================================
+# AI Response Cache
+# ===================================
 
-关键角色
+def prompt_fingerprint(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+    """Stable SHA-256 fingerprint of everything that determines a completion"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+        ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Two-level cache of AI responses keyed on prompt fingerprint
+
+    A small in-memory LRU sits in front of an optional SQLite table. Entries
+    expire after ttl seconds; each level also evicts its oldest entries once
+    it holds more than its entry limit. Hit and miss counts are kept for
+    /api/cache-stats.
+    """
 
-主要主题
+    def __init__(self, ttl: float, memory_entries: int, disk_path: Optional[str] = None, disk_entries: int = 0):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_path = disk_path
+        self.disk_entries = disk_entries
+        self._counts = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+        self._memory = OrderedDict()  # key -> (content, created_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        content TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self._local, self.disk_path)
+
+    def _remember(self, key: str, content: str, created_at: float):
+        with self._lock:
+            self._memory[key] = (content, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > max(1, self.memory_entries):
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> tuple:
+        """(content, "memory" or "disk") for a live entry, (None, None) otherwise"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return entry[0], "memory"
+                del self._memory[key]
+
+        if self.disk_path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT content, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+            if row is not None:
+                self._remember(key, row[0], row[1])
+                return row[0], "disk"
+        return None, None
+
+    def get(self, key: str) -> Optional[str]:
+        content, level = self._lookup(key)
+        with self._lock:
+            if content is None:
+                self._counts["misses"] += 1
+            else:
+                self._counts["hits"] += 1
+                self._counts[f"{level}_hits"] += 1
+        return content
+
+    def peek(self, key: str) -> Optional[str]:
+        """Look up key without counting a hit or miss, for speculative checks"""
+        return self._lookup(key)[0]
+
+    def put(self, key: str, content: str):
+        created_at = time.time()
+        self._remember(key, content, created_at)
+        with self._lock:
+            self._counts["stores"] += 1
+        if self.disk_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, content, created_at) VALUES (?, ?, ?)",
+                    (key, content, created_at)
+                )
+                conn.execute("DELETE FROM responses WHERE created_at < ?", (created_at - self.ttl,))
+                if self.disk_entries > 0:
+                    conn.execute(
+                        """DELETE FROM responses WHERE key IN (
+                            SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                        )""",
+                        (self.disk_entries,)
+                    )
+
+    def stats(self) -> dict:
+        """Hit, miss and store counts since startup"""
+        with self._lock:
+            return dict(self._counts)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counts)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        if self.disk_path:
+            with self._connect() as conn:
+                stats["disk_entries"] = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return stats
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Build the AI response cache selected by AI_CACHE_BACKEND"""
+    if config.AI_CACHE_BACKEND == "none":
+        return None
+    disk_path = os.path.join(config.DATA_DIR, "ai_cache.db") if config.AI_CACHE_BACKEND == "sqlite" else None
+    if config.AI_CACHE_BACKEND not in ("sqlite", "memory"):
+        raise RuntimeError(f"Unknown AI_CACHE_BACKEND: {config.AI_CACHE_BACKEND}")
+    return ResponseCache(config.AI_CACHE_TTL, config.AI_CACHE_MEMORY_ENTRIES, disk_path, config.AI_CACHE_DISK_ENTRIES)
+
+response_cache = create_response_cache()
 
-写作风格和语调
+# ===================================
+# DeepSeek Rate Governor
+# ===================================
 
-结论和意义"""
-        else:
-            system_prompt = """You are a professional literary analyst. Provide a direct, comprehensive summary of the book.
-Do not use conversational tone. Do not say "Of course", "Certainly", or similar phrases.
-Start directly with the summary content. Use clear paragraph breaks.
-Avoid markdown symbols like ###, **, etc."""
+class TokenBucket:
+    """Async token bucket refilled continuously at rate_per_minute
 
-            user_prompt = f"""Book Title: {request.title}
-Author: {request.author or 'Unknown'}
+    Waiters are served in arrival order. A request larger than the bucket
+    is let through once the bucket is full, leaving it in debt.
+    """
 
-Provide a comprehensive summary of this book based on the following content:
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        async with self._lock:
+            while True:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+class DeepSeekGovernor:
+    """Admission control for outbound DeepSeek calls
+
+    Every call takes a per-model in-flight slot, then a request from the
+    requests/minute bucket and its estimated tokens from the tokens/minute
+    bucket. When the API answers 429, all callers pause for the backoff so
+    the burst that caused it is not repeated. Time spent waiting for
+    admission is recorded as queue wait.
+    """
 
-{request.full_text[:10000]}
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_in_flight: Dict[str, int],
+                 max_retries: int, backoff_base: float, backoff_max: float):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.paused_until = 0.0
+        self._semaphores = {}
+        self.stats = {
+            "requests": 0, "retries": 0, "rate_limited": 0, "server_errors": 0, "failures": 0,
+            "waiting": 0, "in_flight": 0, "queue_wait_seconds_total": 0.0, "queue_wait_seconds_max": 0.0
+        }
 
-The summary should include these sections (separated by paragraphs):
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            limit = self.max_in_flight.get(model, min(self.max_in_flight.values()))
+            self._semaphores[model] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str, tokens: int):
+        """Hold an admitted call slot for model; tokens is the call's estimated size"""
+        started = time.monotonic()
+        admitted = False
+        self.stats["waiting"] += 1
+        try:
+            async with self._semaphore(model):
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                if self.request_bucket is not None:
+                    await self.request_bucket.acquire(1)
+                if self.token_bucket is not None:
+                    await self.token_bucket.acquire(tokens)
+
+                admitted = True
+                waited = time.monotonic() - started
+                self.stats["waiting"] -= 1
+                self.stats["requests"] += 1
+                self.stats["queue_wait_seconds_total"] += waited
+                self.stats["queue_wait_seconds_max"] = max(self.stats["queue_wait_seconds_max"], waited)
+                upstream_queue_wait_seconds.observe(waited, model=model)
+                if waited > 1:
+                    logger.info(f"DeepSeek call for {model} waited {waited:.1f}s for admission")
+
+                self.stats["in_flight"] += 1
+                try:
+                    yield
+                finally:
+                    self.stats["in_flight"] -= 1
+        finally:
+            if not admitted:
+                self.stats["waiting"] -= 1
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None if it should not be retried"""
+        if isinstance(error, openai.RateLimitError):
+            self.stats["rate_limited"] += 1
+        elif isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+            self.stats["server_errors"] += 1
+        elif not isinstance(error, openai.APIConnectionError):
+            return None
+        if attempt >= self.max_retries:
+            self.stats["failures"] += 1
+            return None
+
+        # Full jitter: spread retries over [0, ceiling) so callers don't retry in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        if isinstance(error, openai.RateLimitError):
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.stats["retries"] += 1
+        logger.warning(f"DeepSeek call failed ({error.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        admitted = stats["requests"]
+        stats["queue_wait_seconds_avg"] = stats["queue_wait_seconds_total"] / admitted if admitted else 0.0
+        return stats
+
+deepseek_governor = DeepSeekGovernor(
+    config.DEEPSEEK_REQUESTS_PER_MINUTE,
+    config.DEEPSEEK_TOKENS_PER_MINUTE,
+    config.DEEPSEEK_MAX_IN_FLIGHT,
+    config.DEEPSEEK_MAX_RETRIES,
+    config.DEEPSEEK_BACKOFF_BASE,
+    config.DEEPSEEK_BACKOFF_MAX
+)
 
-Overview and main plot
+# ===================================
+# AI Processing Functions
+# ===================================
 
-Key characters
+# Token usage of the DeepSeek calls made for the current task; None when not tracked
+token_usage = ContextVar("token_usage", default=None)
 
-Major themes
+# Seconds each DeepSeek request of the current task may take once admitted by the governor; None for no limit
+upstream_timeout = ContextVar("upstream_timeout", default=None)
 
-Writing style and tone
+def track_token_usage() -> Dict[str, int]:
+    """Start counting DeepSeek token usage for the current task and return the live totals
 
-Conclusion and significance"""
+    Concurrent calls spawned by the task (e.g. chapter fan-out) add to the
+    same totals, since they inherit the context.
+    """
+    usage = {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    token_usage.set(usage)
+    return usage
+
+def record_token_usage(reported=None, cached: bool = False, model: Optional[str] = None):
+    """Add one call's usage (as reported by the API) to the token metrics and the current task's totals"""
+    if reported is not None and model:
+        upstream_tokens.inc(reported.prompt_tokens or 0, model=model, direction="prompt")
+        upstream_tokens.inc(reported.completion_tokens or 0, model=model, direction="completion")
+    usage = token_usage.get()
+    if usage is None:
+        return
+    usage["calls"] += 1
+    if cached:
+        usage["cached_calls"] += 1
+    if reported is not None:
+        usage["prompt_tokens"] += reported.prompt_tokens or 0
+        usage["completion_tokens"] += reported.completion_tokens or 0
+        usage["total_tokens"] += reported.total_tokens or 0
+
+# Uncached DeepSeek calls in progress, keyed by prompt fingerprint, so identical concurrent calls share one
+completions_in_flight: Dict[str, asyncio.Future] = {}
+
+def completion_content(api_model: str, response, elapsed: float) -> str:
+    """Return the text of a non-streaming completion ("" if there is none) and log the call"""
+    if not response.choices:
+        logger.error("DeepSeek response had no choices model=%s id=%s", api_model, response.id)
+        return ""
+
+    choice = response.choices[0]
+    content = choice.message.content
+    if not content:
+        logger.warning(
+            "DeepSeek returned empty content model=%s id=%s finish_reason=%s", api_model, response.id, choice.finish_reason
+        )
+        return ""
+    if log_sampled():
+        usage = response.usage
+        logger.info(
+            "DeepSeek call model=%s chars=%d prompt_tokens=%s completion_tokens=%s seconds=%.2f",
+            api_model, len(content), usage.prompt_tokens if usage else None,
+            usage.completion_tokens if usage else None, elapsed
+        )
+    logger.debug("DeepSeek response model=%s content=%s", api_model, Preview(content))
+    return content
+
+async def request_completion(api_model: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+    """Send one non-streaming completion through the rate governor, retrying transient failures"""
+    logger.debug(
+        "DeepSeek request model=%s max_tokens=%d temperature=%s messages=%s",
+        api_model, max_tokens, temperature, Preview(messages)
+    )
+
+    estimated_tokens = count_message_tokens(messages) + max_tokens
+    call_started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            async with deepseek_governor.slot(api_model, estimated_tokens):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    # Time spent queued for the slot above does not count against the timeout
+                    response = await asyncio.wait_for(
+                        deepseek_client.chat.completions.create(
+                            model=api_model,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            stream=False
+                        ),
+                        upstream_timeout.get()
+                    )
+                    outcome = "ok"
+                finally:
+                    upstream_request_seconds.observe(
+                        time.perf_counter() - started, model=api_model, endpoint=current_endpoint.get(), outcome=outcome
+                    )
+            break
+        except Exception as e:
+            delay = deepseek_governor.retry_delay(e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    record_token_usage(response.usage, model=api_model)
+    return completion_content(api_model, response, time.perf_counter() - call_started)
+
+async def call_deepseek_api(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.5, model: str = None, cache: bool = True) -> str:
+    """Call DeepSeek API with error handling
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+    Concurrent calls with the same prompt fingerprint are coalesced: the
+    first one goes upstream and the others await its result.
 
-        summary = call_deepseek_api(messages, config.MAX_TOKENS_SUMMARY, config.TEMP_SUMMARY)
+    Args:
+        messages: List of message dicts for the chat
+        max_tokens: Maximum tokens for response
+        temperature: Temperature for response generation
+        model: Optional model override (defaults to config.DEEPSEEK_MODEL)
+        cache: Serve, store and share the response through the response cache and
+            with identical concurrent calls
+    """
+    try:
+        # Use provided model or default from config
+        api_model = model if model else config.DEEPSEEK_MODEL
 
-        return AIResponse(
-            success=True,
-            data={
-                "summary": summary,
-                "book_title": request.title,
-                "generated_at": datetime.now().isoformat()
-            }
+        if not cache:
+            return await request_completion(api_model, messages, max_tokens, temperature)
+
+        cache_key = prompt_fingerprint(api_model, messages, max_tokens, temperature)
+        if response_cache is not None:
+            cached = await run_in_threadpool(response_cache.get, cache_key)
+            if cached is not None:
+                logger.debug("Serving cached DeepSeek response model=%s chars=%d", api_model, len(cached))
+                record_token_usage(cached=True)
+                return cached
+
+        while cache_key in completions_in_flight:
+            future = completions_in_flight[cache_key]
+            logger.debug("Identical DeepSeek request already in flight model=%s - waiting for it", api_model)
+            try:
+                content = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller that owned the request was cancelled; take over if nobody else has
+                continue
+            upstream_coalesced.inc()
+            record_token_usage(cached=True)
+            return content
+
+        future = asyncio.get_running_loop().create_future()
+        completions_in_flight[cache_key] = future
+        try:
+            content = await request_completion(api_model, messages, max_tokens, temperature)
+            if content and response_cache is not None:
+                await run_in_threadpool(response_cache.put, cache_key, content)
+            future.set_result(content)
+            return content
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unawaited future doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            del completions_in_flight[cache_key]
+    except asyncio.TimeoutError:
+        raise  # upstream_timeout expired; gather_bounded reports it as the item's timeout
+    except openai.RateLimitError as e:
+        logger.error(f"DeepSeek API still rate limited after retries: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is busy. Please retry shortly.",
+            headers={"Retry-After": str(int(config.DEEPSEEK_BACKOFF_MAX))}
         )
     except Exception as e:
-        logger.error(f"Error generating book summary: {e}")
-        return AIResponse(success=False, error=str(e))
+        logger.error("DeepSeek API error (%s): %s", type(e).__name__, e)
+        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
-@app.post("/api/chapter-summaries")
-async def generate_chapter_summaries(request: ChapterSummaryRequest):
-    """Generate summaries for individual chapters - using deepseek-chat for faster generation"""
+async def stream_completion(api_model: str, messages: List[Dict], max_tokens: int, temperature: float):
+    """Stream one completion through the rate governor, yielding content deltas ("" for empty chunks)"""
+    logger.debug(
+        "DeepSeek stream request model=%s max_tokens=%d temperature=%s messages=%s",
+        api_model, max_tokens, temperature, Preview(messages)
+    )
+
+    estimated_tokens = count_message_tokens(messages) + max_tokens
+    reported = None
+    streaming = False
+    attempt = 0
+    while True:
+        try:
+            # The slot is held for the whole stream so it counts against the in-flight limit
+            async with deepseek_governor.slot(api_model, estimated_tokens):
+                started = time.perf_counter()
+                outcome = "error"
+                try:
+                    stream = await deepseek_client.chat.completions.create(
+                        model=api_model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                    streaming = True
+
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            reported = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        yield chunk.choices[0].delta.content or ""
+                    outcome = "ok"
+                finally:
+                    upstream_request_seconds.observe(
+                        time.perf_counter() - started, model=api_model, endpoint=current_endpoint.get(), outcome=outcome
+                    )
+            break
+        except Exception as e:
+            # Only a request that never started streaming can be retried
+            delay = None if streaming else deepseek_governor.retry_delay(e, attempt)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    record_token_usage(reported, model=api_model)
+
+async def stream_deepseek_api(messages: List[Dict], max_tokens: int = 1000, temperature: float = 0.5, model: str = None, cache: bool = True):
+    """Stream a DeepSeek completion, yielding content deltas as they arrive
+
+    Chunks that carry no content (e.g. deepseek-reasoner's reasoning phase)
+    yield an empty string so callers can send keep-alives. A cached response
+    is yielded as a single chunk, and a completed stream is stored in the cache.
+    If an identical request is already in flight, its result is awaited and
+    yielded whole instead of starting another completion.
+
+    Args:
+        messages: List of message dicts for the chat
+        max_tokens: Maximum tokens for response
+        temperature: Temperature for response generation
+        model: Optional model override (defaults to config.DEEPSEEK_MODEL)
+        cache: Serve, store and share the response through the response cache and
+            with identical concurrent calls
+    """
+    api_model = model if model else config.DEEPSEEK_MODEL
+
+    if not cache:
+        async for delta in stream_completion(api_model, messages, max_tokens, temperature):
+            yield delta
+        return
+
+    cache_key = prompt_fingerprint(api_model, messages, max_tokens, temperature)
+    if response_cache is not None:
+        cached = await run_in_threadpool(response_cache.get, cache_key)
+        if cached is not None:
+            logger.debug("Serving cached DeepSeek response model=%s chars=%d", api_model, len(cached))
+            record_token_usage(cached=True)
+            yield cached
+            return
+
+    while cache_key in completions_in_flight:
+        future = completions_in_flight[cache_key]
+        logger.debug("Identical DeepSeek request already in flight model=%s - waiting for it", api_model)
+        while not future.done():
+            await asyncio.wait({future}, timeout=config.SSE_HEARTBEAT_INTERVAL)
+            if not future.done():
+                yield ""
+        if future.cancelled():
+            continue
+        content = future.result()
+        upstream_coalesced.inc()
+        record_token_usage(cached=True)
+        yield content
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    completions_in_flight[cache_key] = future
     try:
-        # Debug logging
-        logger.info(f"Chapter summaries request - Language: {request.language}")
-        logger.info(f"Total chapters received: {len(request.chapters)}")
-
-        summaries = []
-
-        # Filter out non-chapter entries
-        def is_actual_chapter(chapter_title):
-            """Check if this is an actual chapter vs metadata pages"""
-            title_lower = chapter_title.lower()
-            # Common non-chapter patterns in both English and Chinese
-            non_chapter_patterns = [
-                # Chinese patterns
-                '书名页', '标题页', '扉页', '赠献页', '献词', '序言', '序', '前言',
-                '目录', '致谢', '后记', '跋', '附录', '版权', '封底',
-                # English patterns
-                'title page', 'dedication', 'preface', 'foreword', 'introduction',
-                'contents', 'table of contents', 'acknowledgments', 'epilogue',
-                'appendix', 'copyright', 'about the author', 'cover'
-            ]
+        parts = []
+        async for delta in stream_completion(api_model, messages, max_tokens, temperature):
+            if delta:
+                parts.append(delta)
+            yield delta
+
+        content = "".join(parts)
+        if log_sampled():
+            logger.info("DeepSeek stream finished model=%s chars=%d", api_model, len(content))
+        if content and response_cache is not None:
+            await run_in_threadpool(response_cache.put, cache_key, content)
+        future.set_result(content)
+    except (asyncio.CancelledError, GeneratorExit):
+        # The listener went away; anyone waiting on this stream starts their own
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Retrieve the exception so an unawaited future doesn't log a warning
+        future.exception()
+        raise
+    finally:
+        del completions_in_flight[cache_key]
+
+def sse_event(payload: dict) -> str:
+    """Format a payload as one Server-Sent Events message"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+async def sse_completion(messages: List[Dict], max_tokens: int, temperature: float, cache: bool = True,
+                         done_data: Optional[Dict] = None, send_start: bool = True, usage: Optional[Dict] = None):
+    """Relay a streamed completion as Server-Sent Events
+
+    Emits a "start" event immediately (unless send_start is False because the
+    caller already sent one), a "token" event per content delta, and a final
+    "done" event carrying the full text, token usage and done_data (or an
+    "error" event). Keep-alive comments are sent while the model is still
+    reasoning. Pass usage to continue totals the caller is already tracking.
+    """
+    if send_start:
+        yield sse_event({"type": "start"})
+    if usage is None:
+        usage = track_token_usage()
+    else:
+        token_usage.set(usage)
+    parts = []
+    last_heartbeat = time.monotonic()
+    try:
+        async for delta in stream_deepseek_api(messages, max_tokens, temperature, cache=cache):
+            if delta:
+                parts.append(delta)
+                yield sse_event({"type": "token", "content": delta})
+            elif time.monotonic() - last_heartbeat >= config.SSE_HEARTBEAT_INTERVAL:
+                last_heartbeat = time.monotonic()
+                yield ": thinking\n\n"
+
+        yield sse_event({
+            "type": "done",
+            "content": "".join(parts),
+            "generated_at": datetime.now().isoformat(),
+            "usage": usage,
+            **(done_data or {})
+        })
+    except Exception as e:
+        logger.error("DeepSeek streaming error (%s): %s", type(e).__name__, e)
+        yield sse_event({"type": "error", "error": f"AI service error: {str(e)}"})
+
+def event_stream_response(events) -> StreamingResponse:
+    """Wrap an SSE generator in a response that proxies won't buffer"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def gather_bounded(items: List, worker, max_concurrency: int, timeout: float, on_result=None) -> List:
+    """Run worker(item) for every item with at most max_concurrency calls in flight
 
-            # Check if title matches non-chapter patterns
-            for pattern in non_chapter_patterns:
-                if pattern in title_lower:
-                    logger.info(f"Skipping non-chapter: {chapter_title}")
-                    return False
+    Args:
+        items: Inputs to process
+        worker: Async callable applied to each item
+        max_concurrency: Maximum number of workers running at once
+        timeout: Seconds allowed for each DeepSeek request an item makes, once
+            the rate governor has admitted it; waiting for admission is not timed
+        on_result: Optional callback(index, result) invoked as each item finishes
+
+    Returns:
+        Results in the same order as items; an item that failed or timed out
+        yields its exception instead of a result.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
 
-            # Check if it's a numbered chapter (1, 2, 3... or Chapter 1, etc.)
-            import re
-            if re.match(r'^(chapter\s+)?\d+$|^第?\d+章?$', title_lower):
-                return True
+    async def run(index, item):
+        async with semaphore:
+            upstream_timeout.set(timeout)
+            try:
+                result = await worker(item)
+            except Exception as e:
+                result = e
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    return await asyncio.gather(*(run(index, item) for index, item in enumerate(items)))
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens (estimated), ending at a line break where one is close"""
+    if max_tokens <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = len(text) * max_tokens // tokens
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = cut * 9 // 10
+    newline = text.rfind("\n", cut * 4 // 5, cut)
+    return text[:newline if newline != -1 else cut]
+
+def count_message_tokens(messages: List[Dict]) -> int:
+    """Estimate the prompt tokens of a chat message list, including per-message overhead"""
+    return sum(estimate_tokens(message['content']) + 4 for message in messages) + 2
+
+def prompt_budget(model: str, max_tokens: int, cap: Optional[int] = None) -> int:
+    """Prompt tokens available to model after reserving max_tokens for the reply"""
+    context = config.MODEL_CONTEXT_TOKENS.get(model, min(config.MODEL_CONTEXT_TOKENS.values()))
+    budget = context - max_tokens - config.PROMPT_SAFETY_TOKENS
+    return min(budget, cap) if cap else budget
+
+def fill_prompt(build, content: str, model: str, max_tokens: int, cap: Optional[int] = None) -> List[Dict]:
+    """Build a prompt holding as much of content as fits its token budget
 
-            # If title is very short and not a number, it might be metadata
-            if len(chapter_title.strip()) < 2:
-                return False
+    Args:
+        build: Callable(content) returning the chat messages
+        content: The variable part of the prompt (book or chapter text)
+        model: Model the prompt is sent to
+        max_tokens: Tokens reserved for the reply
+        cap: Optional feature limit below the model's context window
+    """
+    budget = prompt_budget(model, max_tokens, cap)
+    room = budget - count_message_tokens(build(""))
+    fitted = truncate_to_tokens(content, room)
+    if len(fitted) < len(content):
+        logger.debug("Prompt content cut from %d to %d chars to fit %d-token budget", len(content), len(fitted), budget)
+    return build(fitted)
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """Split text into pieces of at most max_tokens, breaking between lines where possible"""
+    pieces = []
+    current = []
+    current_tokens = 0
+    for line in text.split("\n"):
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            # A single oversized line (e.g. unbroken CJK text) is cut by characters
+            step = max(1, len(line) * max_tokens // line_tokens)
+            segments = [line[i:i + step] for i in range(0, len(line), step)]
+        else:
+            segments = [line]
+        for segment in segments:
+            segment_tokens = estimate_tokens(segment)
+            if current and current_tokens + segment_tokens > max_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(segment)
+            current_tokens += segment_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return [piece for piece in pieces if piece.strip()]
 
-            return True
+# ===================================
+# Chapter Summary Helpers
+# ===================================
 
-        # Language-specific prompts - DIRECT, NO CONVERSATIONAL TONE
-        if request.language == "zh":
-            system_prompt = """你是章节摘要专家。
+def build_chapter_summary_messages(book_title: str, chapter_title: str, chapter_content: str, language: str) -> List[Dict]:
+    """Build the chat messages used to summarize a single chapter"""
+    # Language-specific prompts - DIRECT, NO CONVERSATIONAL TONE
+    if language == "zh":
+        system_prompt = """你是章节摘要专家。
             直接提供清晰、简洁的摘要，字数不超过三百字。
             不要使用对话语气。
             避免使用markdown符号。"""
-        else:
-            system_prompt = """You are an expert at summarizing book chapters.
-            Provide direct, clear, concise summaries, and the word count should not exceed 300 words.
-            Do not use conversational tone.
-            Avoid markdown symbols."""
 
-        # Process only actual chapters, limit to 25
-        actual_chapters = [ch for ch in request.chapters if is_actual_chapter(ch.get('title', ''))]
-        logger.info(f"Actual chapters to process: {len(actual_chapters)}")
-
-        for chapter in actual_chapters[:25]:  # Limit to first 25 actual chapters
-            # Extract chapter content with fallback handling
-            chapter_content = chapter.get('content', chapter.get('text', ''))
-
-            # Log chapter details
-            logger.info(f"Processing chapter: '{chapter.get('title', 'Unknown')}' - Content length: {len(chapter_content) if chapter_content else 0}")
-
-            # Log if content is empty
-            if not chapter_content or len(chapter_content.strip()) < 25:
-                logger.warning(f"Chapter '{chapter.get('title', 'Unknown')}' has no or minimal content - skipping")
-                # Add placeholder for empty chapters
-                summaries.append({
-                    "chapter_title": chapter.get('title', 'Unknown'),
-                    "summary": ""  # Empty summary for chapters without content
-                })
-                continue
-
-            if request.language == "zh":
-                user_prompt = f"""书籍：{request.book_title}
-章节：{chapter['title']}
+        user_prompt = f"""书籍：{book_title}
+章节：{chapter_title}
 
 内容：
-{chapter_content[:3000]}
+{chapter_content}
 
 直接提供这一章的摘要，包括：
 主要事件
 角色发展
 关键揭示或情节要点
 与整体叙述的联系"""
-            else:
-                user_prompt = f"""Book: {request.book_title}
-Chapter: {chapter['title']}
+    else:
+        system_prompt = """You are an expert at summarizing book chapters.
+            Provide direct, clear, concise summaries, and the word count should not exceed 300 words.
+            Do not use conversational tone.
+            Avoid markdown symbols."""
+
+        user_prompt = f"""Book: {book_title}
+Chapter: {chapter_title}
 
 Content:
-{chapter_content[:3000]}
+{chapter_content}
 
 Directly provide a summary of this chapter including:
 Main events
@@ -527,81 +1644,391 @@ Character developments
 Key revelations or plot points
 Connection to overall narrative"""
 
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
 
-            try:
-                # Use deepseek-chat model specifically for chapter summaries (faster)
-                summary = call_deepseek_api(messages, config.MAX_TOKENS_CHAPTER, config.TEMP_SUMMARY, model="deepseek-chat")
-
-                # Check if summary is valid
-                if not summary or len(summary.strip()) < 10:
-                    logger.warning(f"Empty or very short summary returned for chapter: {chapter['title']}")
-                    logger.warning(f"Summary content: '{summary}'")
-                    # Try with a simpler prompt
-                    if request.language == "zh":
-                        simple_prompt = f"请用一段话总结这一章的主要内容：\n\n{chapter_content[:1500]}"
-                    else:
-                        simple_prompt = f"Please summarize this chapter in one paragraph:\n\n{chapter_content[:1500]}"
-
-                    messages_simple = [
-                        {"role": "system", "content": "You are a book summarizer. Provide a brief summary."},
-                        {"role": "user", "content": simple_prompt}
-                    ]
-
-                    summary = call_deepseek_api(messages_simple, config.MAX_TOKENS_CHAPTER, 0.5, model="deepseek-chat")
-                    logger.info(f"Retry with simple prompt for chapter: {chapter['title']}")
-
-                # Log success
-                logger.info(f"Generated summary for chapter: {chapter['title']} - Length: {len(summary) if summary else 0}")
-
-            except Exception as api_error:
-                logger.error(f"Failed to generate summary for chapter '{chapter['title']}': {api_error}")
-                summary = ""
-
-            # Only add non-empty summaries
-            if summary and summary.strip():
-                summaries.append({
-                    "chapter_title": chapter['title'],
-                    "summary": summary.strip()
-                })
-            else:
-                logger.warning(f"Skipping chapter '{chapter['title']}' due to empty summary")
+def chapter_summary_messages(book_title: str, chapter: Dict[str, str], language: str) -> List[Dict]:
+    """Chapter summary prompt holding as much of the chapter as CHAPTER_PROMPT_TOKENS allows"""
+    chapter_content = chapter.get('content', chapter.get('text', ''))
+    return fill_prompt(
+        lambda content: build_chapter_summary_messages(book_title, chapter.get('title', ''), content, language),
+        chapter_content, "deepseek-chat", config.MAX_TOKENS_CHAPTER, config.CHAPTER_PROMPT_TOKENS
+    )
 
-        # Log final results
-        logger.info(f"Total summaries generated: {len(summaries)}")
+async def summarize_chapter(book_title: str, chapter: Dict[str, str], language: str) -> str:
+    """Summarize one chapter, retrying once with a simpler prompt on an empty result
 
-        if len(summaries) == 0:
-            logger.warning("No summaries were generated - all chapters may have been filtered out or had no content")
+    Uses the deepseek-chat model, which is much faster than the reasoner for
+    short per-chapter summaries.
+    """
+    chapter_title = chapter['title']
+    chapter_content = chapter.get('content', chapter.get('text', ''))
+    messages = chapter_summary_messages(book_title, chapter, language)
+
+    summary = await call_deepseek_api(messages, config.MAX_TOKENS_CHAPTER, config.TEMP_SUMMARY, model="deepseek-chat")
+
+    # Check if summary is valid
+    if not summary or len(summary.strip()) < 10:
+        logger.warning("Empty or very short summary returned for chapter %r: %s", chapter_title, Preview(summary))
+        # Try with a simpler prompt over a shorter excerpt
+        def build_simple(content):
+            if language == "zh":
+                simple_prompt = f"请用一段话总结这一章的主要内容：\n\n{content}"
+            else:
+                simple_prompt = f"Please summarize this chapter in one paragraph:\n\n{content}"
+            return [
+                {"role": "system", "content": "You are a book summarizer. Provide a brief summary."},
+                {"role": "user", "content": simple_prompt}
+            ]
 
-        return AIResponse(
-            success=True,
-            data={
-                "book_title": request.book_title,
-                "chapter_summaries": summaries,
-                "generated_at": datetime.now().isoformat()
-            }
+        messages_simple = fill_prompt(
+            build_simple, chapter_content, "deepseek-chat", config.MAX_TOKENS_CHAPTER, config.CHAPTER_PROMPT_TOKENS // 2
         )
-    except Exception as e:
-        logger.error(f"Error generating chapter summaries: {e}")
-        return AIResponse(success=False, error=str(e))
 
-@app.post("/api/content-analysis")
-async def analyze_content(request: ContentAnalysisRequest):
-    """Perform deep content analysis"""
-    try:
-        # Debug logging
-        logger.info(f"Content analysis request - Language: {request.language}")
+        summary = await call_deepseek_api(messages_simple, config.MAX_TOKENS_CHAPTER, 0.5, model="deepseek-chat")
+        logger.info("Retried chapter %r with simple prompt", chapter_title)
 
-        # Language-specific prompts with structured format - DIRECT, NO CONVERSATIONAL TONE
-        if request.language == "zh":
-            system_prompt = """你是专业的文学评论家。
-            直接提供学术级别的文本分析。
-            不要使用对话语气，不要说"当然"、"好的"等词语。
+    logger.debug("Generated summary for chapter %r chars=%d", chapter_title, len(summary) if summary else 0)
+    return summary
 
-            格式规则：
+def cached_chapter_summary(book_title: str, chapter: Dict[str, str], language: str) -> Optional[str]:
+    """Return the cached summarize_chapter result for a chapter, if there is one"""
+    if response_cache is None:
+        return None
+    messages = chapter_summary_messages(book_title, chapter, language)
+    key = prompt_fingerprint("deepseek-chat", messages, config.MAX_TOKENS_CHAPTER, config.TEMP_SUMMARY)
+    # A peek: on a miss the chapter is summarized through other prompts, so this lookup is not a cache miss
+    return response_cache.peek(key)
+
+def select_summary_chapters(chapters: List[Dict[str, str]], stats: Optional[List[Dict]] = None) -> List[Dict[str, str]]:
+    """Pick the chapters worth summarizing: actual chapters only, limited to 25
+
+    stats are the stored artifacts of the chapters, when they came from a
+    stored book; their precomputed is_chapter flags are used instead of
+    classifying the titles again.
+    """
+    if stats is not None:
+        actual_chapters = [ch for ch, stat in zip(chapters, stats) if stat['is_chapter']]
+    else:
+        actual_chapters = [ch for ch in chapters if is_actual_chapter(ch.get('title', ''))]
+    logger.info("Actual chapters to process: %d of %d", len(actual_chapters), len(chapters))
+    return actual_chapters[:25]  # Limit to first 25 actual chapters
+
+async def summarize_chapters(book_title: str, chapters: List[Dict[str, str]], language: str, on_entry=None) -> List[Optional[Dict]]:
+    """Summarize chapters concurrently, bounded by CHAPTER_SUMMARY_CONCURRENCY
+
+    Args:
+        book_title: Title of the book the chapters belong to
+        chapters: Chapters to summarize, in reading order
+        language: Output language ("en" or "zh")
+        on_entry: Optional callback(index, entry) invoked as each chapter finishes
+
+    Returns:
+        One entry per chapter in reading order. Entries are dicts with
+        chapter_title and summary; chapters without usable content get an
+        empty summary, and chapters whose generation failed yield None.
+    """
+    async def summarize(chapter):
+        chapter_content = chapter.get('content', chapter.get('text', ''))
+        logger.debug("Processing chapter %r chars=%d", chapter.get('title', 'Unknown'), len(chapter_content) if chapter_content else 0)
+        if not chapter_content or len(chapter_content.strip()) < 25:
+            # Chapters without usable content are never sent to the API
+            logger.warning("Chapter %r has no or minimal content - skipping", chapter.get('title', 'Unknown'))
+            return None
+        return await summarize_chapter(book_title, chapter, language)
+
+    def to_entry(chapter, result) -> Optional[Dict]:
+        if result is None:
+            # Add placeholder for empty chapters
+            return {
+                "chapter_title": chapter.get('title', 'Unknown'),
+                "summary": ""  # Empty summary for chapters without content
+            }
+        if isinstance(result, asyncio.TimeoutError):
+            logger.error(f"Timed out generating summary for chapter '{chapter['title']}' after {config.CHAPTER_SUMMARY_TIMEOUT}s")
+            return None
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to generate summary for chapter '{chapter['title']}': {result}")
+            return None
+        if not result.strip():
+            logger.warning(f"Skipping chapter '{chapter['title']}' due to empty summary")
+            return None
+        return {
+            "chapter_title": chapter['title'],
+            "summary": result.strip()
+        }
+
+    entries = [None] * len(chapters)
+
+    def report(index, result):
+        entries[index] = to_entry(chapters[index], result)
+        if on_entry is not None:
+            on_entry(index, entries[index])
+
+    await gather_bounded(
+        chapters, summarize, config.CHAPTER_SUMMARY_CONCURRENCY, config.CHAPTER_SUMMARY_TIMEOUT, on_result=report
+    )
+    return entries
+
+class ChapterSummaryJob:
+    """Chapter summaries generated in the background and streamed to any number of listeners
+
+    The job keeps running if a client disconnects, so the client can reconnect
+    with the job id and receive only the chapters it has not seen yet.
+    """
+
+    def __init__(self, job_id: str, book_title: str, chapters: List[Dict[str, str]], language: str):
+        self.id = job_id
+        self.book_title = book_title
+        self.chapters = chapters
+        self.language = language
+        self.entries: Dict[int, Optional[Dict]] = {}
+        self.done = False
+        self.error = None
+        self.finished_at = None
+        self._changed = asyncio.Event()
+        self._task = None
+
+    @classmethod
+    def finished(cls, job_id: str, book_title: str, entries: List[Dict], language: str) -> "ChapterSummaryJob":
+        """A job that is already done, replaying stored summaries"""
+        job = cls(job_id, book_title, [{'title': entry['chapter_title']} for entry in entries], language)
+        job.entries = dict(enumerate(entries))
+        job.done = True
+        job.finished_at = time.time()
+        return job
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            await summarize_chapters(self.book_title, self.chapters, self.language, on_entry=self._record)
+        except Exception as e:
+            logger.error(f"Chapter summary job {self.id} failed: {e}")
+            self.error = str(e)
+        finally:
+            self.done = True
+            self.finished_at = time.time()
+            self._notify()
+
+    @property
+    def succeeded(self) -> bool:
+        """Whether the job finished with a summary for every chapter"""
+        return self.done and not self.error and len(self.entries) == len(self.chapters) \
+            and all(entry is not None for entry in self.entries.values())
+
+    def _record(self, index: int, entry: Optional[Dict]):
+        self.entries[index] = entry
+        self._notify()
+
+    def _notify(self):
+        # Wake every current listener, then start a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def updates(self, have=()):
+        """Yield (index, entry) for every finished chapter not in have, waiting for more until the job ends"""
+        sent = set(have)
+        while True:
+            changed = self._changed
+            for index in sorted(self.entries):
+                if index not in sent:
+                    sent.add(index)
+                    yield index, self.entries[index]
+            if self.done:
+                return
+            await changed.wait()
+
+# Running and recently finished chapter summary jobs, keyed by job id
+chapter_summary_jobs: Dict[str, ChapterSummaryJob] = {}
+
+def get_or_start_chapter_summary_job(book_title: str, chapters: List[Dict[str, str]], language: str) -> ChapterSummaryJob:
+    """Start a chapter summary job, or reattach to an identical one still retained
+
+    Only running jobs and jobs that fully succeeded are reused; after any
+    failure a new job is started, so a retry calls the API again.
+    """
+    now = time.time()
+    for job_id, job in list(chapter_summary_jobs.items()):
+        if job.done and now - job.finished_at > config.CHAPTER_JOB_RETENTION:
+            del chapter_summary_jobs[job_id]
+
+    fingerprint = json.dumps(
+        {"book_title": book_title, "language": language,
+         "chapters": [[ch.get('title', ''), ch.get('content', ch.get('text', ''))] for ch in chapters]},
+        ensure_ascii=False, sort_keys=True
+    )
+    job_id = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32]
+
+    job = chapter_summary_jobs.get(job_id)
+    if job is None or (job.done and not job.succeeded):
+        job = ChapterSummaryJob(job_id, book_title, chapters, language)
+        chapter_summary_jobs[job_id] = job
+        job.start()
+    return job
+
+async def chapter_summary_job_events(job: ChapterSummaryJob, have=()):
+    """Relay a chapter summary job as Server-Sent Events
+
+    Emits a "job" event with the job id and chapter titles, a "chapter" event
+    per finished chapter (with its index), and a final "done" event.
+    """
+    yield sse_event({
+        "type": "job",
+        "job_id": job.id,
+        "total": len(job.chapters),
+        "chapter_titles": [ch.get('title', 'Unknown') for ch in job.chapters]
+    })
+    async for index, entry in job.updates(have):
+        yield sse_event({
+            "type": "chapter",
+            "index": index,
+            "chapter_title": job.chapters[index].get('title', 'Unknown'),
+            "summary": entry["summary"] if entry else "",
+            "failed": entry is None
+        })
+    yield sse_event({
+        "type": "done",
+        "job_id": job.id,
+        "completed": len(job.entries),
+        "error": job.error,
+        "generated_at": datetime.now().isoformat()
+    })
+
+# ===================================
+# Pydantic Models
+# ===================================
+
+# AI requests can name an uploaded book by book_id instead of sending its text;
+# fields left empty are then filled in from the stored book by resolve_book_reference
+
+class BookContent(BaseModel):
+    title: Optional[str] = None  # Required unless book_id is given
+    author: Optional[str] = None
+    full_text: Optional[str] = None  # Not needed when chapters are given
+    chapters: Optional[List[Dict[str, str]]] = None
+    book_id: Optional[str] = None  # Summarize a stored book without sending its text
+    language: Optional[str] = "en"  # Add language parameter
+    _chapter_stats: Optional[List[Dict]] = PrivateAttr(default=None)  # Set by resolve_book_reference
+
+class ChapterSummaryRequest(BaseModel):
+    book_title: Optional[str] = None  # Required unless book_id is given
+    chapters: Optional[List[Dict[str, str]]] = None  # Required unless book_id is given
+    book_id: Optional[str] = None
+    chapter_ids: Optional[List[str]] = None  # With book_id, only these chapters (ids from the book manifest)
+    language: Optional[str] = "en"  # Add language parameter
+    _chapter_stats: Optional[List[Dict]] = PrivateAttr(default=None)  # Set by resolve_book_reference
+
+class ContentAnalysisRequest(BaseModel):
+    book_title: Optional[str] = None  # Required unless book_id is given
+    content: Optional[str] = None  # Required unless book_id is given
+    book_id: Optional[str] = None
+    chapter_ids: Optional[List[str]] = None  # With book_id, analyze only these chapters
+    analysis_type: Optional[str] = "comprehensive"
+    language: Optional[str] = "en"  # Add language parameter
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+class ChatRequest(BaseModel):
+    messages: List[ChatMessage]
+    book_context: Optional[Dict[str, str]] = None
+    book_id: Optional[str] = None  # Same as book_context["book_id"]; fills in the book's title and author
+    language: Optional[str] = "en"  # Add language parameter
+
+class JobRequest(BaseModel):
+    kind: str  # "book_summary", "chapter_summaries" or "content_analysis"
+    payload: Dict  # Body of the matching synchronous endpoint
+    priority: Optional[int] = 5  # Lower values run first
+
+class BookArtifactsRequest(BaseModel):
+    book_id: str
+    summary_languages: Optional[List[str]] = None  # Languages to precompute chapter summaries in
+
+class BatchIngestRequest(BaseModel):
+    paths: List[str]  # EPUB files or directories (searched recursively), relative to BATCH_INPUT_DIR
+    operations: Optional[List[str]] = None  # Subset of BATCH_OPERATIONS, all of them by default
+    language: Optional[str] = "en"
+
+class AIResponse(BaseModel):
+    success: bool
+    data: Optional[Dict] = None
+    error: Optional[str] = None
+
+# ===================================
+# Prompt Builders
+# ===================================
+
+def build_book_summary_messages(request: BookContent, book_text: str) -> List[Dict]:
+    """Build the chat messages for a whole-book summary of book_text"""
+    # Language-specific prompts - DIRECT, NO CONVERSATIONAL TONE
+    if request.language == "zh":
+        system_prompt = """你是一位专业的文学分析专家。直接提供书籍的全面摘要。
+不要使用对话语气，不要说"当然"、"好的"等词语。
+直接开始摘要内容。使用清晰的段落分隔。
+避免使用markdown符号如###、**等。"""
+
+        user_prompt = f"""书名：{request.title}
+作者：{request.author or '未知'}
+
+基于以下内容提供这本书的全面摘要：
+
+{book_text}
+
+摘要应包含以下部分（用段落分隔）：
+
+概述和主要情节
+
+关键角色
+
+主要主题
+
+写作风格和语调
+
+结论和意义"""
+    else:
+        system_prompt = """You are a professional literary analyst. Provide a direct, comprehensive summary of the book.
+Do not use conversational tone. Do not say "Of course", "Certainly", or similar phrases.
+Start directly with the summary content. Use clear paragraph breaks.
+Avoid markdown symbols like ###, **, etc."""
+
+        user_prompt = f"""Book Title: {request.title}
+Author: {request.author or 'Unknown'}
+
+Provide a comprehensive summary of this book based on the following content:
+
+{book_text}
+
+The summary should include these sections (separated by paragraphs):
+
+Overview and main plot
+
+Key characters
+
+Major themes
+
+Writing style and tone
+
+Conclusion and significance"""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def build_content_analysis_messages(request: ContentAnalysisRequest, content: str) -> List[Dict]:
+    """Build the chat messages for a structured literary analysis of content"""
+    # Language-specific prompts with structured format - DIRECT, NO CONVERSATIONAL TONE
+    if request.language == "zh":
+        system_prompt = """你是专业的文学评论家。
+            直接提供学术级别的文本分析。
+            不要使用对话语气，不要说"当然"、"好的"等词语。
+
+            格式规则：
             - 使用清晰、自然的语言
             - 用 ## 来标记章节标题
             - 使用编号列表（1. 2. 3.）
@@ -609,10 +2036,10 @@ async def analyze_content(request: ContentAnalysisRequest):
             - 避免特殊字符如【】或—
             - 专业但易读的语气"""
 
-            user_prompt = f"""书籍：{request.book_title}
+        user_prompt = f"""书籍：{request.book_title}
 
 分析内容：
-{request.content[:10000]}
+{content}
 
 直接提供以下结构化部分的文学分析：
 
@@ -633,8 +2060,8 @@ async def analyze_content(request: ContentAnalysisRequest):
 
 ## 历史文化背景
 如相关，讨论历史和文化背景及影响。"""
-        else:
-            system_prompt = """You are a professional literary critic.
+    else:
+        system_prompt = """You are a professional literary critic.
             Provide direct, academic-level analysis of the text.
             Do not use conversational tone. Do not say "Of course", "Certainly", or similar phrases.
 
@@ -646,10 +2073,10 @@ async def analyze_content(request: ContentAnalysisRequest):
             - Avoid special characters like 【】or —
             - Professional yet readable tone"""
 
-            user_prompt = f"""Book: {request.book_title}
+        user_prompt = f"""Book: {request.book_title}
 
 Content for analysis:
-{request.content[:10000]}
+{content}
 
 Directly provide literary analysis with these structured sections:
 
@@ -671,37 +2098,68 @@ Identify and analyze symbols, metaphors, and other literary devices.
 ## Historical and Cultural Context
 If relevant, discuss historical and cultural context and influence."""
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
 
-        analysis = call_deepseek_api(messages, config.MAX_TOKENS_ANALYSIS, config.TEMP_ANALYSIS)
+def format_passages(passages: List[Dict], language: str) -> str:
+    """Render retrieved passages as a block to append to a system prompt"""
+    if not passages:
+        return ""
+    blocks = "\n\n".join(f"[{passage['chapter_title']}]\n{passage['text']}" for passage in passages)
+    if language == "zh":
+        return f"""
 
-        return AIResponse(
-            success=True,
-            data={
-                "analysis_type": request.analysis_type,
-                "analysis": analysis,
-                "book_title": request.book_title,
-                "generated_at": datetime.now().isoformat()
-            }
-        )
-    except Exception as e:
-        logger.error(f"Error analyzing content: {e}")
-        return AIResponse(success=False, error=str(e))
+书中可能与问题相关的段落：
 
-@app.post("/api/chat")
-async def chat_with_assistant(request: ChatRequest):
-    """Interactive chat about the book - supports multi-turn conversation"""
-    try:
-        messages = []
+{blocks}
+
+回答时请以这些段落为依据。如果段落没有涉及该问题，请如实说明，不要猜测。"""
+    return f"""
+
+Passages from the book that may be relevant to the question:
+
+{blocks}
+
+Ground your answer in these passages. If they do not cover the question, say so rather than guessing."""
+
+def trim_chat_history(history: List[Dict], max_tokens: int) -> List[Dict]:
+    """Keep the most recent chat messages that fit in max_tokens
 
-        # Language-specific system prompts
-        if request.language == "zh":
-            # Add system prompt with book context if available
-            if request.book_context:
-                system_prompt = f"""你是一位知识渊博的阅读助手，正在帮助讨论《{request.book_context.get('title', '未知')}》这本书。
+    Older turns are dropped first. The latest message is always kept, cut
+    down if it alone exceeds the budget; raises 413 if nothing of it would
+    be left.
+    """
+    kept = []
+    used = 2
+    for message in reversed(history):
+        tokens = estimate_tokens(message['content']) + 4
+        if used + tokens > max_tokens:
+            if not kept:
+                content = truncate_to_tokens(message['content'], max_tokens - used - 4)
+                if not content.strip():
+                    raise HTTPException(status_code=413, detail="The latest message does not fit in the chat prompt")
+                kept.append({**message, "content": content})
+            break
+        kept.append(message)
+        used += tokens
+    if len(kept) < len(history):
+        logger.debug("Chat history trimmed from %d to %d messages to fit %d tokens", len(history), len(kept), max_tokens)
+    return kept[::-1]
+
+def build_chat_messages(request: ChatRequest, passages: Optional[List[Dict]] = None) -> List[Dict]:
+    """Build the system prompt plus conversation history for the reading assistant
+
+    Retrieved book passages, if any, are appended to the system prompt.
+    """
+    messages = []
+
+    # Language-specific system prompts
+    if request.language == "zh":
+        # Add system prompt with book context if available
+        if request.book_context:
+            system_prompt = f"""你是一位知识渊博的阅读助手，正在帮助讨论《{request.book_context.get('title', '未知')}》这本书。
             你对文学有深入的理解，可以讨论主题、角色、情节要点并提供见解。
 
             重要的沟通风格：
@@ -714,8 +2172,8 @@ async def chat_with_assistant(request: ChatRequest):
             - 保持吸引力并鼓励对文本的深入思考
 
             当前上下文：用户正在阅读"{request.book_context.get('current_chapter', '这本书')}"。"""
-            else:
-                system_prompt = """你是一位知识渊博的阅读助手。
+        else:
+            system_prompt = """你是一位知识渊博的阅读助手。
             帮助用户理解和讨论书籍、文学和阅读。
 
             重要的沟通风格：
@@ -726,10 +2184,10 @@ async def chat_with_assistant(request: ChatRequest):
             - 不要在回复中使用【】、—或###等字符
             - 写作时就像在进行友好、智慧的对话
             - 保持帮助性、吸引力并鼓励对文本的深入思考。"""
-        else:
-            # Add system prompt with book context if available
-            if request.book_context:
-                system_prompt = f"""You are a knowledgeable reading assistant helping discuss the book "{request.book_context.get('title', 'Unknown')}".
+    else:
+        # Add system prompt with book context if available
+        if request.book_context:
+            system_prompt = f"""You are a knowledgeable reading assistant helping discuss the book "{request.book_context.get('title', 'Unknown')}".
             You have deep understanding of literature and can discuss themes, characters, plot points, and provide insights.
 
             IMPORTANT communication style:
@@ -742,8 +2200,8 @@ async def chat_with_assistant(request: ChatRequest):
             - Be engaging and encourage deeper thinking about the text
 
             Current context: The user is reading "{request.book_context.get('current_chapter', 'the book')}"."""
-            else:
-                system_prompt = """You are a knowledgeable reading assistant.
+        else:
+            system_prompt = """You are a knowledgeable reading assistant.
             Help users understand and discuss books, literature, and reading in general.
 
             IMPORTANT communication style:
@@ -755,22 +2213,1286 @@ async def chat_with_assistant(request: ChatRequest):
             - Write as if you're having a friendly, intelligent conversation
             - Be helpful, engaging, and encourage deeper thinking about texts."""
 
-        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "system", "content": system_prompt + format_passages(passages, request.language)})
+
+    # Add as much recent conversation history as the chat budget allows
+    budget = prompt_budget(config.DEEPSEEK_MODEL, config.MAX_TOKENS_CHAT, config.CHAT_PROMPT_TOKENS)
+    history = [{"role": msg.role, "content": msg.content} for msg in request.messages]
+    messages.extend(trim_chat_history(history, budget - count_message_tokens(messages)))
+
+    return messages
+
+# ===================================
+# Book Summary Map-Reduce
+# ===================================
+
+def build_summary_part_messages(book_title: str, part_text: str, part_number: int, part_count: int, language: str) -> List[Dict]:
+    """Build the chat messages that summarize one part of a long book (the map step)"""
+    if language == "zh":
+        system_prompt = """你正在为一本长篇书籍的其中一部分写摘要，这些摘要之后会合并成全书摘要。
+直接提供简洁的摘要，涵盖主要事件、人物和主题。
+不要使用对话语气。
+避免使用markdown符号。"""
+
+        user_prompt = f"""书籍：{book_title}
+部分：第{part_number}部分，共{part_count}部分
+
+内容：
+{part_text}
 
-        # Add conversation history
-        for msg in request.messages:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
+直接提供这一部分的摘要。"""
+    else:
+        system_prompt = """You are summarizing one part of a long book; the part summaries will later be combined into a summary of the whole book.
+Provide a direct, concise summary covering the main events, characters and themes.
+Do not use conversational tone.
+Avoid markdown symbols."""
+
+        user_prompt = f"""Book: {book_title}
+Part: {part_number} of {part_count}
+
+Content:
+{part_text}
+
+Directly provide a summary of this part."""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def build_summary_merge_messages(book_title: str, summaries_text: str, language: str) -> List[Dict]:
+    """Build the chat messages that condense consecutive part summaries into one (an intermediate reduce step)"""
+    if language == "zh":
+        system_prompt = """你将一本书中连续几部分的摘要合并为一段更简洁的摘要。
+按原有顺序保留主要事件、人物发展和主题。
+不要使用对话语气。
+避免使用markdown符号。"""
+
+        user_prompt = f"""书籍：{book_title}
+
+各部分摘要（按阅读顺序）：
+{summaries_text}
+
+直接提供合并后的摘要。"""
+    else:
+        system_prompt = """You combine the summaries of consecutive parts of a book into one shorter summary.
+Keep the main events, character developments and themes, in their original order.
+Do not use conversational tone.
+Avoid markdown symbols."""
+
+        user_prompt = f"""Book: {book_title}
+
+Part summaries, in reading order:
+{summaries_text}
+
+Directly provide the combined summary."""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def book_sections(request: BookContent) -> List[Dict]:
+    """The book's text as titled sections with token counts: its chapters when given, otherwise full_text
+
+    Token counts of chapters filled in from a stored book come from its artifacts.
+    """
+    chapters = request.chapters or []
+    stats = request._chapter_stats or [None] * len(chapters)
+    sections = []
+    for ch, stat in zip(chapters, stats):
+        content = ch.get('content', ch.get('text', ''))
+        if content.strip():
+            tokens = stat['tokens'] if stat is not None else estimate_tokens(content)
+            sections.append({'title': ch.get('title', ''), 'content': content, 'tokens': tokens})
+    if not sections and request.full_text:
+        sections = [{'title': '', 'content': request.full_text, 'tokens': estimate_tokens(request.full_text)}]
+    return sections
+
+def summary_note(titles: List[str], summary: str) -> str:
+    """Label a partial summary with the chapters it covers"""
+    titles = [title for title in titles if title]
+    if not titles:
+        return summary
+    label = titles[0] if len(titles) == 1 else f"{titles[0]} - {titles[-1]}"
+    return f"[{label}]\n{summary}"
+
+def pack_notes(notes: List[str], max_tokens: int) -> List[List[str]]:
+    """Group consecutive notes so each group stays within max_tokens"""
+    groups = []
+    group_tokens = 0
+    for note in notes:
+        note_tokens = estimate_tokens(note)
+        if not groups or group_tokens + note_tokens > max_tokens:
+            groups.append([])
+            group_tokens = 0
+        groups[-1].append(note)
+        group_tokens += note_tokens
+    return groups
+
+def book_summary_messages(request: BookContent, book_text: str) -> List[Dict]:
+    """Final book summary prompt, kept within the summary model's context window"""
+    return fill_prompt(
+        lambda content: build_book_summary_messages(request, content),
+        book_text, config.DEEPSEEK_MODEL, config.MAX_TOKENS_SUMMARY
+    )
+
+async def condense_book(request: BookContent, on_progress=None) -> tuple:
+    """Reduce a whole book to text that fits in one book summary prompt
+
+    Books up to SUMMARY_DIRECT_TOKENS are returned as they are. Longer books
+    are cut into chunks of about SUMMARY_CHUNK_TOKENS that are summarized in
+    parallel with deepseek-chat (map); chapters that already have a cached
+    chapter summary reuse it instead of being sent again. Part summaries that
+    are still too long together are merged in further rounds until they fit
+    (reduce). The number of calls is bounded by SUMMARY_MAX_CHUNKS.
+
+    Args:
+        request: The book summary request
+        on_progress: Optional callback(completed, total) invoked as each call finishes
+
+    Returns:
+        Tuple of (text for the final summary prompt, coverage stats)
+    """
+    sections = book_sections(request)
+    total_tokens = sum(section['tokens'] for section in sections)
+    stats = {"input_tokens": total_tokens, "chunks": 0, "cached_chapters": 0, "merge_rounds": 0, "failed_parts": 0}
+
+    if total_tokens <= config.SUMMARY_DIRECT_TOKENS:
+        return "\n\n".join(section['content'] for section in sections), stats
+
+    # Grow chunks on very long books so the number of map calls stays bounded,
+    # but never past what a map prompt can hold
+    chunk_tokens = max(config.SUMMARY_CHUNK_TOKENS, -(-total_tokens // max(1, config.SUMMARY_MAX_CHUNKS)))
+    part_overhead = count_message_tokens(build_summary_part_messages(request.title, "", 1, 1, request.language))
+    chunk_tokens = min(chunk_tokens, prompt_budget("deepseek-chat", config.MAX_TOKENS_SUMMARY_PART) - part_overhead)
+
+    notes = []  # One slot per part summary, in reading order
+    chunks = []
+    chunk = None
+    for section in sections:
+        cached = None
+        if section['title']:
+            cached = await run_in_threadpool(cached_chapter_summary, request.title, section, request.language)
+        if cached:
+            notes.append(summary_note([section['title']], cached.strip()))
+            stats["cached_chapters"] += 1
+            chunk = None
+            continue
+        for piece in split_text(section['content'], chunk_tokens):
+            piece_tokens = estimate_tokens(piece)
+            if chunk is None or chunk['tokens'] + piece_tokens > chunk_tokens:
+                chunk = {'slot': len(notes), 'titles': [], 'pieces': [], 'tokens': 0}
+                notes.append(None)
+                chunks.append(chunk)
+            if section['title'] not in chunk['titles']:
+                chunk['titles'].append(section['title'])
+            chunk['pieces'].append(piece)
+            chunk['tokens'] += piece_tokens
+
+    stats["chunks"] = len(chunks)
+    logger.info(
+        f"Map-reduce summary of '{request.title}': {total_tokens} tokens in {len(chunks)} chunks, "
+        f"{stats['cached_chapters']} cached chapter summaries"
+    )
+
+    completed = 0
+    total_calls = len(chunks)
+
+    def report(index, result):
+        nonlocal completed
+        completed += 1
+        if on_progress is not None:
+            on_progress(completed, total_calls)
+
+    for number, chunk in enumerate(chunks, 1):
+        chunk['number'] = number
+
+    async def summarize_part(chunk):
+        messages = build_summary_part_messages(
+            request.title, "\n".join(chunk['pieces']), chunk['number'], len(chunks), request.language
+        )
+        return await call_deepseek_api(messages, config.MAX_TOKENS_SUMMARY_PART, config.TEMP_SUMMARY, model="deepseek-chat")
+
+    results = await gather_bounded(
+        chunks, summarize_part, config.CHAPTER_SUMMARY_CONCURRENCY, config.CHAPTER_SUMMARY_TIMEOUT, on_result=report
+    )
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, BaseException) or not result.strip():
+            logger.error(f"Failed to summarize part {chunk['number']} of '{request.title}': {result!r}")
+            stats["failed_parts"] += 1
+            continue
+        notes[chunk['slot']] = summary_note(chunk['titles'], result.strip())
+
+    notes = [note for note in notes if note]
+    if not notes:
+        raise HTTPException(status_code=500, detail="AI service error: no part of the book could be summarized")
+
+    async def merge(group):
+        messages = build_summary_merge_messages(request.title, "\n\n".join(group), request.language)
+        return await call_deepseek_api(messages, config.MAX_TOKENS_SUMMARY_PART, config.TEMP_SUMMARY, model="deepseek-chat")
+
+    while len(notes) > 1 and estimate_tokens("\n\n".join(notes)) > config.SUMMARY_DIRECT_TOKENS:
+        groups = pack_notes(notes, chunk_tokens)
+        if len(groups) == len(notes):
+            break
+        stats["merge_rounds"] += 1
+        total_calls += len(groups)
+        results = await gather_bounded(
+            groups, merge, config.CHAPTER_SUMMARY_CONCURRENCY, config.CHAPTER_SUMMARY_TIMEOUT, on_result=report
+        )
+        # A group whose merge failed is carried forward unmerged
+        notes = [
+            "\n\n".join(group) if isinstance(result, BaseException) or not result.strip() else result.strip()
+            for group, result in zip(groups, results)
+        ]
+
+    return "\n\n".join(notes), stats
+
+# ===================================
+# AI Tasks
+# ===================================
+
+async def run_book_summary(request: BookContent) -> dict:
+    """Generate a comprehensive summary of the entire book"""
+    # Debug logging
+    logger.info(f"Book summary request - Language: {request.language}")
+
+    usage = track_token_usage()
+    book_text, coverage = await condense_book(request)
+    messages = book_summary_messages(request, book_text)
+
+    summary = await call_deepseek_api(messages, config.MAX_TOKENS_SUMMARY, config.TEMP_SUMMARY)
+
+    return {
+        "summary": summary,
+        "book_title": request.title,
+        "coverage": coverage,
+        "usage": usage,
+        "generated_at": datetime.now().isoformat()
+    }
+
+async def run_chapter_summaries(request: ChapterSummaryRequest) -> dict:
+    """Summarize the book's actual chapters, in reading order"""
+    # Debug logging
+    logger.info(f"Chapter summaries request - Language: {request.language}")
+    logger.info(f"Total chapters received: {len(request.chapters)}")
+
+    precomputed = await precomputed_chapter_summary_result(request)
+    if precomputed is not None:
+        return precomputed
+
+    usage = track_token_usage()
+    chapters = select_summary_chapters(request.chapters, request._chapter_stats)
+    entries = await summarize_chapters(request.book_title, chapters, request.language)
+
+    # Only keep chapters whose summary was generated (or that had no content)
+    summaries = [entry for entry in entries if entry is not None]
+
+    # Log final results
+    logger.info(f"Total summaries generated: {len(summaries)}")
+
+    if len(summaries) == 0:
+        logger.warning("No summaries were generated - all chapters may have been filtered out or had no content")
+
+    return {
+        "book_title": request.book_title,
+        "chapter_summaries": summaries,
+        "usage": usage,
+        "generated_at": datetime.now().isoformat()
+    }
+
+def failed_chapter_summaries(request: ChapterSummaryRequest, result: dict) -> int:
+    """Number of selected chapters run_chapter_summaries returned no summary for"""
+    return len(select_summary_chapters(request.chapters, request._chapter_stats)) - len(result['chapter_summaries'])
+
+def incomplete_result(operation: str, request: BaseModel, result: dict) -> Optional[str]:
+    """Why a task result is missing parts that failed upstream, or None if it is complete"""
+    if operation == "chapter_summaries":
+        failed = failed_chapter_summaries(request, result)
+        if failed > 0:
+            return f"{failed} chapter summaries failed"
+    elif operation == "book_summary":
+        failed = result['coverage'].get('failed_parts', 0)
+        if failed:
+            return f"{failed} of {result['coverage']['chunks']} book parts failed"
+    return None
+
+async def run_content_analysis(request: ContentAnalysisRequest) -> dict:
+    """Perform deep content analysis"""
+    # Debug logging
+    logger.info(f"Content analysis request - Language: {request.language}")
+
+    usage = track_token_usage()
+    messages = fill_prompt(
+        lambda content: build_content_analysis_messages(request, content),
+        request.content, config.DEEPSEEK_MODEL, config.MAX_TOKENS_ANALYSIS, config.ANALYSIS_PROMPT_TOKENS
+    )
+
+    analysis = await call_deepseek_api(messages, config.MAX_TOKENS_ANALYSIS, config.TEMP_ANALYSIS)
+
+    return {
+        "analysis_type": request.analysis_type,
+        "analysis": analysis,
+        "book_title": request.book_title,
+        "usage": usage,
+        "generated_at": datetime.now().isoformat()
+    }
+
+# ===================================
+# Background Jobs
+# ===================================
+
+# Job kinds: the request model for the payload and the task that runs it
+JOB_KINDS = {
+    "book_summary": (BookContent, run_book_summary),
+    "chapter_summaries": (ChapterSummaryRequest, run_chapter_summaries),
+    "content_analysis": (ContentAnalysisRequest, run_content_analysis),
+}
+
+class Job:
+    """A submitted AI task and its lifecycle (queued, running, completed, failed, cancelled)"""
+
+    def __init__(self, job_id: str, kind: str, request: BaseModel, priority: int):
+        self.id = job_id
+        self.kind = kind
+        self.request = request
+        self.priority = priority
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+        self.cancel_requested = False
+        self.on_finish = []  # Called with the job once it is finished, or dropped when the queue stops
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobResultStore:
+    """Persists finished jobs in SQLite so results survive restarts"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    finished_at REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return thread_local_connection(self._local, self.path)
+
+    def save(self, job_data: dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, data, finished_at) VALUES (?, ?, ?)",
+                (job_data["job_id"], json.dumps(job_data, ensure_ascii=False), job_data["finished_at"])
+            )
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+
+    def load(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+async def run_job_task(job: Job):
+    """Run a job's task, labelling its DeepSeek calls with the job kind in metrics"""
+    current_endpoint.set(f"job:{job.kind}")
+    _, task_fn = JOB_KINDS[job.kind]
+    return await task_fn(job.request)
+
+class JobQueue:
+    """Priority queue of AI jobs executed by a fixed pool of worker tasks
+
+    The number of workers bounds how many jobs run at once. Lower priority
+    values run first; equal priorities run in submission order. Queued and
+    running jobs live in memory; finished jobs are written to the result
+    store and dropped from memory.
+    """
+
+    def __init__(self, workers: int, max_queued: int, store: JobResultStore):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.store = store
+        self.jobs: Dict[str, Job] = {}
+        self._queue = None
+        self._sequence = 0
+        self._worker_tasks = []
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, self.workers))]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        # Jobs still queued or running are dropped with the workers
+        for job in list(self.jobs.values()):
+            self._run_on_finish(job)
+        self.jobs.clear()
+
+    def submit(self, kind: str, request: BaseModel, priority: int) -> Job:
+        queued = sum(1 for job in self.jobs.values() if job.status == "queued")
+        if queued >= self.max_queued:
+            raise HTTPException(status_code=503, detail="Job queue is full. Please retry later.")
+
+        job = Job(os.urandom(16).hex(), kind, request, priority)
+        self.jobs[job.id] = job
+        self._sequence += 1
+        self._queue.put_nowait((priority, self._sequence, job.id))
+        logger.info(f"Queued {kind} job {job.id} with priority {priority}")
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.load(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return await run_in_threadpool(self.store.load, job_id)
+        if job.status == "queued":
+            # The worker skips it when it reaches the front of the queue
+            await self._finish(job, "cancelled")
+        elif job.status == "running" and job.task is not None:
+            job.cancel_requested = True
+            job.task.cancel()
+        return job.to_dict()
+
+    async def _finish(self, job: Job, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        self.jobs.pop(job.id, None)
+        self._run_on_finish(job)
+        try:
+            await run_in_threadpool(self.store.save, job.to_dict())
+        except Exception as e:
+            logger.error(f"Failed to persist job {job.id}: {e}")
+        logger.info(f"Job {job.id} {status}")
+
+    def _run_on_finish(self, job: Job):
+        for callback in job.on_finish:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"Finish callback for job {job.id} failed: {e}")
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue  # Cancelled while queued
+
+            job.status = "running"
+            job.started_at = time.time()
+            job.task = asyncio.create_task(run_job_task(job))
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                # Stopping the worker cancels the job task too, so only an explicit cancel() counts
+                if not job.cancel_requested:
+                    raise
+                await self._finish(job, "cancelled")
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                await self._finish(job, "failed", error=str(e))
+            else:
+                await self._finish(job, "completed", result=result)
+
+job_queue = JobQueue(
+    config.JOB_WORKERS,
+    config.JOB_QUEUE_LIMIT,
+    JobResultStore(os.path.join(config.DATA_DIR, "jobs.db"), config.JOB_RESULT_TTL)
+)
+
+# ===================================
+# Batch Ingest
+# ===================================
+
+# Job kinds a batch runs on every book, in this order; chapter summaries go first so
+# the book summary's map step can reuse them from the response cache
+BATCH_OPERATIONS = ("chapter_summaries", "book_summary", "content_analysis")
+
+def batch_input_files(paths: List[str], root: Optional[str] = None) -> List[str]:
+    """Expand files and directories into a sorted list of EPUB paths
+
+    With root, every path is taken relative to it and must stay inside it.
+    """
+    files = set()
+    for path in paths:
+        if root is not None:
+            path = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([path, os.path.realpath(root)]) != os.path.realpath(root):
+                raise HTTPException(status_code=400, detail=f"Path is outside the batch input directory: {path}")
+        if os.path.isdir(path):
+            for directory, _, names in os.walk(path):
+                files.update(os.path.join(directory, name) for name in names if name.lower().endswith('.epub'))
+        elif os.path.isfile(path):
+            files.add(path)
+        else:
+            raise HTTPException(status_code=400, detail=f"No such file or directory: {path}")
+    return sorted(files)
+
+def batch_operations(operations: Optional[List[str]]) -> List[str]:
+    """Validate requested operations and put them in BATCH_OPERATIONS order"""
+    if not operations:
+        return list(BATCH_OPERATIONS)
+    unknown = set(operations).difference(BATCH_OPERATIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown operations: {sorted(unknown)}. Expected some of {list(BATCH_OPERATIONS)}"
+        )
+    return [operation for operation in BATCH_OPERATIONS if operation in operations]
+
+def write_json_atomic(path: str, data: dict):
+    """Write JSON via a temporary file, so a crash never leaves a truncated checkpoint"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+async def parse_batch_file(path: str) -> dict:
+    """Parse (or fetch from the store) one EPUB of a batch, waiting while the parse queue is full"""
+    book_id = await run_in_threadpool(file_sha256, path)
+    while True:
+        try:
+            return await parse_spooled_upload(path, book_id)
+        except HTTPException as e:
+            if e.status_code != 503:
+                raise
+            await asyncio.sleep(config.PARSE_RETRY_AFTER)
+
+async def ingest_book(path: str, operations: List[str], language: str, output_dir: str) -> dict:
+    """Parse one EPUB and run the operations it has no saved result for
+
+    Each result is written to output_dir/<book_id>/<operation>.<language>.json
+    as soon as it is ready; those files are the checkpoint, so an interrupted
+    batch resumes where it stopped. Failures are reported, not raised; a
+    result missing parts that failed upstream counts as a failure and gets no
+    checkpoint, so the next run retries it.
+    """
+    report = {"path": path, "book_id": None, "title": None, "operations": {}}
+    try:
+        book_data = await parse_batch_file(path)
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Batch: failed to parse {path}: {detail}")
+        report["error"] = detail
+        return report
+
+    book_id = book_data['id']
+    report["book_id"] = book_id
+    report["title"] = book_data['metadata']['title']
+    book_dir = os.path.join(output_dir, book_id)
+    await run_in_threadpool(write_json_atomic, os.path.join(book_dir, "book.json"), {
+        "book_id": book_id,
+        "source": path,
+        "metadata": book_data['metadata'],
+        "chapter_count": len(book_data['chapters'])
+    })
+
+    async def run(operation: str):
+        result_path = os.path.join(book_dir, f"{operation}.{language}.json")
+        if os.path.exists(result_path):
+            report["operations"][operation] = "done earlier"
+            return
+        request_model, task_fn = JOB_KINDS[operation]
+        try:
+            task_request = await resolve_book_reference(request_model(book_id=book_id, language=language))
+            result = await task_fn(task_request)
+            incomplete = incomplete_result(operation, task_request, result)
+            if incomplete:
+                # No checkpoint, so the next run retries it
+                logger.error(f"Batch: {operation} incomplete for {path}: {incomplete}")
+                report["operations"][operation] = f"failed: {incomplete}"
+                return
+            await run_in_threadpool(write_json_atomic, result_path, result)
+            report["operations"][operation] = "done"
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Batch: {operation} failed for {path}: {detail}")
+            report["operations"][operation] = f"failed: {detail}"
+
+    if "chapter_summaries" in operations:
+        await run("chapter_summaries")
+    await asyncio.gather(*(run(operation) for operation in operations if operation != "chapter_summaries"))
+    return report
+
+async def run_batch_ingest(request: BatchIngestRequest, output_dir: Optional[str] = None,
+                           input_root: Optional[str] = None, concurrency: Optional[int] = None) -> dict:
+    """Parse a set of EPUBs in parallel and run the requested AI operations on each
+
+    Up to BATCH_BOOK_CONCURRENCY books are in progress at once; parsing goes
+    through the shared parse pool and every AI call through the DeepSeek rate
+    governor, so a batch never exceeds the limits live traffic is held to.
+    """
+    output_dir = output_dir or config.BATCH_OUTPUT_DIR
+    files = await run_in_threadpool(batch_input_files, request.paths, input_root)
+    operations = batch_operations(request.operations)
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.BATCH_BOOK_CONCURRENCY))
+    logger.info(f"Batch ingest of {len(files)} EPUBs: {', '.join(operations)} -> {output_dir}")
+
+    completed = 0
+
+    async def ingest(path: str) -> dict:
+        nonlocal completed
+        async with semaphore:
+            report = await ingest_book(path, operations, request.language, output_dir)
+        completed += 1
+        logger.info(f"Batch: {completed}/{len(files)} books processed ({os.path.basename(path)})")
+        return report
+
+    started = time.perf_counter()
+    books = await asyncio.gather(*(ingest(path) for path in files))
+    failed = sum(
+        1 for book in books
+        if "error" in book or any(status.startswith("failed") for status in book["operations"].values())
+    )
+    return {
+        "output_dir": output_dir,
+        "operations": operations,
+        "language": request.language,
+        "books": books,
+        "total": len(books),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 1),
+        "generated_at": datetime.now().isoformat()
+    }
+
+async def run_batch_ingest_job(request: BatchIngestRequest) -> dict:
+    """Batch ingest as a background job: paths are confined to BATCH_INPUT_DIR"""
+    return await run_batch_ingest(request, input_root=config.BATCH_INPUT_DIR)
+
+JOB_KINDS["batch_ingest"] = (BatchIngestRequest, run_batch_ingest_job)
+
+# ===================================
+# Book Artifacts
+# ===================================
+
+# Books with an artifacts job queued or running
+artifacts_pending = set()
+
+def missing_summary_languages(book_data: dict, languages: List[str]) -> List[str]:
+    summaries = (book_data.get('artifacts') or {}).get('chapter_summaries', {})
+    return [language for language in languages if language not in summaries]
+
+def schedule_book_artifacts(book_data: dict):
+    """Queue the artifacts job for an uploaded book, unless its artifacts are complete or already queued"""
+    if not config.BOOK_ARTIFACTS:
+        return
+    book_id = book_data['id']
+    artifacts = book_data.get('artifacts') or {}
+    if artifacts.get('version') == BOOK_ARTIFACTS_VERSION and 'search_index' in book_data \
+            and not missing_summary_languages(book_data, config.PRECOMPUTE_SUMMARY_LANGUAGES):
+        return
+    if book_id in artifacts_pending:
+        return
+    request = BookArtifactsRequest(book_id=book_id, summary_languages=config.PRECOMPUTE_SUMMARY_LANGUAGES)
+    try:
+        job = job_queue.submit("book_artifacts", request, config.BOOK_ARTIFACTS_PRIORITY)
+    except HTTPException as e:
+        logger.warning(f"Could not queue artifacts for book {book_id}: {e.detail}")
+        return
+    artifacts_pending.add(book_id)
+    # Released however the job ends, including a cancel before it starts
+    job.on_finish.append(lambda _: artifacts_pending.discard(book_id))
+
+async def run_book_artifacts(request: BookArtifactsRequest) -> dict:
+    """Precompute a stored book's artifacts so its first AI requests need no preparation
+
+    New uploads get their classification and token counts at parse time;
+    books stored before that (or with outdated artifacts) get them here, and
+    books parsed before search indexes existed are indexed. The book is only
+    written back if one of those changed. Chapter summaries in each requested
+    language follow and are stored only if every chapter succeeded (a later
+    request retries the rest).
+    """
+    book_id = request.book_id
+    book_data = await load_book(book_id)
+    artifacts = book_data.get('artifacts') or {}
+    changed = False
+    if artifacts.get('version') != BOOK_ARTIFACTS_VERSION:
+        book_data['artifacts'] = artifacts = await run_in_threadpool(compute_book_artifacts, book_data)
+        changed = True
+    if 'search_index' not in book_data:
+        book_data['search_index'] = await run_in_threadpool(build_search_index, book_data['chapters'])
+        changed = True
+    if changed:
+        await run_in_threadpool(book_store.put, book_id, book_data)
+
+    for language in missing_summary_languages(book_data, request.summary_languages or []):
+        summary_request = await resolve_book_reference(ChapterSummaryRequest(book_id=book_id, language=language))
+        result = await run_chapter_summaries(summary_request)
+        if incomplete_result("chapter_summaries", summary_request, result):
+            logger.warning(f"Some chapter summaries failed for book {book_id} ({language}) - not storing them")
+            continue
+        artifacts['chapter_summaries'][language] = {key: value for key, value in result.items() if key != 'usage'}
+        await run_in_threadpool(book_store.put, book_id, book_data)
+
+    return {
+        "book_id": book_id,
+        "chapters": len(artifacts['chapters']),
+        "actual_chapters": sum(1 for chapter in artifacts['chapters'] if chapter['is_chapter']),
+        "total_tokens": artifacts['total_tokens'],
+        "summary_languages": sorted(artifacts['chapter_summaries'])
+    }
+
+async def precomputed_chapter_summaries(book_id: str, language: str) -> Optional[dict]:
+    """The chapter summaries stored for a book by its artifacts job, if any"""
+    book_data = await run_in_threadpool(book_store.get, book_id)
+    if book_data is None:
+        return None
+    return (book_data.get('artifacts') or {}).get('chapter_summaries', {}).get(language)
+
+async def precomputed_chapter_summary_result(request: ChapterSummaryRequest) -> Optional[dict]:
+    """run_chapter_summaries' result for a whole-book request by book_id, if its summaries are precomputed"""
+    if not request.book_id or request.chapter_ids:
+        return None
+    precomputed = await precomputed_chapter_summaries(request.book_id, request.language)
+    if precomputed is None:
+        return None
+    return {**precomputed, "usage": track_token_usage(), "precomputed": True}
+
+JOB_KINDS["book_artifacts"] = (BookArtifactsRequest, run_book_artifacts)
+
+# ===================================
+# API Endpoints
+# ===================================
+
+@app.on_event("startup")
+async def start_background_workers():
+    """Start the background job workers"""
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def release_shared_resources():
+    """Stop job workers and release pooled DeepSeek connections and parse workers on shutdown"""
+    await job_queue.stop()
+    await deepseek_client.close()
+    epub_parse_pool.shutdown()
+
+@app.get("/")
+async def root():
+    """Health check endpoint"""
+    return {
+        "status": "healthy",
+        "service": "Echo Reader Unified Backend",
+        "features": ["EPUB Processing", "AI Analysis"],
+        "ai_model": config.DEEPSEEK_MODEL,
+        "version": "2.0.0"
+    }
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """Hit/miss statistics for the AI response cache"""
+    if response_cache is None:
+        return {"enabled": False}
+    stats = await run_in_threadpool(response_cache.get_stats)
+    return {"enabled": True, "backend": config.AI_CACHE_BACKEND, **stats}
+
+def cache_lookup_counts() -> Dict[tuple, int]:
+    if response_cache is None:
+        return {}
+    stats = response_cache.stats()
+    return {("memory_hit",): stats["memory_hits"], ("disk_hit",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+def cache_hit_ratio() -> float:
+    counts = cache_lookup_counts()
+    lookups = sum(counts.values())
+    return round((lookups - counts[("miss",)]) / lookups, 4) if lookups else 0.0
+
+def memory_tier() -> MemoryBookStore:
+    return book_store.memory if isinstance(book_store, TieredBookStore) else book_store
+
+metrics.register(CounterMetric(
+    "echo_ai_cache_lookups_total", "AI response cache lookups by result", ("result",), callback=cache_lookup_counts
+))
+metrics.register(GaugeMetric(
+    "echo_ai_cache_hit_ratio", "Share of AI response cache lookups that hit", callback=cache_hit_ratio
+))
+metrics.register(GaugeMetric(
+    "echo_upstream_in_flight", "DeepSeek calls currently admitted", callback=lambda: deepseek_governor.stats["in_flight"]
+))
+metrics.register(GaugeMetric(
+    "echo_upstream_waiting", "DeepSeek calls waiting for admission", callback=lambda: deepseek_governor.stats["waiting"]
+))
+metrics.register(CounterMetric(
+    "echo_upstream_retries_total", "DeepSeek retries by reason", ("reason",),
+    callback=lambda: {
+        ("rate_limited",): deepseek_governor.stats["rate_limited"],
+        ("server_error",): deepseek_governor.stats["server_errors"],
+    }
+))
+metrics.register(GaugeMetric(
+    "echo_epub_parses_pending", "EPUB parses running or queued", callback=lambda: epub_parse_pool.pending
+))
+metrics.register(GaugeMetric(
+    "echo_jobs", "Background jobs by status", ("status",),
+    callback=lambda: {(status,): count for status, count in Counter(job.status for job in job_queue.jobs.values()).items()}
+))
+metrics.register(GaugeMetric(
+    "echo_book_store_memory_bytes", "Estimated in-memory size of the books held in the memory tier",
+    callback=lambda: memory_tier().total_bytes
+))
+metrics.register(GaugeMetric(
+    "echo_book_store_memory_books", "Books held in memory", callback=lambda: len(memory_tier())
+))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/governor-stats")
+async def get_governor_stats():
+    """Admission, retry and queue-wait statistics for outbound DeepSeek calls"""
+    return deepseek_governor.get_stats()
+
+# ===================================
+# EPUB Processing Endpoints
+# ===================================
+
+def build_book_manifest(book_data: CompactBook) -> dict:
+    """Metadata, TOC and chapter ids/sizes of a book, without any chapter content"""
+    return {
+        'id': book_data['id'],
+        'metadata': book_data['metadata'],
+        'toc': book_data['toc'],
+        'uploaded_at': book_data.get('uploaded_at'),
+        'chapter_count': len(book_data['chapters']),
+        'chapters': [
+            {'index': index, 'id': chapter.id, 'title': chapter.title, 'size': chapter.content_length}
+            for index, chapter in enumerate(book_data['chapters'])
+        ]
+    }
+
+async def load_book(book_id: str) -> dict:
+    """Fetch a parsed book from the store, raising 404 if it is unknown"""
+    book_data = await run_in_threadpool(book_store.get, book_id)
+    if book_data is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book_data
+
+def public_book(book_data: CompactBook) -> dict:
+    """The book as returned to clients, without the server-side search index and artifacts
+
+    full_text is left out too: it repeats the chapter texts, and clients that
+    want it have /book/{book_id}/text.
+    """
+    book = book_data.to_dict(full_text=False, search_index=False)
+    book.pop('artifacts', None)
+    return book
+
+async def retrieve_passages(book_id: Optional[str], query: str) -> List[Dict]:
+    """Find the passages of a stored book most relevant to query, within SEARCH_CONTEXT_TOKENS
+
+    Books stored before search indexes existed are indexed on first use.
+    Returns the chosen passages in reading order, or [] if the book is unknown.
+    """
+    if not book_id or not query.strip():
+        return []
+    book_data = await run_in_threadpool(book_store.get, book_id)
+    if book_data is None:
+        logger.warning(f"Book {book_id} not found - answering without passages")
+        return []
+    if 'search_index' not in book_data:
+        book_data['search_index'] = await run_in_threadpool(build_search_index, book_data['chapters'])
+        await run_in_threadpool(book_store.put, book_id, book_data)
+
+    ranked = await run_in_threadpool(search_book, book_data, query, config.SEARCH_TOP_K)
+    passages = []
+    budget = config.SEARCH_CONTEXT_TOKENS
+    for passage in ranked:
+        tokens = estimate_tokens(passage['text'])
+        if tokens <= budget:
+            passages.append(passage)
+            budget -= tokens
+    passages.sort(key=lambda passage: (passage['chapter_index'], passage['offset']))
+    logger.debug("Retrieved %d passages from book %s", len(passages), book_id)
+    return passages
+
+def stored_chapter_stats(book_data: dict, chapter_ids: Optional[List[str]] = None) -> Optional[List[Dict]]:
+    """The artifacts entries ({is_chapter, tokens}) of the chapters stored_chapters returns, if they are current"""
+    artifacts = book_data.get('artifacts') or {}
+    if artifacts.get('version') != BOOK_ARTIFACTS_VERSION:
+        return None
+    if not chapter_ids:
+        return artifacts['chapters']
+    wanted = set(chapter_ids)
+    return [stat for stat, chapter in zip(artifacts['chapters'], book_data['chapters']) if chapter['id'] in wanted]
+
+def stored_chapters(book_data: dict, chapter_ids: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    """A stored book's chapters as plain-text {title, content} dicts, optionally only those in chapter_ids"""
+    chapters = book_data['chapters']
+    if chapter_ids:
+        wanted = set(chapter_ids)
+        missing = wanted.difference(chapter['id'] for chapter in chapters)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Chapters not found: {', '.join(sorted(missing))}")
+        chapters = [chapter for chapter in chapters if chapter['id'] in wanted]
+    return [{'title': chapter['title'], 'content': chapter['text']} for chapter in chapters]
+
+def chat_book_id(request: ChatRequest) -> Optional[str]:
+    """The stored book a chat is about, if any"""
+    return request.book_id or (request.book_context or {}).get('book_id')
+
+def book_reference_missing(request: BaseModel) -> List[str]:
+    """Fields of an AI request that must come from the stored book"""
+    if isinstance(request, BookContent):
+        missing = ['title'] if not request.title else []
+        return missing + (['chapters'] if not request.full_text and not request.chapters else [])
+    if isinstance(request, ChapterSummaryRequest):
+        return [field for field in ('book_title', 'chapters') if not getattr(request, field)]
+    if isinstance(request, ContentAnalysisRequest):
+        return [field for field in ('book_title', 'content') if not getattr(request, field)]
+    if isinstance(request, ChatRequest):
+        has_title = bool(request.book_context and request.book_context.get('title'))
+        return [] if has_title or not chat_book_id(request) else ['book_context']
+    return []
+
+async def resolve_book_reference(request: BaseModel) -> BaseModel:
+    """Fill in the title and text of an AI request from the stored book named by its book_id
+
+    Text sent with the request takes precedence, so requests that carry
+    everything are returned unchanged without touching the book store.
+    Raises 422 if text is missing and there is no book_id, 404 if the book
+    or a requested chapter is unknown.
+    """
+    missing = book_reference_missing(request)
+    if not missing:
+        return request
+    book_id = chat_book_id(request) if isinstance(request, ChatRequest) else request.book_id
+    if not book_id:
+        raise HTTPException(status_code=422, detail=f"{', '.join(missing)} required unless book_id is given")
+
+    book_data = await load_book(book_id)
+    metadata = book_data['metadata']
+    if isinstance(request, ChatRequest):
+        book_context = {'title': metadata['title'], 'author': metadata['author'], **(request.book_context or {})}
+        book_context['book_id'] = book_id
+        return request.model_copy(update={'book_context': book_context})
+
+    chapter_ids = getattr(request, 'chapter_ids', None)
+    update = {}
+    if 'title' in missing:
+        update['title'] = metadata['title']
+        update['author'] = request.author or metadata['author']
+    if 'book_title' in missing:
+        update['book_title'] = metadata['title']
+    if 'chapters' in missing:
+        update['chapters'] = await run_in_threadpool(stored_chapters, book_data, chapter_ids)
+    if 'content' in missing:
+        if chapter_ids:
+            chapters = await run_in_threadpool(stored_chapters, book_data, chapter_ids)
+            update['content'] = "".join(f"{chapter['content']}\n\n" for chapter in chapters)
+        else:
+            update['content'] = book_data['full_text']
+    resolved = request.model_copy(update=update)
+    if 'chapters' in update:
+        resolved._chapter_stats = stored_chapter_stats(book_data, chapter_ids)
+    return resolved
+
+def passage_sources(passages: List[Dict]) -> List[Dict]:
+    """Chapter references for the passages an answer was grounded in"""
+    return [
+        {'chapter_index': passage['chapter_index'], 'chapter_title': passage['chapter_title'], 'score': passage['score']}
+        for passage in passages
+    ]
+
+def book_etag(book_data: CompactBook, view) -> str:
+    """Weak ETag of one view of a stored book
+
+    Book ids are content hashes, so a view only changes when the book is
+    parsed again by a newer parser; the parse version covers that.
+    """
+    return f'W/"{book_data["id"]}-p{book_data.get("parse_version", 0)}-{view}"'
+
+def cacheable_json_response(request: Request, payload: dict, etag: str) -> Response:
+    """JSON response with ETag revalidation
+
+    etag comes from book_etag. Compression is left to CompressionMiddleware.
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={config.BOOK_CACHE_MAX_AGE}",
+        "Vary": "Accept-Encoding"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    return FastJSONResponse(payload, headers=headers)
+
+@app.post("/upload-epub")
+async def upload_epub(file: UploadFile = File(...), lazy: bool = False):
+    """Upload and process EPUB file
+
+    With lazy=true only the book manifest is returned; chapters are then
+    fetched on demand from /book/{book_id}/chapter/{index}.
+    """
+    # Validate file type
+    if not file.filename.endswith('.epub'):
+        raise HTTPException(status_code=400, detail="Only EPUB files are supported")
+
+    # Parse EPUB (or reuse the cached parse of an identical file)
+    book_data = await process_epub_upload(file)
+    return build_book_manifest(book_data) if lazy else public_book(book_data)
+
+@app.get("/book/{book_id}")
+async def get_book(book_id: str):
+    """Get processed book by ID"""
+    return public_book(await load_book(book_id))
+
+@app.get("/book/{book_id}/manifest")
+async def get_book_manifest(book_id: str, request: Request):
+    """Get a book's metadata, TOC and chapter list without chapter content"""
+    book_data = await load_book(book_id)
+    return cacheable_json_response(request, build_book_manifest(book_data), book_etag(book_data, "manifest"))
+
+@app.get("/book/{book_id}/chapter/{index}")
+async def get_book_chapter(book_id: str, index: int, request: Request):
+    """Get one chapter's cleaned HTML, for on-demand loading in the reader"""
+    book_data = await load_book(book_id)
+    chapters = book_data['chapters']
+    if index < 0 or index >= len(chapters):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    chapter = chapters[index]
+    return cacheable_json_response(
+        request,
+        {'index': index, 'id': chapter['id'], 'title': chapter['title'], 'content': chapter['content']},
+        book_etag(book_data, index)
+    )
+
+@app.get("/book/{book_id}/artifacts")
+async def get_book_artifacts(book_id: str):
+    """Get a book's precomputed chapter classification and token counts
+
+    Not cached by the browser: status stays "pending" until the background
+    artifacts job has run, and summary_languages grows as summaries are added.
+    """
+    book_data = await load_book(book_id)
+    artifacts = book_data.get('artifacts')
+    if not artifacts:
+        return {'id': book_id, 'status': 'pending' if book_id in artifacts_pending else 'missing'}
+    return {
+        'id': book_id,
+        'status': 'ready',
+        'total_tokens': artifacts['total_tokens'],
+        'chapters': [{'index': index, **chapter} for index, chapter in enumerate(artifacts['chapters'])],
+        'summary_languages': sorted(artifacts['chapter_summaries'])
+    }
+
+@app.get("/book/{book_id}/text")
+async def get_book_text(book_id: str, request: Request):
+    """Get the plain-text view of a book used by the AI features (no HTML)"""
+    book_data = await load_book(book_id)
+    chapters = [{'title': ch['title'], 'text': ch['text']} for ch in book_data['chapters']]
+    return cacheable_json_response(
+        request,
+        {'id': book_id, 'full_text': book_full_text(chapters), 'chapters': chapters},
+        book_etag(book_data, "text")
+    )
+
+# ===================================
+# AI Feature Endpoints
+# ===================================
+
+@app.post("/api/upload-book")
+async def upload_book_for_ai(file: UploadFile = File(...)):
+    """Upload book for AI processing (supports EPUB)"""
+    if file.filename.endswith('.epub'):
+        book_data = await process_epub_upload(file)
+
+        # Prepare for AI
+        return AIResponse(
+            success=True,
+            data={
+                "book_id": book_data['id'],
+                "title": book_data['metadata']['title'],
+                "author": book_data['metadata']['author'],
+                "full_text": book_data['full_text'],
+                "chapters": [{"title": ch['title'], "content": ch['text']} for ch in book_data['chapters']]
+            }
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+
+@app.post("/api/book-summary")
+async def generate_book_summary(request: BookContent):
+    """Generate a comprehensive summary of the entire book"""
+    request = await resolve_book_reference(request)
+    try:
+        return AIResponse(success=True, data=await run_book_summary(request))
+    except Exception as e:
+        logger.error(f"Error generating book summary: {e}")
+        return AIResponse(success=False, error=str(e))
+
+async def book_summary_events(request: BookContent):
+    """SSE events for a book summary: "progress" while long books are map-reduced, then the streamed summary"""
+    yield sse_event({"type": "start"})
+    usage = track_token_usage()
+
+    progress = asyncio.Queue()
+    task = asyncio.ensure_future(
+        condense_book(request, on_progress=lambda completed, total: progress.put_nowait((completed, total)))
+    )
+    task.add_done_callback(lambda _: progress.put_nowait(None))
+    try:
+        while True:
+            try:
+                update = await asyncio.wait_for(progress.get(), config.SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": thinking\n\n"
+                continue
+            if update is None:
+                break
+            yield sse_event({"type": "progress", "completed": update[0], "total": update[1]})
+        book_text, coverage = task.result()
+    except Exception as e:
+        logger.error(f"Error condensing book for summary: {e}")
+        yield sse_event({"type": "error", "error": str(e)})
+        return
+    finally:
+        # Stop the map step if the client went away
+        task.cancel()
+
+    messages = book_summary_messages(request, book_text)
+    async for event in sse_completion(
+        messages, config.MAX_TOKENS_SUMMARY, config.TEMP_SUMMARY,
+        done_data={"book_title": request.title, "coverage": coverage}, send_start=False, usage=usage
+    ):
+        yield event
+
+@app.post("/api/book-summary/stream")
+async def stream_book_summary(request: BookContent):
+    """Stream the book summary as Server-Sent Events while it is generated"""
+    logger.info(f"Streaming book summary request - Language: {request.language}")
+    request = await resolve_book_reference(request)
+    return event_stream_response(book_summary_events(request))
+
+@app.post("/api/chapter-summaries")
+async def generate_chapter_summaries(request: ChapterSummaryRequest):
+    """Generate summaries for individual chapters - using deepseek-chat for faster generation
+
+    Chapters are summarized concurrently (bounded by CHAPTER_SUMMARY_CONCURRENCY)
+    and the results are assembled back in reading order.
+    """
+    # Checked before resolving, which would load and decompress every chapter of the book
+    precomputed = await precomputed_chapter_summary_result(request)
+    if precomputed is not None:
+        return AIResponse(success=True, data=precomputed)
+
+    request = await resolve_book_reference(request)
+    try:
+        return AIResponse(success=True, data=await run_chapter_summaries(request))
+    except Exception as e:
+        logger.error(f"Error generating chapter summaries: {e}")
+        return AIResponse(success=False, error=str(e))
+
+@app.post("/api/chapter-summaries/stream")
+async def stream_chapter_summaries(request: ChapterSummaryRequest):
+    """Stream chapter summaries as Server-Sent Events, each one as soon as it is ready
+
+    The first event carries a job id; if the connection drops, reconnect with
+    GET /api/chapter-summaries/stream/{job_id}?have=0,1,... to receive only the
+    missing chapters.
+    """
+    logger.info(f"Streaming chapter summaries request - Language: {request.language}")
+    if request.book_id and not request.chapter_ids:
+        precomputed = await precomputed_chapter_summaries(request.book_id, request.language)
+        if precomputed is not None:
+            job_id = hashlib.sha256(f"{request.book_id}:{request.language}".encode('utf-8')).hexdigest()[:32]
+            job = ChapterSummaryJob.finished(
+                job_id, precomputed['book_title'], precomputed['chapter_summaries'], request.language
+            )
+            chapter_summary_jobs[job_id] = job  # So a dropped stream can still be resumed
+            return event_stream_response(chapter_summary_job_events(job))
+
+    request = await resolve_book_reference(request)
+    chapters = select_summary_chapters(request.chapters, request._chapter_stats)
+    job = get_or_start_chapter_summary_job(request.book_title, chapters, request.language)
+    return event_stream_response(chapter_summary_job_events(job))
+
+@app.get("/api/chapter-summaries/stream/{job_id}")
+async def resume_chapter_summaries(job_id: str, have: Optional[str] = None):
+    """Resume a chapter summary stream, skipping the chapter indices listed in have"""
+    job = chapter_summary_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Chapter summary job not found")
+    try:
+        received = {int(index) for index in have.split(',') if index.strip()} if have else set()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="have must be a comma-separated list of chapter indices")
+    return event_stream_response(chapter_summary_job_events(job, received))
+
+@app.post("/api/content-analysis")
+async def analyze_content(request: ContentAnalysisRequest):
+    """Perform deep content analysis"""
+    request = await resolve_book_reference(request)
+    try:
+        return AIResponse(success=True, data=await run_content_analysis(request))
+    except Exception as e:
+        logger.error(f"Error analyzing content: {e}")
+        return AIResponse(success=False, error=str(e))
+
+async def retrieve_chat_passages(request: ChatRequest) -> List[Dict]:
+    """Passages of the book in book_context relevant to the latest user message"""
+    book_id = chat_book_id(request)
+    questions = [msg.content for msg in request.messages if msg.role == "user"]
+    if not book_id or not questions:
+        return []
+    try:
+        return await retrieve_passages(book_id, questions[-1])
+    except Exception as e:
+        logger.error(f"Passage retrieval failed for book {book_id}: {e}")
+        return []
+
+@app.post("/api/chat")
+async def chat_with_assistant(request: ChatRequest):
+    """Interactive chat about the book - supports multi-turn conversation"""
+    request = await resolve_book_reference(request)
+    passages = await retrieve_chat_passages(request)
+    messages = build_chat_messages(request, passages)
+    try:
+        usage = track_token_usage()
 
         # Get response from DeepSeek
-        response = call_deepseek_api(messages, config.MAX_TOKENS_CHAT, config.TEMP_CHAT)
+        response = await call_deepseek_api(messages, config.MAX_TOKENS_CHAT, config.TEMP_CHAT, cache=False)
 
         return AIResponse(
             success=True,
             data={
                 "response": response,
+                "sources": passage_sources(passages),
+                "usage": usage,
                 "timestamp": datetime.now().isoformat()
             }
         )
@@ -778,33 +3500,140 @@ async def chat_with_assistant(request: ChatRequest):
         logger.error(f"Error in chat: {e}")
         return AIResponse(success=False, error=str(e))
 
+@app.post("/api/chat/stream")
+async def stream_chat_with_assistant(request: ChatRequest):
+    """Stream the reading assistant's reply as Server-Sent Events"""
+    request = await resolve_book_reference(request)
+    passages = await retrieve_chat_passages(request)
+    messages = build_chat_messages(request, passages)
+    return event_stream_response(sse_completion(
+        messages, config.MAX_TOKENS_CHAT, config.TEMP_CHAT, cache=False,
+        done_data={"sources": passage_sources(passages)}
+    ))
+
 @app.post("/api/ask-question")
-async def ask_single_question(book_title: str, question: str):
-    """Simple endpoint for one-off questions about a book"""
+async def ask_single_question(book_title: str, question: str, book_id: Optional[str] = None):
+    """Simple endpoint for one-off questions about a book
+
+    With book_id, the most relevant passages of the uploaded book are
+    included so the answer is grounded in its text.
+    """
     try:
+        usage = track_token_usage()
+        passages = await retrieve_passages(book_id, question)
         system_prompt = f"""You are an expert on the book "{book_title}".
-        Answer questions accurately based on the book's content, themes, and context."""
+        Answer questions accurately based on the book's content, themes, and context.""" + format_passages(passages, "en")
 
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": question}
         ]
 
-        answer = call_deepseek_api(messages, config.MAX_TOKENS_CHAT, config.TEMP_CHAT)
+        answer = await call_deepseek_api(messages, config.MAX_TOKENS_CHAT, config.TEMP_CHAT, cache=False)
 
         return AIResponse(
             success=True,
             data={
                 "question": question,
                 "answer": answer,
-                "book_title": book_title
+                "book_title": book_title,
+                "sources": passage_sources(passages),
+                "usage": usage
             }
         )
     except Exception as e:
         logger.error(f"Error answering question: {e}")
         return AIResponse(success=False, error=str(e))
 
+# ===================================
+# Background Job Endpoints
+# ===================================
+
+@app.post("/api/jobs")
+async def submit_job(request: JobRequest):
+    """Queue a long-running AI task and return its job id immediately
+
+    Poll GET /api/jobs/{job_id} for status and result.
+    """
+    if request.kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {request.kind}. Expected one of {sorted(JOB_KINDS)}")
+
+    request_model, _ = JOB_KINDS[request.kind]
+    try:
+        task_request = request_model(**request.payload)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    task_request = await resolve_book_reference(task_request)
+
+    job = job_queue.submit(request.kind, task_request, request.priority)
+    return AIResponse(success=True, data={"job_id": job.id, "status": job.status})
+
+@app.post("/api/batch-ingest")
+async def submit_batch_ingest(request: BatchIngestRequest, priority: int = 9):
+    """Queue a batch ingest of EPUBs under BATCH_INPUT_DIR and return its job id
+
+    Results are written per book under BATCH_OUTPUT_DIR; poll
+    GET /api/jobs/{job_id} for the final report. Resubmitting the same batch
+    only runs the operations that have no saved result yet.
+    """
+    # Reject bad paths and operations now rather than when the job starts
+    files = await run_in_threadpool(batch_input_files, request.paths, config.BATCH_INPUT_DIR)
+    batch_operations(request.operations)
+    job = job_queue.submit("batch_ingest", request, priority)
+    return AIResponse(success=True, data={"job_id": job.id, "status": job.status, "books": len(files)})
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job's status, and its result once completed"""
+    job_data = await run_in_threadpool(job_queue.get, job_id)
+    if job_data is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AIResponse(success=True, data=job_data)
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job_data = await job_queue.cancel(job_id)
+    if job_data is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AIResponse(success=True, data=job_data)
+
+async def run_batch_cli(args) -> dict:
+    """Run a batch ingest from the command line and release shared resources afterwards"""
+    request = BatchIngestRequest(
+        paths=args.paths,
+        operations=args.operations.split(',') if args.operations else None,
+        language=args.language
+    )
+    try:
+        return await run_batch_ingest(request, output_dir=args.output, concurrency=args.concurrency)
+    finally:
+        await deepseek_client.close()
+        epub_parse_pool.shutdown()
+
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Echo Reader Unified Backend")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run the API server (default)")
+    ingest_parser = commands.add_parser("ingest", help="Parse EPUBs and generate their AI summaries and analyses in batch")
+    ingest_parser.add_argument("paths", nargs="+", help="EPUB files or directories (searched recursively)")
+    ingest_parser.add_argument("--output", default=config.BATCH_OUTPUT_DIR, help="Results directory, also used to resume")
+    ingest_parser.add_argument("--operations", help=f"Comma-separated subset of {','.join(BATCH_OPERATIONS)}")
+    ingest_parser.add_argument("--language", default="en", choices=["en", "zh"])
+    ingest_parser.add_argument("--concurrency", type=int, default=config.BATCH_BOOK_CONCURRENCY, help="Books processed at once")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        try:
+            report = asyncio.run(run_batch_cli(args))
+        except HTTPException as e:
+            parser.error(e.detail)
+        report_path = os.path.join(args.output, f"report-{datetime.now():%Y%m%d-%H%M%S}.json")
+        write_json_atomic(report_path, report)
+        print(f"{report['total'] - report['failed']}/{report['total']} books ingested in {report['seconds']}s, report: {report_path}")
+        raise SystemExit(1 if report['failed'] else 0)
+
     import uvicorn
     logger.info("Starting Echo Reader Unified Backend...")
     logger.info(f"EPUB Processing: Enabled")
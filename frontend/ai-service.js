@@ -83,12 +83,7 @@ const AIService = {
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
-                    title: this.currentBookData.title,
-                    author: this.currentBookData.author,
-                    full_text: this.currentBookData.full_text,
-                    language: language
-                })
+                body: JSON.stringify(this.buildBookSummaryPayload(language))
             });
 
             const result = await response.json();
@@ -108,11 +103,39 @@ const AIService = {
         }
     },
 
+    /**
+     * Stream book summary, calling onToken with each piece of text as it arrives
+     * Resolves to the full summary text
+     */
+    async streamBookSummary(language = 'en', onToken = () => {}) {
+        if (!this.currentBookData) {
+            this.showError('Please load a book first');
+            return null;
+        }
+
+        try {
+            const response = await fetch(`${this.BACKEND_URL}/api/book-summary/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(this.buildBookSummaryPayload(language))
+            });
+
+            return await this.readCompletionStream(response, onToken);
+        } catch (error) {
+            console.error('Error streaming book summary:', error);
+            this.showError(language === 'zh' ? '生成书籍摘要失败' : 'Failed to generate book summary');
+            return null;
+        }
+    },
+
     /**
      * Generate chapter summaries with language support
      */
     async generateChapterSummaries(language = 'en') {
-        if (!this.currentBookData || !this.currentBookData.chapters) {
+        const bookId = this.getBookId();
+        if (!this.currentBookData || (!bookId && !this.currentBookData.chapters)) {
             this.showError(language === 'zh' ? '没有可用的章节' : 'No chapters available');
             return null;
         }
@@ -120,18 +143,12 @@ const AIService = {
         try {
             this.showLoading(language === 'zh' ? '正在生成章节摘要...' : 'Generating chapter summaries...');
 
-            console.log('Sending chapter summaries request with chapters:', this.currentBookData.chapters.length);
-
             const response = await fetch(`${this.BACKEND_URL}/api/chapter-summaries`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
-                    book_title: this.currentBookData.title,
-                    chapters: this.currentBookData.chapters,
-                    language: language
-                })
+                body: JSON.stringify(this.buildChapterSummaryPayload(language))
             });
 
             const result = await response.json();
@@ -158,6 +175,75 @@ const AIService = {
         }
     },
 
+    /**
+     * Stream chapter summaries, calling onChapter(index, summary, titles) as each chapter completes
+     * Reconnects with the job id if the stream drops, fetching only missing chapters
+     * Resolves to the summaries in reading order
+     */
+    async streamChapterSummaries(language = 'en', onChapter = () => {}, maxReconnects = 3) {
+        const bookId = this.getBookId();
+        if (!this.currentBookData || (!bookId && !this.currentBookData.chapters)) {
+            this.showError(language === 'zh' ? '没有可用的章节' : 'No chapters available');
+            return null;
+        }
+
+        let jobId = null;
+        let titles = [];
+        const summaries = {};
+        let finished = false;
+
+        const handleEvent = event => {
+            if (event.type === 'job') {
+                jobId = event.job_id;
+                titles = event.chapter_titles;
+            } else if (event.type === 'chapter') {
+                summaries[event.index] = {
+                    title: event.chapter_title,
+                    summary: event.summary,
+                    failed: event.failed
+                };
+                onChapter(event.index, summaries[event.index], titles);
+            } else if (event.type === 'done') {
+                finished = true;
+            }
+        };
+
+        for (let attempt = 0; attempt <= maxReconnects && !finished; attempt++) {
+            try {
+                let response;
+                if (!jobId) {
+                    response = await fetch(`${this.BACKEND_URL}/api/chapter-summaries/stream`, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json'
+                        },
+                        body: JSON.stringify(this.buildChapterSummaryPayload(language))
+                    });
+                } else {
+                    // Resume the running job, skipping chapters already received
+                    const have = Object.keys(summaries).join(',');
+                    response = await fetch(`${this.BACKEND_URL}/api/chapter-summaries/stream/${jobId}?have=${have}`);
+                }
+
+                await this.readEventStream(response, handleEvent);
+            } catch (error) {
+                console.warn(`Chapter summary stream interrupted (attempt ${attempt + 1}):`, error);
+            }
+        }
+
+        if (!finished) {
+            this.showError(language === 'zh' ? '生成章节摘要失败' : 'Failed to generate chapter summaries');
+        }
+
+        // Failed chapters are left out, as with the non-streaming endpoint
+        return Object.keys(summaries)
+            .map(Number)
+            .sort((a, b) => a - b)
+            .map(index => summaries[index])
+            .filter(s => !s.failed)
+            .map(s => ({ title: s.title, summary: s.summary }));
+    },
+
     /**
      * Analyze content with language support
      */
@@ -170,6 +256,9 @@ const AIService = {
         try {
             this.showLoading(language === 'zh' ? `正在进行${analysisType}分析...` : `Performing ${analysisType} analysis...`);
 
+            // Backend books are analyzed by id; only local books send their text
+            const bookId = this.getBookId();
+
             const response = await fetch(`${this.BACKEND_URL}/api/content-analysis`, {
                 method: 'POST',
                 headers: {
@@ -177,7 +266,8 @@ const AIService = {
                 },
                 body: JSON.stringify({
                     book_title: this.currentBookData.title,
-                    content: this.currentBookData.full_text,
+                    book_id: bookId,
+                    content: bookId ? null : this.currentBookData.full_text,
                     analysis_type: analysisType,
                     language: language
                 })
@@ -205,36 +295,12 @@ const AIService = {
      */
     async sendChatMessage(message, chatHistory = [], language = 'en') {
         try {
-            // Prepare conversation history
-            const messages = chatHistory.slice(0, -1).map(msg => ({
-                role: msg.role,
-                content: msg.content
-            }));
-
-            // Add the new user message
-            messages.push({
-                role: 'user',
-                content: message
-            });
-
-            // Include book context if available
-            const bookContext = this.currentBookData ? {
-                title: this.currentBookData.title,
-                author: this.currentBookData.author,
-                current_chapter: this.getCurrentChapterTitle(),
-                language: language
-            } : null;
-
             const response = await fetch(`${this.BACKEND_URL}/api/chat`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
-                    messages: messages,
-                    book_context: bookContext,
-                    language: language
-                })
+                body: JSON.stringify(this.buildChatPayload(message, chatHistory, language))
             });
 
             const result = await response.json();
@@ -251,6 +317,180 @@ const AIService = {
         }
     },
 
+    /**
+     * Stream a Reading Assistant reply, calling onToken with each piece of text as it arrives
+     * Resolves to the full reply text
+     */
+    async streamChatMessage(message, chatHistory = [], language = 'en', onToken = () => {}) {
+        try {
+            const response = await fetch(`${this.BACKEND_URL}/api/chat/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(this.buildChatPayload(message, chatHistory, language))
+            });
+
+            return await this.readCompletionStream(response, onToken);
+        } catch (error) {
+            console.error('Error in streaming chat:', error);
+            this.showError(language === 'zh' ? '读书助手响应失败' : 'Failed to get response from Reading Assistant');
+            return null;
+        }
+    },
+
+    /**
+     * Id of the current book on the backend, used to retrieve passages for questions
+     * Books opened from plain text files have none
+     */
+    getBookId() {
+        const book = this.currentBookData;
+        return book ? (book.bookId || book.book_id || null) : null;
+    },
+
+    /**
+     * Build the request body for book summary endpoints
+     * Backend books are referenced by id; otherwise the whole book is sent chapter by chapter,
+     * and plain-text books without chapters send their full text
+     */
+    buildBookSummaryPayload(language) {
+        const book = this.currentBookData;
+        const bookId = this.getBookId();
+        if (bookId) {
+            return {
+                book_id: bookId,
+                title: book.title,
+                author: book.author,
+                language: language
+            };
+        }
+
+        const hasChapters = Array.isArray(book.chapters) && book.chapters.length > 0;
+        return {
+            title: book.title,
+            author: book.author,
+            full_text: hasChapters ? null : book.full_text,
+            chapters: hasChapters ? book.chapters : null,
+            language: language
+        };
+    },
+
+    /**
+     * Build the request body for chapter summary endpoints
+     * Backend books are referenced by id and the server reads their chapters
+     */
+    buildChapterSummaryPayload(language) {
+        const book = this.currentBookData;
+        const bookId = this.getBookId();
+        return bookId ? {
+            book_id: bookId,
+            book_title: book.title,
+            language: language
+        } : {
+            book_title: book.title,
+            chapters: book.chapters,
+            language: language
+        };
+    },
+
+    /**
+     * Build the request body for chat endpoints
+     */
+    buildChatPayload(message, chatHistory, language) {
+        // Prepare conversation history
+        const messages = chatHistory.slice(0, -1).map(msg => ({
+            role: msg.role,
+            content: msg.content
+        }));
+
+        // Add the new user message
+        messages.push({
+            role: 'user',
+            content: message
+        });
+
+        // Include book context if available
+        const bookContext = this.currentBookData ? {
+            title: this.currentBookData.title,
+            author: this.currentBookData.author,
+            current_chapter: this.getCurrentChapterTitle(),
+            language: language
+        } : null;
+
+        // Lets the backend retrieve relevant passages from the uploaded book
+        if (bookContext && this.getBookId()) {
+            bookContext.book_id = this.getBookId();
+        }
+
+        return {
+            messages: messages,
+            book_context: bookContext,
+            language: language
+        };
+    },
+
+    /**
+     * Read a Server-Sent Events response, calling onEvent for each JSON event
+     */
+    async readEventStream(response, onEvent) {
+        if (!response.ok || !response.body) {
+            throw new Error(`Stream request failed with status ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                const data = rawEvent
+                    .split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim())
+                    .join('\n');
+
+                // Comment-only events are keep-alives
+                if (data) {
+                    onEvent(JSON.parse(data));
+                }
+            }
+        }
+    },
+
+    /**
+     * Read a streamed completion, forwarding tokens and resolving to the full text
+     */
+    async readCompletionStream(response, onToken) {
+        let text = '';
+        let error = null;
+
+        await this.readEventStream(response, event => {
+            if (event.type === 'token') {
+                text += event.content;
+                onToken(event.content, text);
+            } else if (event.type === 'done') {
+                text = event.content;
+            } else if (event.type === 'error') {
+                error = event.error;
+            }
+        });
+
+        if (error) {
+            throw new Error(error);
+        }
+        return text;
+    },
+
     /**
      * Ask a single question (without conversation history)
      */
@@ -265,6 +505,10 @@ const AIService = {
                 book_title: this.currentBookData.title,
                 question: question
             });
+            const bookId = this.getBookId();
+            if (bookId) {
+                params.set('book_id', bookId);
+            }
 
             const response = await fetch(`${this.BACKEND_URL}/api/ask-question?${params}`, {
                 method: 'POST'
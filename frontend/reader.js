@@ -345,6 +345,9 @@ function changeFrostedGlassIntensity() {
 }
 
 // File Upload and Processing
+// Backend URL - change this to your backend URL
+const BACKEND_API_URL = 'http://localhost:8000';
+
 let currentBook = null;
 let currentPage = 0;
 let totalPages = 0;
@@ -640,11 +643,8 @@ async function processEpubViaBackend(file) {
         const formData = new FormData();
         formData.append('file', file);
 
-        // API endpoint - change this to your backend URL
-        const API_URL = 'http://localhost:8000';
-
-        // Upload to backend
-        const response = await fetch(`${API_URL}/upload-epub`, {
+        // Upload to backend - only the manifest comes back, chapters are loaded on demand
+        const response = await fetch(`${BACKEND_API_URL}/upload-epub?lazy=true`, {
             method: 'POST',
             body: formData
         });
@@ -737,24 +737,23 @@ function displayEpubFromBackend(bookData, fileName) {
     document.getElementById('bookTitle').textContent = bookData.metadata.title || fileName.replace(/\.[^/.]+$/, "");
     document.getElementById('bookAuthor').textContent = bookData.metadata.author || 'Unknown Author';
 
-    // Store current book data
+    // Store current book data (bookData is the manifest; chapter content is fetched lazily)
     currentBook = {
         type: 'epub-backend',
         id: bookData.id,
         data: bookData,
+        chapterCache: {},
         currentChapterIndex: 0
     };
 
-    // Update AI Service with the book data
+    // Update AI Service with the book data - AI requests reference the book by id, so its text is never downloaded
     if (window.AIService) {
         window.AIService.currentBookData = {
+            bookId: bookData.id,
             title: bookData.metadata.title || fileName,
             author: bookData.metadata.author || 'Unknown Author',
-            full_text: bookData.full_text || '',
-            chapters: bookData.chapters ? bookData.chapters.map(ch => ({
-                title: ch.title,
-                content: ch.text || ch.content
-            })) : []
+            full_text: null,
+            chapters: null
         };
     }
 
@@ -771,14 +770,28 @@ function displayEpubFromBackend(bookData, fileName) {
     document.getElementById('readingProgress').textContent = '0%';
 }
 
-function displayEpubChapter(chapterIndex) {
+async function displayEpubChapter(chapterIndex) {
     if (!currentBook || currentBook.type !== 'epub-backend') return;
 
     const chapters = currentBook.data.chapters;
     if (chapterIndex < 0 || chapterIndex >= chapters.length) return;
 
-    const chapter = chapters[chapterIndex];
-    currentBook.currentChapterIndex = chapterIndex;
+    const book = currentBook;
+    book.currentChapterIndex = chapterIndex;
+
+    let chapter;
+    try {
+        chapter = await loadEpubChapter(chapterIndex);
+    } catch (error) {
+        console.error('Error loading chapter:', error);
+        alert(currentLanguage === 'en'
+            ? `Error loading chapter: ${error.message}`
+            : `加载章节时出错: ${error.message}`);
+        return;
+    }
+
+    // The reader may have moved to another chapter or book while this one was loading
+    if (currentBook !== book || book.currentChapterIndex !== chapterIndex) return;
 
     // Display chapter content
     const bookContent = document.getElementById('bookContent');
@@ -795,6 +808,30 @@ function displayEpubChapter(chapterIndex) {
 
     // Scroll to top
     window.scrollTo({ top: 0, behavior: 'smooth' });
+
+    // Prefetch the next chapter so turning the page is instant
+    if (chapterIndex + 1 < chapters.length) {
+        loadEpubChapter(chapterIndex + 1).catch(error => console.warn('Chapter prefetch failed:', error));
+    }
+}
+
+function loadEpubChapter(chapterIndex) {
+    // Cache the request promise so a prefetch and a display of the same chapter share one fetch
+    const cache = currentBook.chapterCache;
+    if (!cache[chapterIndex]) {
+        cache[chapterIndex] = fetch(`${BACKEND_API_URL}/book/${currentBook.id}/chapter/${chapterIndex}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Failed to load chapter ${chapterIndex + 1}`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                delete cache[chapterIndex];
+                throw error;
+            });
+    }
+    return cache[chapterIndex];
 }
 
 function generateEpubTOCFromBackend(toc, chapters) {
@@ -1498,8 +1535,10 @@ async function executeBookSummary() {
             return;
         }
 
-        // Use actual AI service with language parameter
-        const summaryText = await window.AIService.generateBookSummary(currentLanguage);
+        // Use actual AI service with language parameter, rendering the summary as it streams in
+        const summaryText = await window.AIService.streamBookSummary(currentLanguage, (token, partialText) => {
+            displayBookSummary({ overview: partialText });
+        });
 
         if (summaryText) {
             const summary = {
@@ -1620,40 +1659,51 @@ async function executeChapterSummaries() {
     try {
         // Use the chapters already parsed and displayed in ToC
         if (currentBook && currentBook.data && currentBook.data.chapters) {
-            // The ToC has already identified all chapters - use that data directly
-            const tocChapters = currentBook.data.chapters;
-
-            // Filter out non-chapter entries based on ToC structure
-            // ToC typically excludes title pages, prefaces, etc.
-            const validChapters = tocChapters.filter(ch => {
-                // Only process chapters that have meaningful content
-                const hasContent = ch.text || ch.content;
-                const hasTitle = ch.title && ch.title.trim();
-                return hasTitle && hasContent && hasContent.length > 50;
-            });
+            // Backend books are summarized by id: the server reads and filters their chapters itself
+            const bookId = window.AIService ? window.AIService.getBookId() : null;
+            if (!bookId) {
+                // The ToC has already identified all chapters - use their text
+                const tocChapters = currentBook.data.chapters;
+
+                // Filter out non-chapter entries based on ToC structure
+                // ToC typically excludes title pages, prefaces, etc.
+                const validChapters = tocChapters.filter(ch => {
+                    // Only process chapters that have meaningful content
+                    const hasContent = ch.text || ch.content;
+                    const hasTitle = ch.title && ch.title.trim();
+                    return hasTitle && hasContent && hasContent.length > 50;
+                });
 
-            if (validChapters.length === 0) {
-                container.innerHTML = `
-                    <div class="alert alert-warning">
-                        <i class="bi bi-info-circle me-2"></i>
-                        ${currentLanguage === 'en'
-                            ? 'No chapters found with sufficient content for summarization.'
-                            : '没有找到包含足够内容的章节进行摘要。'}
-                    </div>
-                `;
-                return;
-            }
+                if (validChapters.length === 0) {
+                    container.innerHTML = `
+                        <div class="alert alert-warning">
+                            <i class="bi bi-info-circle me-2"></i>
+                            ${currentLanguage === 'en'
+                                ? 'No chapters found with sufficient content for summarization.'
+                                : '没有找到包含足够内容的章节进行摘要。'}
+                        </div>
+                    `;
+                    return;
+                }
 
-            // Update AIService with the filtered chapters
-            if (window.AIService) {
-                window.AIService.currentBookData.chapters = validChapters.map(ch => ({
-                    title: ch.title,
-                    content: ch.text || ch.content
-                }));
+                // Update AIService with the filtered chapters
+                if (window.AIService) {
+                    window.AIService.currentBookData.chapters = validChapters.map(ch => ({
+                        title: ch.title,
+                        content: ch.text || ch.content
+                    }));
+                }
             }
 
-            // Generate summaries using the AI service
-            const summaries = await window.AIService.generateChapterSummaries(currentLanguage);
+            // Stream summaries from the AI service, showing each chapter as soon as it is ready
+            let partialSummaries = [];
+            const summaries = await window.AIService.streamChapterSummaries(currentLanguage, (index, chapterSummary, titles) => {
+                if (partialSummaries.length === 0) {
+                    partialSummaries = titles.map(title => ({ title: title, summary: '' }));
+                }
+                partialSummaries[index] = chapterSummary;
+                displayChapterSummaries(partialSummaries);
+            });
             console.log('Received summaries from AI service:', summaries);
 
             if (summaries && summaries.length > 0) {
@@ -2143,8 +2193,13 @@ async function sendChatMessage() {
     try {
         // Check if AIService is available
         if (typeof window.AIService !== 'undefined' && window.AIService.currentBookData) {
-            // Pass language parameter for chat
-            const response = await window.AIService.sendChatMessage(message, aiCache.chatHistory, currentLanguage);
+            // Pass language parameter for chat, streaming the reply into the typing bubble
+            const bubble = typingIndicator.querySelector('.message-bubble');
+            const response = await window.AIService.streamChatMessage(message, aiCache.chatHistory, currentLanguage, (token, partialText) => {
+                bubble.style.whiteSpace = 'pre-wrap';
+                bubble.textContent = partialText;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            });
 
             if (response) {
                 aiCache.chatHistory.push({